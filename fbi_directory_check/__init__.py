@@ -9,10 +9,80 @@ __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 # Logger setup
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
-logging.basicConfig(level=logging.DEBUG)
-logstream = logging.StreamHandler()
+# Level below DEBUG for messages about every file
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+
+class LogStream(QueueHandler):
+    """
+    Stream handler used by the package loggers. Records are written in the
+    caller until ``start`` is called, then queued and written by a
+    QueueListener thread so that logging from the hot paths does not wait
+    on the stream. Queued records keep their attributes, including any
+    passed with ``extra``, and only have their message merged.
+
+    :param stream: Stream to write to, stderr by default
+    """
+
+    def __init__(self, stream=None) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.handler = logging.StreamHandler(stream)
+        self.listener = None
+
+    def setFormatter(self, fmt: logging.Formatter) -> None:
+        # Records are formatted when they are written
+        self.handler.setFormatter(fmt)
+
+    def start(self) -> None:
+        """
+        Write records from a background thread. Queued records are written
+        when the interpreter exits.
+        """
+        if self.listener is None:
+            self.listener = QueueListener(self.queue, self.handler)
+            self.listener.start()
+            atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """
+        Write the queued records and go back to writing in the caller
+        """
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+            atexit.unregister(self.stop)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.listener is None:
+            self.handler.handle(record)
+        else:
+            super().emit(record)
+
+
+logstream = LogStream()
 
 formatter = logging.Formatter('%(levelname)s [%(name)s]: %(message)s')
-logstream.setFormatter(formatter)
\ No newline at end of file
+logstream.setFormatter(formatter)
+
+
+def configure_logging(level: int = logging.DEBUG, background: bool = True) -> None:
+    """
+    Set the root logger level. Called by the command line entry points
+    rather than on import so importing the package has no side effects.
+
+    :param level: Root logger level
+    :param background: Write log records from a background thread
+    """
+    handler = LogStream()
+    logging.basicConfig(level=level, handlers=[handler])
+
+    if background:
+        logstream.start()
+        if handler in logging.root.handlers:
+            handler.start()
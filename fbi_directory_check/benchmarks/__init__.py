@@ -0,0 +1,9 @@
+# encoding: utf-8
+"""
+Filesystem benchmarks run against synthetic archive trees.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
@@ -0,0 +1,126 @@
+# encoding: utf-8
+"""
+Generate synthetic archive trees laid out like the CEDA archive. Dataset
+directories sit under the archive root, some of them as symlinks to storage
+under a separate ``datacentre`` root, and loop links in the archive root
+point back to it so the walkers can be checked for not following them.
+
+Loops are kept out of the datasets as the recursive glob used by scan level
+1 follows them until the path is too long to resolve.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import json
+import os
+from dataclasses import asdict, dataclass
+
+
+@dataclass
+class ArchiveSpec:
+    """
+    Shape of a synthetic archive
+
+    :param datasets: Number of dataset directories under the archive root
+    :param depth: Levels of directories below each dataset
+    :param fanout: Subdirectories in each directory above the bottom level
+    :param files: Files in each directory
+    :param storage_links: Number of datasets held in storage and linked
+        into the archive
+    :param loops: Number of links in the archive root pointing back to it
+    :param extension: Extension given to the files
+    """
+    datasets: int = 4
+    depth: int = 3
+    fanout: int = 4
+    files: int = 20
+    storage_links: int = 2
+    loops: int = 1
+    extension: str = 'nc'
+
+    @property
+    def directories(self) -> int:
+        """Directories in each dataset, including the dataset itself"""
+        return sum(self.fanout ** level for level in range(self.depth + 1))
+
+    @property
+    def total_files(self) -> int:
+        return self.datasets * self.directories * self.files
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class Archive:
+    """
+    Paths of a generated archive
+
+    :param root: Archive directory to scan
+    :param storage: Storage directory the storage links point to
+    :param json_dir: Directory of dataset JSON files for scan level 1
+    :param spec: Shape of the archive
+    """
+    root: str
+    storage: str
+    json_dir: str
+    spec: ArchiveSpec
+
+
+def _fill(path: str, spec: ArchiveSpec, level: int) -> None:
+    os.makedirs(path, exist_ok=True)
+
+    for i in range(spec.files):
+        with open(os.path.join(path, f'file_{i:04d}.{spec.extension}'), 'w'):
+            pass
+
+    if level < spec.depth:
+        for i in range(spec.fanout):
+            _fill(os.path.join(path, f'dir_{i:03d}'), spec, level + 1)
+
+
+def generate_archive(base: str, spec: ArchiveSpec) -> Archive:
+    """
+    Write a synthetic archive under base. The layout only depends on the
+    spec so the same spec always gives the same tree.
+
+    :param base: Empty directory to build the archive in
+    :param spec: Shape of the archive
+    :return: Archive
+    """
+    base = os.path.abspath(base)
+    archive = Archive(
+        root=os.path.join(base, 'archive'),
+        storage=os.path.join(base, 'datacentre'),
+        json_dir=os.path.join(base, 'json'),
+        spec=spec
+    )
+
+    for path in (archive.root, archive.storage, archive.json_dir):
+        os.makedirs(path, exist_ok=True)
+
+    datasets = []
+
+    for i in range(spec.datasets):
+        name = f'dataset_{i:03d}'
+        path = os.path.join(archive.root, name)
+
+        if i < spec.storage_links:
+            target = os.path.join(archive.storage, name)
+            _fill(target, spec, 0)
+            os.symlink(target, path)
+        else:
+            _fill(path, spec, 0)
+
+        datasets.append(path)
+
+    for j in range(spec.loops):
+        os.symlink(archive.root, os.path.join(archive.root, f'loop_{j:02d}'))
+
+    with open(os.path.join(archive.json_dir, 'datasets.json'), 'w') as f:
+        json.dump({'datasets': datasets}, f)
+
+    return archive
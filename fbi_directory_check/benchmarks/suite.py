@@ -0,0 +1,272 @@
+# encoding: utf-8
+"""
+Benchmark the filesystem walkers against a synthetic archive.
+
+Each benchmark is timed over several runs with a warm cache and then run
+once more to count filesystem calls and once under tracemalloc for the peak
+memory. Calls are counted at the Python level by wrapping the ``os``
+functions the walkers use, so stats made inside ``DirEntry`` are not
+included. Results are written as JSON which can be passed back with
+``--compare`` to show the change between two runs.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from fbi_directory_check import configure_logging
+from fbi_directory_check.benchmarks.archive import (Archive, ArchiveSpec,
+                                                    generate_archive)
+from fbi_directory_check.scripts.rescan_directory import RescanDirs
+from fbi_directory_check.utils import walk_storage_links
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 count_fs_calls, profiling)
+
+# Version of the results format
+RESULTS_VERSION = 1
+
+# Metrics shown by --compare and whether a higher value is better
+COMPARED = (
+    ('files_per_second', True),
+    ('fs_calls', False),
+    ('peak_memory_bytes', False),
+)
+
+
+def walk(archive: Archive) -> int:
+    """
+    :return: Number of files found by walk_storage_links
+    """
+    return sum(
+        len(files) for _, _, files in walk_storage_links(archive.root, storage_prefix=archive.storage)
+    )
+
+
+def rescan_level_1(archive: Archive) -> int:
+    """
+    :return: Number of files found by RescanDirs from the dataset JSON files
+    """
+    rd = RescanDirs(archive.json_dir, scan_level=1, extension=archive.spec.extension)
+    return len(rd._determine_paths())
+
+
+def rescan_level_2(archive: Archive) -> int:
+    """
+    :return: Number of files found by RescanDirs walking the archive
+    """
+    rd = RescanDirs(archive.root, scan_level=2, recursive=True, extension=archive.spec.extension,
+                    storage_prefix=archive.storage)
+    return len(rd._determine_paths())
+
+
+BENCHMARKS: Dict[str, Callable[[Archive], int]] = {
+    'walk_storage_links': walk,
+    'rescan_level_1': rescan_level_1,
+    'rescan_level_2': rescan_level_2,
+}
+
+
+def run_benchmark(name: str, func: Callable[[Archive], int], archive: Archive, repeat: int = 5) -> dict:
+    """
+    Time, count the filesystem calls and measure the peak memory of one benchmark
+
+    :param name: Benchmark name
+    :param func: Function returning the number of files found
+    :param archive: Archive to run against
+    :param repeat: Number of timed runs
+    :return: dict of results
+    """
+    # Warm the cache
+    files = func(archive)
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(archive)
+        times.append(time.perf_counter() - start)
+
+    with count_fs_calls() as calls:
+        func(archive)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(archive)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(times)
+
+    return {
+        'benchmark': name,
+        'files': files,
+        'expected_files': archive.spec.total_files,
+        'seconds_min': round(best, 6),
+        'seconds_median': round(statistics.median(times), 6),
+        'files_per_second': round(files / best, 1) if best else None,
+        'fs_calls': sum(calls.values()),
+        'fs_calls_by_function': dict(calls),
+        'peak_memory_bytes': peak,
+    }
+
+
+def run_suite(spec: ArchiveSpec, base: str, repeat: int = 5, names: List[str] = None) -> dict:
+    """
+    Generate an archive and run the benchmarks against it
+
+    :param spec: Shape of the archive
+    :param base: Empty directory to build the archive in
+    :param repeat: Number of timed runs of each benchmark
+    :param names: Benchmarks to run. Defaults to all
+    :return: dict of results and the environment they were taken in
+    """
+    start = time.perf_counter()
+    archive = generate_archive(base, spec)
+    generate_seconds = time.perf_counter() - start
+
+    try:
+        from importlib.metadata import version
+        package_version = version('fbi-directory-check')
+    except Exception:
+        package_version = 'unknown'
+
+    return {
+        'results_version': RESULTS_VERSION,
+        'package_version': package_version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'spec': spec.as_dict(),
+        'generate_seconds': round(generate_seconds, 3),
+        'repeat': repeat,
+        'results': [
+            run_benchmark(name, BENCHMARKS[name], archive, repeat=repeat)
+            for name in names or BENCHMARKS
+        ],
+    }
+
+
+def compare(baseline: dict, current: dict) -> List[str]:
+    """
+    :param baseline: Results from an earlier run
+    :param current: Results from this run
+    :return: Lines of a table showing the change in each metric
+    """
+    lines = []
+
+    if baseline.get('spec') != current.get('spec'):
+        lines.append('WARNING: the archive specs differ so the results are not directly comparable')
+
+    lines.append(f'{"benchmark":<22} {"metric":<18} {"baseline":>14} {"current":>14} {"change":>9}')
+
+    previous = {result['benchmark']: result for result in baseline.get('results', [])}
+
+    for result in current['results']:
+        old = previous.get(result['benchmark'])
+        if not old:
+            continue
+
+        for metric, higher_is_better in COMPARED:
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+
+            change = (after - before) / before
+            worse = change < 0 if higher_is_better else change > 0
+            flag = ' !' if worse and abs(change) > 0.1 else ''
+
+            lines.append(
+                f'{result["benchmark"]:<22} {metric:<18} {before:>14,.0f} {after:>14,.0f} {change:>+8.1%}{flag}'
+            )
+
+    return lines
+
+
+def get_args():
+    defaults = ArchiveSpec()
+
+    parser = argparse.ArgumentParser(description='Benchmark the filesystem walkers against a synthetic archive.')
+
+    parser.add_argument('--datasets', type=int, default=defaults.datasets, help='Dataset directories in the archive')
+    parser.add_argument('--depth', type=int, default=defaults.depth, help='Directory levels in each dataset')
+    parser.add_argument('--fanout', type=int, default=defaults.fanout, help='Subdirectories in each directory')
+    parser.add_argument('--files', type=int, default=defaults.files, help='Files in each directory')
+    parser.add_argument('--storage-links', type=int, default=defaults.storage_links,
+                        help='Datasets held in storage and linked into the archive')
+    parser.add_argument('--loops', type=int, default=defaults.loops,
+                        help='Links in the archive root pointing back to it')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs of each benchmark')
+    parser.add_argument('--benchmark', choices=list(BENCHMARKS), action='append',
+                        help='Benchmark to run. Can be given more than once. Defaults to all')
+    parser.add_argument('--base', help='Directory to build the archive in. Defaults to a temporary directory')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated archive')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results from an earlier run to compare against')
+    add_profile_argument(parser)
+
+    return parser.parse_args()
+
+
+def main():
+
+    configure_logging()
+
+    args = get_args()
+
+    spec = ArchiveSpec(
+        datasets=args.datasets,
+        depth=args.depth,
+        fanout=args.fanout,
+        files=args.files,
+        storage_links=args.storage_links,
+        loops=args.loops
+    )
+
+    base = args.base or tempfile.mkdtemp(prefix='fbi_benchmark_')
+    os.makedirs(base, exist_ok=True)
+
+    try:
+        with profiling(args.profile):
+            report = run_suite(spec, base, repeat=args.repeat, names=args.benchmark)
+    finally:
+        if not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+    print(f'{spec.total_files} files in {spec.datasets * spec.directories} directories '
+          f'(generated in {report["generate_seconds"]}s)')
+
+    for result in report['results']:
+        check = '' if result['files'] == result['expected_files'] else f' (expected {result["expected_files"]})'
+        print(f'{result["benchmark"]:<22} {result["files"]:>9} files{check} '
+              f'{result["files_per_second"]:>12,.0f} files/s {result["fs_calls"]:>9} fs calls '
+              f'{result["peak_memory_bytes"] / 2 ** 20:>8.1f} MB peak')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        print('\n'.join(compare(baseline, report)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+# encoding: utf-8
+"""
+Asyncio version of the consistency checker. Directories move through a
+pipeline of listing, index fetch and publish stages connected by bounded
+queues, so the listing of one directory overlaps with the index queries
+for the one before it and the publishing of the one before that.
+
+Blocking filesystem, Elasticsearch and SQLite work runs in worker threads.
+Only the pika publishes run on the event loop as the channel is not
+thread safe, and workers wait for their messages to be published.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from os.path import normpath
+from typing import Optional
+
+import aiofiles.os
+import persistqueue
+import pika
+
+from fbi_directory_check import configure_logging
+from fbi_directory_check.scripts.consistency_checker import \
+    ElasticsearchConsistencyChecker
+from fbi_directory_check.utils.digests import listing_digest
+from fbi_directory_check.utils.elastic import project
+from fbi_directory_check.utils.metrics import metrics
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 profiling)
+from fbi_directory_check.utils.queues import is_busy_error
+
+logger = logging.getLogger()
+
+
+@dataclass
+class Listing:
+    """State of one directory as it moves through the pipeline"""
+    queue: str
+    item: str
+    listing: list = field(default_factory=list)
+    files: set = field(default_factory=set)
+    dirs: set = field(default_factory=set)
+    digest: Optional[str] = None
+    skip: bool = False
+    large: bool = False
+    indexed_files: set = field(default_factory=set)
+    indexed_dirs: set = field(default_factory=set)
+
+
+class AsyncConsistencyChecker(ElasticsearchConsistencyChecker):
+
+    def __init__(self):
+        super().__init__()
+        self.concurrency = self.conf.getint('async', 'concurrency', fallback=8)
+        self.async_es = None
+        self._loop = None
+        self._loop_thread = None
+
+    def _async_es_connect(self):
+        """
+        Create the async Elasticsearch client from the elasticsearch config section.
+        Requires the aiohttp package.
+        """
+        from elasticsearch import AsyncElasticsearch
+
+        kwargs = {'timeout': 60, 'retry_on_timeout': True}
+
+        user = self.conf.get('elasticsearch', 'es-user', fallback='')
+        if user:
+            kwargs['http_auth'] = (user, self.conf.get('elasticsearch', 'es-password', fallback=''))
+
+        return AsyncElasticsearch([self.conf.get('elasticsearch', 'es-host')], **kwargs)
+
+    async def _scan_paths(self, index, query, fields, build):
+        """
+        Scroll an index with the async client
+
+        :param build: Function to build a path from the hit source
+        :return: set of paths
+        """
+        from elasticsearch.helpers import async_scan
+
+        with metrics.timer('index_scroll'):
+            return {
+                build(hit['_source']) async for hit in async_scan(
+                    self.async_es, query=project(query, fields), index=index,
+                    scroll='1m', size=self.es_page_size
+                )
+            }
+
+    async def get_indexed_files_async(self, directory):
+
+        if self.index_mirror:
+            result_set = await asyncio.to_thread(self.index_mirror.get, 'ceda-fbi', directory)
+            if result_set is not None:
+                metrics.inc('fbi_index_mirror_hits_total', index='ceda-fbi')
+                return result_set
+
+        result_set = await self._scan_paths(
+            'ceda-fbi', self.get_query('ceda-fbi', directory), ['info.directory', 'info.name'],
+            lambda source: os.path.join(source['info']['directory'], source['info']['name'])
+        )
+
+        if self.index_mirror:
+            await asyncio.to_thread(self.index_mirror.store, 'ceda-fbi', directory, result_set)
+
+        return result_set
+
+    async def get_indexed_dirs_async(self, directory):
+
+        if self.index_mirror:
+            result_set = await asyncio.to_thread(self.index_mirror.get, 'ceda-dirs', directory)
+            if result_set is not None:
+                metrics.inc('fbi_index_mirror_hits_total', index='ceda-dirs')
+                return result_set
+
+        result_set = await self._scan_paths(
+            'ceda-dirs', self.get_query('ceda-dirs', directory), ['path'],
+            lambda source: source['path']
+        )
+
+        if self.index_mirror:
+            await asyncio.to_thread(self.index_mirror.store, 'ceda-dirs', directory, result_set)
+
+        return result_set
+
+    def _read_directory(self, listing):
+        """
+        List and classify a directory. Runs in the executor.
+
+        :param listing: Listing to fill
+        :return: Listing
+        """
+        item = listing.item
+
+        if not os.path.isdir(item) or os.path.islink(item):
+            listing.skip = True
+            return listing
+
+        with metrics.timer('listdir'):
+            entries, complete = self._list_directory(item)
+
+        if not complete:
+            listing.large = True
+            return listing
+
+        if self.digest_store:
+            listing.digest = listing_digest(entries)
+            unchanged = self.digest_store.check(item, listing.digest)
+            metrics.inc('fbi_listing_digest_total', result='hit' if unchanged else 'miss')
+            self._report_digests()
+
+            if unchanged:
+                logger.debug('Listing unchanged since last check: {}'.format(item))
+                listing.skip = True
+                return listing
+
+        listing.listing = [entry.path for entry in entries]
+        listing.files = {path for path in listing.listing if os.path.isfile(path)}
+        listing.dirs = {normpath(path) for path in listing.listing if os.path.isdir(path)}
+
+        return listing
+
+    def _get_next(self, dev=False):
+        """
+        Get the next item from the local queues, manual first. Runs in the executor.
+        Waits for an item in dev mode as the crawler is not refilling the queues,
+        otherwise until the next sweep is due.
+
+        :return: (queue name, item) or None if both queues are empty
+        """
+        try:
+            with metrics.timer('queue_get'):
+                return self.work_queue.get(timeout=self._get_timeout(dev))
+        except persistqueue.Empty:
+            return None
+
+    async def feed(self, out_queue, dev=False):
+        """
+        Feed items from the local queues into the pipeline. Loads the next
+        spot into the bot queue when it runs dry and a sweep is due, unless
+        in dev mode.
+        """
+        while True:
+            if self.index_mirror and time.time() - self._last_mirror_sync > self.mirror_sync_interval:
+                await asyncio.to_thread(self.refresh_index_mirror)
+                self._last_mirror_sync = time.time()
+
+            nxt = await asyncio.to_thread(self._get_next, dev)
+
+            if nxt:
+                logger.info(nxt[1])
+                await out_queue.put(Listing(*nxt))
+                continue
+
+            if dev or self._sweep_wait():
+                continue
+
+            logger.info('Bot queues empty, retrieving next spot.')
+            spot = await asyncio.to_thread(self.get_next_spot)
+            if spot is None:
+                # Wait for the spot file to be refreshed
+                await asyncio.sleep(self.idle_timeout)
+                continue
+            if not await asyncio.to_thread(self.claim_spot, spot):
+                continue
+            if self.crawl_mode == 'subtree':
+                # Messages are handed back to the loop by publish_message
+                await asyncio.to_thread(self.reconcile_subtree, spot)
+            else:
+                await asyncio.to_thread(self.add_dirs_to_queue, spot)
+            self._last_sweep = time.time()
+
+    async def list_stage(self, in_queue, out_queue):
+        read_directory = aiofiles.os.wrap(self._read_directory)
+
+        while True:
+            listing = await in_queue.get()
+            await out_queue.put(await read_directory(listing))
+
+    async def fetch_stage(self, in_queue, out_queue):
+        while True:
+            listing = await in_queue.get()
+
+            if not listing.skip and not listing.large:
+                listing.indexed_files, listing.indexed_dirs = await asyncio.gather(
+                    self.get_indexed_files_async(listing.item),
+                    self.get_indexed_dirs_async(listing.item)
+                )
+
+            await out_queue.put(listing)
+
+    def _publish_on_loop(self, msg):
+        """
+        Publish a message from the event loop thread, reconnecting and
+        sending it again if the connection has been lost
+        """
+        try:
+            super().publish_message(msg)
+        except pika.exceptions.StreamLostError as e:
+            logger.error('Connection lost, reconnecting', exc_info=e)
+            self.rabbit_connect()
+            super().publish_message(msg)
+
+    async def _publish_async(self, msg):
+        self._publish_on_loop(msg)
+
+    def publish_message(self, msg):
+        """
+        Publish a message on the event loop thread. Called from a worker
+        thread this waits for the message to be sent, so publishing keeps
+        pace with the reconciliation.
+        """
+        if self._loop is None or threading.get_ident() == self._loop_thread:
+            self._publish_on_loop(msg)
+            return
+
+        asyncio.run_coroutine_threadsafe(self._publish_async(msg), self._loop).result()
+
+    def _publish(self, listing):
+        """
+        Publish the changes for a directory and acknowledge it. Runs in a
+        worker thread.
+        """
+        if listing.large:
+            changes = self.process_large_directory(listing.item)
+        elif not listing.skip:
+            changes = self.reconcile_ceda_fbi(listing.item, listing.files, listing.indexed_files)
+            changes += self.reconcile_ceda_dirs(listing.item, listing.dirs, listing.indexed_dirs, listing.listing)
+
+            if self.digest_store:
+                self.digest_store.set(listing.item, listing.digest)
+        else:
+            changes = 0
+
+        if self.scheduler is not None:
+            self.scheduler.record_drift(listing.item, changes)
+
+        with metrics.timer('queue_ack'):
+            self.work_queue.ack(listing.queue, listing.item)
+        metrics.inc('fbi_directories_processed_total', queue=listing.queue)
+
+    async def publish_stage(self, in_queue):
+        """
+        Reconcile each directory in a worker thread. The loop stays free for
+        the other stages and to send the messages the worker publishes.
+        """
+        while True:
+            listing = await in_queue.get()
+            await asyncio.to_thread(self._publish, listing)
+
+    async def run(self, dev=False):
+        """
+        Run the pipeline until an error occurs
+
+        :param dev: Flag to turn off the crawler activities
+        """
+        self.async_es = self._async_es_connect()
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+
+        list_queue = asyncio.Queue(maxsize=self.concurrency)
+        fetch_queue = asyncio.Queue(maxsize=self.concurrency)
+        publish_queue = asyncio.Queue(maxsize=self.concurrency)
+
+        tasks = [asyncio.create_task(self.feed(list_queue, dev=dev))]
+        tasks += [asyncio.create_task(self.list_stage(list_queue, fetch_queue)) for _ in range(self.concurrency)]
+        tasks += [asyncio.create_task(self.fetch_stage(fetch_queue, publish_queue)) for _ in range(self.concurrency)]
+        tasks.append(asyncio.create_task(self.publish_stage(publish_queue)))
+
+        try:
+            # Stages run forever so the first to finish has failed
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.async_es.close()
+            self._loop = self._loop_thread = None
+
+    @classmethod
+    def main(cls):
+
+        configure_logging()
+
+        parser = argparse.ArgumentParser(description='Check directories with the elasticsearch indices to maintain'
+                                                     'consistency between the archive and the indices, '
+                                                     'overlapping filesystem and index access with asyncio')
+
+        parser.add_argument('--dev', action='store_true',
+                            help='Disables the crawler to reduce number of events to process')
+        add_profile_argument(parser)
+
+        args = parser.parse_args()
+
+        checker = cls()
+
+        print("Ready")
+        # Only the event loop thread is profiled. Filesystem calls made in
+        # the executor are still counted against their stage
+        with profiling(args.profile, dump_on_signal=True):
+            while True:
+                try:
+                    asyncio.run(checker.run(dev=args.dev))
+
+                except KeyboardInterrupt:
+                    break
+
+                except Exception as e:
+                    if is_busy_error(e):
+                        # The pipeline has stopped, so every listing it held
+                        # is put back
+                        checker.resume_after_busy(e)
+                        continue
+                    logger.error(e, exc_info=True)
+
+                break
+
+
+if __name__ == '__main__':
+    AsyncConsistencyChecker.main()
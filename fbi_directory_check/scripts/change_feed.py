@@ -0,0 +1,161 @@
+# encoding: utf-8
+"""
+Follow deposit logs and add the directories they touch to the work queue,
+so changes are checked within seconds rather than waiting for the crawler
+to reach their spot.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import deque
+
+from six.moves.configparser import RawConfigParser
+
+from fbi_directory_check import configure_logging, logstream
+from fbi_directory_check.utils.change_feed import (Coalescer, LogFollower,
+                                                   StreamFollower,
+                                                   changed_directory,
+                                                   parse_line)
+from fbi_directory_check.utils.metrics import metrics
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 profiling, stage)
+from fbi_directory_check.utils.queues import QUEUE_DIRS, open_work_queue
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+
+def get_args():
+    default_config = os.path.join(os.path.dirname(__file__), '../conf/index_updater.ini')
+
+    parser = argparse.ArgumentParser(description='Follow deposit logs and queue the directories which change '
+                                                 'to be checked against the indices.')
+
+    parser.add_argument('logs', nargs='+', help='Deposit log files to follow, or - to read from stdin')
+    parser.add_argument('--conf', type=str, default=default_config, help='Optional path to configuration file')
+    parser.add_argument('--from-start', action='store_true',
+                        help='Read log files from the start when there is no saved offset')
+    add_profile_argument(parser)
+
+    return parser.parse_args()
+
+
+def follow(source, work_queue, coalescer, queue='bot_queue', poll_interval=1.0,
+           save_interval=30, report_interval=60):
+    """
+    Queue the directories changed in a log source until it closes. Offsets
+    are checkpointed every ``save_interval`` seconds but a checkpoint is
+    only saved once every change read before it has left the coalescer,
+    so a crash never skips changes which were not queued.
+
+    :param source: LogFollower or StreamFollower
+    :param work_queue: WorkQueue to add directories to
+    :param coalescer: Coalescer used to collapse bursts
+    :param queue: Name of the queue to add to
+    :param poll_interval: Seconds between reads of the source
+    :param save_interval: Seconds between checkpoints of the log offsets
+    :param report_interval: Seconds between progress reports
+    :return: Number of directories queued
+    """
+    queued = 0
+    last_save = last_report = time.monotonic()
+
+    # (number of changes read, offsets) waiting for those changes to be queued
+    checkpoints = deque()
+
+    while True:
+        for line in source.read():
+            with stage('parse'):
+                change = parse_line(line)
+            if change:
+                coalescer.add(changed_directory(*change))
+
+        directories = coalescer.flush() if source.closed else coalescer.due()
+        for directory in directories:
+            with metrics.timer('queue_put'):
+                work_queue.put(queue, directory)
+        queued += len(directories)
+
+        now = time.monotonic()
+
+        if now - last_save >= save_interval:
+            checkpoints.append((coalescer.events, source.checkpoint()))
+            last_save = now
+
+        oldest = coalescer.oldest_event()
+        offsets = None
+        while checkpoints and (oldest is None or checkpoints[0][0] < oldest):
+            _, offsets = checkpoints.popleft()
+        if offsets is not None:
+            source.save(offsets)
+
+        if now - last_report >= report_interval:
+            logger.info(f'{coalescer.events} changes read, {queued} directories queued, {len(coalescer)} pending')
+            last_report = now
+
+        if source.closed:
+            source.save()
+            return queued
+
+        time.sleep(poll_interval)
+
+
+def main():
+
+    configure_logging()
+
+    args = get_args()
+
+    conf = RawConfigParser()
+    conf.read(args.conf)
+
+    logger.setLevel(logging.getLevelName(conf.get('logging', 'log-level', fallback='info').upper()))
+
+    queue = conf.get('change-feed', 'queue', fallback='bot_queue')
+    if queue not in QUEUE_DIRS:
+        raise ValueError(f'Unknown queue: {queue}')
+
+    if args.logs == ['-']:
+        source = StreamFollower(sys.stdin)
+    else:
+        source = LogFollower(
+            args.logs,
+            from_start=args.from_start,
+            state_file=conf.get('change-feed', 'state-file', fallback='') or None
+        )
+
+    coalescer = Coalescer(
+        settle=conf.getfloat('change-feed', 'settle', fallback=5),
+        max_delay=conf.getfloat('change-feed', 'max-delay', fallback=60)
+    )
+
+    work_queue = open_work_queue(conf)
+
+    try:
+        # The follower runs until stopped so also write the profile on SIGUSR1
+        with profiling(args.profile, dump_on_signal=True):
+            follow(
+                source, work_queue, coalescer, queue=queue,
+                poll_interval=conf.getfloat('change-feed', 'poll-interval', fallback=1)
+            )
+
+    except KeyboardInterrupt:
+        for directory in coalescer.flush():
+            work_queue.put(queue, directory)
+        source.save()
+
+    finally:
+        work_queue.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,20 +12,33 @@ __contact__ = 'richard.d.smith@stfc.ac.uk'
 import argparse
 import logging
 import os
-from datetime import datetime
-from hashlib import sha1
+import time
+from datetime import datetime, timezone
 from os.path import normpath
 
 import persistqueue
 import pika
 import requests
 from ceda_elasticsearch_tools.elasticsearch import CEDAElasticsearchClient
-from elasticsearch.helpers import scan
 from six.moves.configparser import RawConfigParser
 
+from fbi_directory_check import TRACE, LogStream, configure_logging
 from fbi_directory_check.utils import get_line_in_file
 from fbi_directory_check.utils.constants import (DEPOSIT, MKDIR, README,
                                                  REMOVE, RMDIR)
+from fbi_directory_check.utils.digests import DigestStore, listing_digest
+from fbi_directory_check.utils.elastic import (BulkRemover, project,
+                                               sliced_scan)
+from fbi_directory_check.utils.index_mirror import IndexMirror
+from fbi_directory_check.utils.metrics import metrics
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 profiling, stage)
+from fbi_directory_check.utils.queues import (PriorityWorkQueue,
+                                              is_busy_error, open_work_queue)
+from fbi_directory_check.utils.scheduler import SpotScheduler
+from fbi_directory_check.utils.streaming import ADD, external_sort, merge_diff
+from fbi_directory_check.utils.subtree import (DIR, FILE, SubtreeWalk,
+                                               subtree_diff)
 
 logger = logging.getLogger()
 
@@ -33,6 +46,12 @@ logger = logging.getLogger()
 elastic_logger = logging.getLogger('elasticsearch')
 elastic_logger.setLevel(logging.WARNING)
 
+# Values of the crawler mode option
+CRAWL_MODES = ('directory', 'subtree')
+
+# Seconds to wait before retrying when a local queue stays locked
+QUEUE_BUSY_RETRY = 10
+
 
 class ElasticsearchConsistencyChecker(object):
 
@@ -49,31 +68,61 @@ class ElasticsearchConsistencyChecker(object):
         # Load the fbi exchange name
         self.fbi_exchange = self.conf.get('server', 'fbi_exchange')
 
-        # Setup local queues
-        self.manual_queue = persistqueue.SQLiteAckQueue(
-            os.path.join(self.db_location, 'priority'),
-            multithreading=True
-        )
-        self.bot_queue = persistqueue.SQLiteAckQueue(
-            os.path.join(self.db_location, 'bot'),
-            multithreading=True
-        )
+        # Setup work queues
+        self._load_work_queue()
+        self.idle_timeout = self.conf.getfloat('local-queue', 'idle-timeout', fallback=60)
+
+        # Minimum time between spots loaded by the crawler
+        self.sweep_interval = self.conf.getfloat('crawler', 'sweep-interval', fallback=0)
+        # directory queues every directory of a spot, subtree reconciles the spot in one sweep
+        self.crawl_mode = self.conf.get('crawler', 'mode', fallback='directory')
+        if self.crawl_mode not in CRAWL_MODES:
+            raise ValueError('Unknown crawler mode {!r}, expected one of {}'.format(
+                self.crawl_mode, ', '.join(CRAWL_MODES)))
+        # Seconds a spot stays claimed by this checker when the work queue is shared
+        self.spot_lease = self.conf.getfloat('crawler', 'spot-lease', fallback=86400)
+        self._last_sweep = 0
+        self._last_depth_report = 0
 
         # Create Elasticsearch connection
         self.es = CEDAElasticsearchClient(timeout=60, retry_on_timeout=True)
+        self.es_page_size = self.conf.getint('elasticsearch', 'page-size', fallback=1000)
+        self.es_slices = self.conf.getint('elasticsearch', 'slices', fallback=1)
+        self.es_slice_threshold = self.conf.getint('elasticsearch', 'slice-threshold', fallback=100000)
         self.rabbit_connect()
 
+        # Directories with more entries than this are reconciled as sorted streams
+        self.streaming_threshold = self.conf.getint('streaming-diff', 'threshold', fallback=0)
+        self.streaming_sort_field = self.conf.get('streaming-diff', 'sort-field', fallback='info.name')
+        self.streaming_chunk_size = self.conf.getint('streaming-diff', 'chunk-size', fallback=100000)
+
+        # Removals can be sent straight to the indices rather than through rabbit
+        self.bulk_removal = self.conf.getboolean('bulk-removal', 'enabled', fallback=False)
+
         self.spot_progress = self._get_spot_progress()
 
-        # Setup logging
-        logging_level = self.conf.get('logging', 'log-level')
-        logger.setLevel(getattr(logging, logging_level.upper()))
+        # Optional local copy of the index state
+        self._load_index_mirror()
+
+        # Optional listing digests to skip unchanged directories
+        self._load_digest_store()
+
+        # Optional change-likelihood scheduling of spots
+        self._load_scheduler()
+
+        # Optional metrics export
+        self._start_metrics()
 
-        # Add formatting
-        ch = logging.StreamHandler()
-        ch.setLevel(getattr(logging, logging_level.upper()))
+        # Setup logging. The trace level logs the paths added and removed
+        logging_level = logging.getLevelName(self.conf.get('logging', 'log-level').upper())
+        logger.setLevel(logging_level)
+
+        # Add formatting. Records are written from a background thread
+        ch = LogStream()
+        ch.setLevel(logging_level)
         formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         ch.setFormatter(formatter)
+        ch.start()
 
         logger.addHandler(ch)
         logger.info("Setup Elasticsearch consistency checker")
@@ -85,6 +134,131 @@ class ElasticsearchConsistencyChecker(object):
         self.spot_file = os.path.join(self.db_location, 'spot_file.txt')
         self.progress_file = os.path.join(self.db_location, 'spot_progress.txt')
 
+    def _load_work_queue(self):
+        """
+        Setup the work queues for the configured backend. Manual items are
+        always taken before bot items.
+        """
+
+        self.work_queue = open_work_queue(self.conf)
+
+        if isinstance(self.work_queue, PriorityWorkQueue):
+            self.manual_queue = self.work_queue['manual_queue']
+            self.bot_queue = self.work_queue['bot_queue']
+        else:
+            self.manual_queue = self.bot_queue = None
+            logger.info('Using shared work queue {}'.format(self.work_queue.path))
+
+    def _load_index_mirror(self):
+        """
+        Setup the local index mirror if enabled in the configuration
+        """
+
+        self.index_mirror = None
+        self._last_mirror_sync = 0
+
+        if not self.conf.getboolean('index-mirror', 'enabled', fallback=False):
+            return
+
+        location = self.conf.get(
+            'index-mirror', 'location',
+            fallback=os.path.join(self.db_location, 'index_mirror.db')
+        )
+
+        self.index_mirror = IndexMirror(
+            location,
+            max_age=self.conf.getfloat('index-mirror', 'max-age', fallback=86400)
+        )
+        self.mirror_sync_interval = self.conf.getfloat('index-mirror', 'sync-interval', fallback=300)
+        self.mirror_changed_fields = {
+            'ceda-fbi': self.conf.get('index-mirror', 'ceda-fbi-changed-field', fallback='info.last_modified'),
+            'ceda-dirs': self.conf.get('index-mirror', 'ceda-dirs-changed-field', fallback=''),
+        }
+
+    def _load_digest_store(self):
+        """
+        Setup the listing digest store if enabled in the configuration
+        """
+
+        self.digest_store = None
+
+        if not self.conf.getboolean('listing-digest', 'enabled', fallback=False):
+            return
+
+        location = self.conf.get(
+            'listing-digest', 'location',
+            fallback=os.path.join(self.db_location, 'listing_digests.db')
+        )
+
+        self.digest_store = DigestStore(
+            location,
+            max_age=self.conf.getfloat('listing-digest', 'max-age', fallback=86400)
+        )
+        self.digest_report_interval = self.conf.getint('listing-digest', 'report-interval', fallback=1000)
+
+    def _load_scheduler(self):
+        """
+        Setup the spot scheduler if enabled in the configuration
+        """
+
+        self.scheduler = None
+
+        if not self.conf.getboolean('scheduler', 'enabled', fallback=False):
+            return
+
+        location = self.conf.get(
+            'scheduler', 'location',
+            fallback=os.path.join(self.db_location, 'scheduler.db')
+        )
+
+        self.scheduler = SpotScheduler(
+            location,
+            drift_weight=self.conf.getfloat('scheduler', 'drift-weight', fallback=1.0),
+            mtime_weight=self.conf.getfloat('scheduler', 'mtime-weight', fallback=1.0),
+            drift_decay=self.conf.getfloat('scheduler', 'drift-decay', fallback=0.5)
+        )
+        self.spot_refresh = self.conf.getfloat('scheduler', 'spot-refresh', fallback=86400)
+
+        if os.path.exists(self.spot_file):
+            self.scheduler.load_spots(self._read_spots())
+
+    def _start_metrics(self):
+        """
+        Export metrics over HTTP and/or to a file if configured
+        """
+
+        port = self.conf.getint('metrics', 'http-port', fallback=0)
+        if port:
+            metrics.start_http_server(port, address=self.conf.get('metrics', 'http-address', fallback='127.0.0.1'))
+
+        textfile = self.conf.get('metrics', 'textfile', fallback='')
+        if textfile:
+            metrics.start_textfile_writer(textfile, interval=self.conf.getfloat('metrics', 'textfile-interval', fallback=15))
+
+    def _read_spots(self):
+        """
+        Read the spot file
+
+        :return: list of (spot, path) pairs
+        """
+        with open(self.spot_file) as reader:
+            return [tuple(line.split()) for line in reader if line.strip()]
+
+    def _report_digests(self):
+        """
+        Log the number of directories skipped by the listing digests. An
+        interval of 0 turns the report off
+        """
+        if self.digest_report_interval <= 0:
+            return
+
+        store = self.digest_store
+        checked = store.hits + store.misses
+
+        if checked % self.digest_report_interval == 0:
+            logger.info('Listing digests: {} hits {} misses ({:.1%} skipped)'.format(
+                store.hits, store.misses, store.hit_ratio))
+
     def _get_spot_progress(self):
         """
         Set the line to read from the spot file on initialisation
@@ -164,25 +338,28 @@ class ElasticsearchConsistencyChecker(object):
         :return: string which matches deposit log format
         """
 
-        # Add file size if depositing
-        time = datetime.now().isoformat(sep='-')
+        with stage('encode'):
+            # Add file size if depositing
+            time = datetime.now().isoformat(sep='-')
 
-        # This will fail if this is a remove action
-        try:
-            size = os.path.getsize(path)
-        except FileNotFoundError:
-            size=''
+            # This will fail if this is a remove action
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size=''
 
-        return '{}:{}:{}:{}:'.format(time, path, action.upper(), size)
+            return '{}:{}:{}:{}:'.format(time, path, action.upper(), size)
 
 
 
     def publish_message(self, msg):
-        self.channel.basic_publish(
-            exchange=self.fbi_exchange,
-            routing_key='',
-            body=msg
-        )
+        with metrics.timer('publish'):
+            self.channel.basic_publish(
+                exchange=self.fbi_exchange,
+                routing_key='',
+                body=msg
+            )
+        metrics.inc('fbi_messages_published_total')
 
     def get_query(self, index, directory):
 
@@ -221,76 +398,396 @@ class ElasticsearchConsistencyChecker(object):
 
         return queries.get(index)
 
-    def compare_ceda_fbi(self, item, listing):
+    def get_subtree_query(self, index, root):
+        """
+        Query for every entry in an index at or below a directory
 
-        # setup empty deletion set
-        delete_es = set()
+        :param index: Index name
+        :param root: Directory at the top of the tree
+        :return: Query body
+        """
 
-        results = scan(self.es, query=self.get_query('ceda-fbi', item), index='ceda-fbi', scroll='1m')
-        result_set = {os.path.join(
-            result['_source']['info']['directory'], result['_source']['info']['name']) for result
-            in results}
+        field = {'ceda-dirs': 'path.keyword', 'ceda-fbi': 'info.directory'}[index]
+
+        return {
+            'query': {
+                'bool': {
+                    'should': [
+                        {'term': {field: root}},
+                        {'prefix': {field: root.rstrip('/') + '/'}}
+                    ],
+                    'minimum_should_match': 1
+                }
+            }
+        }
+
+    def scan_index(self, index, query, fields):
+        """
+        Scroll through the hits for a query returning only the given fields.
+        Large result sets are read as concurrent slices.
+
+        :param index: Index to search
+        :param query: Query body
+        :param fields: Source fields to return
+        :return: Iterator of hits
+        """
+        return sliced_scan(
+            self.es, index, project(query, fields),
+            slices=self.es_slices,
+            size=self.es_page_size,
+            threshold=self.es_slice_threshold
+        )
+
+    def get_remover(self, index, action):
+        """
+        Get a bulk remover for an index. Paths which cannot be removed
+        are published as messages instead.
+
+        :param index: Index to remove from
+        :param action: Action to publish on failure
+        :return: BulkRemover
+        """
+        return BulkRemover(
+            self.es, index,
+            batch_size=self.conf.getint('bulk-removal', 'batch-size', fallback=500),
+            max_retries=self.conf.getint('bulk-removal', 'max-retries', fallback=3),
+            on_failure=lambda path: self.publish_message(self.create_message(path, action))
+        )
+
+    def remove_paths(self, index, paths, action):
+        """
+        Remove stale paths from an index, either directly with the bulk API
+        or by publishing a message for each path.
+
+        :param index: Index to remove from
+        :param paths: Paths to remove
+        :param action: REMOVE or RMDIR
+        """
+        if not self.bulk_removal:
+            for path in paths:
+                self.publish_message(self.create_message(path, action))
+            return
+
+        with metrics.timer('bulk_remove'):
+            with self.get_remover(index, action) as remover:
+                remover.extend(paths)
+
+        metrics.inc('fbi_bulk_removed_total', remover.removed, index=index)
+        metrics.inc('fbi_bulk_remove_failed_total', remover.failed, index=index)
+
+    def get_indexed_files(self, directory):
+        """
+        Get the set of file paths in ceda-fbi for the given directory.
+        Served from the index mirror when enabled.
+
+        :param directory: Directory to retrieve
+        :return: set of file paths
+        """
+
+        if self.index_mirror:
+            result_set = self.index_mirror.get('ceda-fbi', directory)
+            if result_set is not None:
+                metrics.inc('fbi_index_mirror_hits_total', index='ceda-fbi')
+                return result_set
+
+        with metrics.timer('index_scroll'):
+            results = self.scan_index('ceda-fbi', self.get_query('ceda-fbi', directory), ['info.directory', 'info.name'])
+            result_set = {os.path.join(
+                result['_source']['info']['directory'], result['_source']['info']['name']) for result
+                in results}
+
+        if self.index_mirror:
+            self.index_mirror.store('ceda-fbi', directory, result_set)
+
+        return result_set
+
+    def get_indexed_dirs(self, directory):
+        """
+        Get the set of directory paths in ceda-dirs for the given directory
+        and its immediate children. Served from the index mirror when enabled.
+
+        :param directory: Directory to retrieve
+        :return: set of directory paths
+        """
+
+        if self.index_mirror:
+            result_set = self.index_mirror.get('ceda-dirs', directory)
+            if result_set is not None:
+                metrics.inc('fbi_index_mirror_hits_total', index='ceda-dirs')
+                return result_set
+
+        with metrics.timer('index_scroll'):
+            results = self.scan_index('ceda-dirs', self.get_query('ceda-dirs', directory), ['path'])
+            result_set = {result['_source']['path'] for result in results}
+
+        if self.index_mirror:
+            self.index_mirror.store('ceda-dirs', directory, result_set)
+
+        return result_set
+
+    def refresh_index_mirror(self):
+        """
+        Pull the documents which have changed since the last sync into
+        the index mirror. Indices without a changed field configured rely
+        on the mirror max-age to pick up changes.
+
+        The largest changed field value seen is stored as the point to sync
+        from next time so the comparison never mixes the checker's clock with
+        the values in the index. The first sync starts from the current UTC
+        time.
+        """
+
+        for index, field in self.mirror_changed_fields.items():
+            if not field:
+                continue
+
+            last_sync = self.index_mirror.get_last_sync(index)
+
+            if not last_sync:
+                self.index_mirror.set_last_sync(index, datetime.now(timezone.utc).isoformat())
+                continue
+
+            # Documents sharing the last value may have been indexed after the
+            # previous sync. Refreshing a path twice is harmless
+            query = {'query': {'range': {field: {'gte': last_sync}}}}
+            latest = [last_sync]
+
+            def track(results):
+                for result in results:
+                    value = result['_source']
+                    for key in field.split('.'):
+                        value = value.get(key) if isinstance(value, dict) else None
+                    if value is not None:
+                        latest[0] = max(latest[0], str(value))
+                    yield result['_source']
+
+            if index == 'ceda-fbi':
+                sources = track(self.scan_index(index, query, ['info.directory', 'info.name', field]))
+                changes = (
+                    (source['info']['directory'], os.path.join(source['info']['directory'], source['info']['name']))
+                    for source in sources
+                )
+            else:
+                sources = track(self.scan_index(index, query, ['path', field]))
+                # A directory appears in its own listing and its parent's
+                changes = (
+                    (directory, source['path'])
+                    for source in sources
+                    for directory in (source['path'], os.path.dirname(source['path']))
+                )
+
+            count = self.index_mirror.refresh(index, changes)
+            logger.info('Index mirror refreshed {} paths from {}'.format(count, index))
+
+            self.index_mirror.set_last_sync(index, latest[0])
+
+    def compare_ceda_fbi(self, item, listing):
+
+        result_set = self.get_indexed_files(item)
 
         file_set = {file for file in listing if os.path.isfile(file)}
 
+        return self.reconcile_ceda_fbi(item, file_set, result_set)
+
+    def reconcile_ceda_fbi(self, item, file_set, result_set):
+        """
+        Publish the differences between the files on disk and in ceda-fbi
+
+        :param item: Directory being checked
+        :param file_set: Set of file paths on disk
+        :param result_set: Set of file paths in ceda-fbi
+        :return: Number of changes published
+        """
+
+        # setup empty deletion set
+        delete_es = set()
+
         # Check if a '00FILES_ON_TAPE file exists
         files_on_tape = any(os.path.basename(file) == '00FILES_ON_TAPE' for file in file_set)
 
-        # Get file in file_set not in ES (Need to add to ES)
-        add_es = file_set - result_set
+        with metrics.timer('set_diff'):
+            # Get file in file_set not in ES (Need to add to ES)
+            add_es = file_set - result_set
 
-        # Turn off strict checking if there are files on tape as the live listing would
-        # try to delete entries in the index that are stored on tape
-        if not files_on_tape:
-            # Get files in ES not in file_set (Need to delete from ES)
-            delete_es = result_set - file_set
+            # Turn off strict checking if there are files on tape as the live listing would
+            # try to delete entries in the index that are stored on tape
+            if not files_on_tape:
+                # Get files in ES not in file_set (Need to delete from ES)
+                delete_es = result_set - file_set
+
+        metrics.inc('fbi_index_changes_total', len(add_es), index='ceda-fbi', action=DEPOSIT)
+        metrics.inc('fbi_index_changes_total', len(delete_es), index='ceda-fbi', action=REMOVE)
 
         logger.info('{} files to add to ES {} files to delete from ES'.format(len(add_es), len(delete_es)))
-        logger.debug('Files to add: {}\n Files to remove {}'.format(add_es, delete_es))
-        logger.info('{} files to add to ES'.format(len(add_es)))
-        logger.debug('Files to add: {}\n'.format(add_es))
+        logger.log(TRACE, 'Files to add: %s\n Files to remove %s', add_es, delete_es)
 
         # Generate messages for pika queue
         for file in add_es:
             msg = self.create_message(file, DEPOSIT)
             self.publish_message(msg)
 
-        for file in delete_es:
-            msg = self.create_message(file, REMOVE)
-            self.publish_message(msg)
+        self.remove_paths('ceda-fbi', delete_es, REMOVE)
+
+        if self.index_mirror:
+            self.index_mirror.update('ceda-fbi', item, added=add_es, removed=delete_es)
+
+        return len(add_es) + len(delete_es)
+
+    def iter_indexed_files(self, directory):
+        """
+        Yield the ceda-fbi file paths for the given directory sorted by name.
+        Pages through the results with search_after so that only one page
+        is held in memory.
+
+        The sort field must be a keyword field without a normalizer holding
+        the file name. Names are unique within a directory so no hit is
+        skipped between pages. merge_diff assumes the index returns names in
+        the same order as Python sorts strings; a normalized or text field
+        would order them differently and produce false REMOVEs.
+
+        :param directory: Directory to retrieve
+        :return: Iterator of sorted file paths
+        """
+
+        body = project(self.get_query('ceda-fbi', directory), ['info.name'])
+        body['size'] = self.es_page_size
+        body['sort'] = [{self.streaming_sort_field: 'asc'}]
+
+        while True:
+            with metrics.timer('index_scroll'):
+                hits = self.es.search(index='ceda-fbi', body=body)['hits']['hits']
+
+            if not hits:
+                return
+
+            for hit in hits:
+                yield os.path.join(directory, hit['_source']['info']['name'])
+
+            body['search_after'] = hits[-1]['sort']
+
+    def compare_ceda_fbi_streaming(self, item):
+        """
+        Reconcile the files in a directory with ceda-fbi by merging the sorted
+        filesystem listing with the sorted index entries. Messages are
+        published as differences are found and memory use does not grow with
+        the size of the directory.
+
+        :param item: Directory to check
+        :return: Number of changes published
+        """
+
+        def live_files():
+            with os.scandir(item) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            yield entry.path
+                    except OSError:
+                        continue
+
+        # Turn off strict checking if there are files on tape as the live listing would
+        # try to delete entries in the index that are stored on tape
+        files_on_tape = os.path.isfile(os.path.join(item, '00FILES_ON_TAPE'))
+
+        add_count = 0
+        delete_count = 0
+
+        live = external_sort(live_files(), chunk_size=self.streaming_chunk_size)
+        remover = self.get_remover('ceda-fbi', REMOVE) if self.bulk_removal else None
+
+        for path, action in merge_diff(live, self.iter_indexed_files(item)):
+            if action == ADD:
+                self.publish_message(self.create_message(path, DEPOSIT))
+                add_count += 1
+            elif not files_on_tape:
+                if remover:
+                    remover.add(path)
+                else:
+                    self.publish_message(self.create_message(path, REMOVE))
+                delete_count += 1
+
+        if remover:
+            remover.flush()
+            metrics.inc('fbi_bulk_removed_total', remover.removed, index='ceda-fbi')
+            metrics.inc('fbi_bulk_remove_failed_total', remover.failed, index='ceda-fbi')
+
+        metrics.inc('fbi_index_changes_total', add_count, index='ceda-fbi', action=DEPOSIT)
+        metrics.inc('fbi_index_changes_total', delete_count, index='ceda-fbi', action=REMOVE)
+
+        logger.info('{} files added to ES {} files deleted from ES'.format(add_count, delete_count))
+
+        return add_count + delete_count
+
+    def process_large_directory(self, item):
+        """
+        Reconcile a directory which is too large to hold in memory. Files are
+        streamed and only subdirectories and 00README files are listed for
+        the ceda-dirs comparison. Listing digests are not used as they need
+        the whole listing.
+
+        :param item: Directory to check
+        :return: Number of changes published
+        """
+
+        logger.info('Streaming reconciliation for large directory: {}'.format(item))
+
+        changes = self.compare_ceda_fbi_streaming(item)
+
+        with metrics.timer('listdir'):
+            with os.scandir(item) as it:
+                listing = [entry.path for entry in it if entry.name == '00README' or entry.is_dir()]
+
+        changes += self.compare_ceda_dirs(item, listing)
+
+        return changes
 
     def compare_ceda_dirs(self, item, listing):
 
         # Query elasticsearch for matches to the item directory
-        results = scan(self.es, query=self.get_query('ceda-dirs', item), index='ceda-dirs', scroll='1m')
-
-        result_set = {result['_source']['path'] for result in results}
+        result_set = self.get_indexed_dirs(item)
 
         # Build a set of directories from the file system
         dir_set = {normpath(_dir) for _dir in listing if os.path.isdir(_dir)}
 
+        return self.reconcile_ceda_dirs(item, dir_set, result_set, listing)
+
+    def reconcile_ceda_dirs(self, item, dir_set, result_set, listing):
+        """
+        Publish the differences between the directories on disk and in ceda-dirs
+        along with any 00README files in the listing
+
+        :param item: Directory being checked
+        :param dir_set: Set of subdirectory paths on disk
+        :param result_set: Set of directory paths in ceda-dirs
+        :param listing: Directory listing
+        :return: Number of changes published
+        """
+
         # Add item to comparison set
         dir_set.add(item)
 
-        # Get dirs in dir_set not in ES (Need to add to ES)
-        add_es = dir_set - result_set
+        with metrics.timer('set_diff'):
+            # Get dirs in dir_set not in ES (Need to add to ES)
+            add_es = dir_set - result_set
+
+            # Get dirs in ES not in dir_set (Need to delete from ES)
+            delete_es = result_set - dir_set
 
-        # Get dirs in ES not in dir_set (Need to delete from ES)
-        delete_es = result_set - dir_set
+        metrics.inc('fbi_index_changes_total', len(add_es), index='ceda-dirs', action=MKDIR)
+        metrics.inc('fbi_index_changes_total', len(delete_es), index='ceda-dirs', action=RMDIR)
 
         logger.info('{} dirs to add to ES {} dirs to delete from ES'.format(len(add_es), len(delete_es)))
-        logger.debug('Dirs to add: {}\n Dirs to remove {}'.format(add_es, delete_es))
-        logger.info('{} dirs to add to ES'.format(len(add_es)))
-        logger.debug('Dirs to add: {}\n'.format(add_es))
+        logger.log(TRACE, 'Dirs to add: %s\n Dirs to remove %s', add_es, delete_es)
 
         # Generate messages for pika queue
         for dir in add_es:
             msg = self.create_message(dir, MKDIR)
             self.publish_message(msg)
 
-        for dir in delete_es:
-            msg = self.create_message(dir, RMDIR)
-            self.publish_message(msg)
+        self.remove_paths('ceda-dirs', delete_es, RMDIR)
+
+        if self.index_mirror:
+            self.index_mirror.update('ceda-dirs', item, added=add_es, removed=delete_es)
 
         # Check if there are any 00README files in this dir
         for file in listing:
@@ -298,6 +795,25 @@ class ElasticsearchConsistencyChecker(object):
                 msg = self.create_message(file, README)
                 self.publish_message(msg)
 
+        return len(add_es) + len(delete_es)
+
+    def _list_directory(self, item):
+        """
+        List a directory, stopping early once the streaming threshold is passed.
+
+        :param item: Directory to list
+        :return: (entries, complete)
+        """
+        entries = []
+
+        with os.scandir(item) as it:
+            for entry in it:
+                entries.append(entry)
+                if self.streaming_threshold and len(entries) > self.streaming_threshold:
+                    return entries, False
+
+        return entries, True
+
     def process_queue(self, queue):
         """
         Perform action on the queue and acknowledge when done
@@ -305,27 +821,102 @@ class ElasticsearchConsistencyChecker(object):
         :param queue: queue name
         """
 
-        q = getattr(self, queue)
+        with metrics.timer('queue_get'):
+            _, item = self.work_queue.get(queues=[queue])
+
+        self.process_item(queue, item)
+
+    def process_item(self, queue, item):
+        """
+        Check a directory taken from a queue and acknowledge when done
+
+        :param queue: queue name
+        :param item: directory path
+        """
 
-        item = q.get()
         logger.info(item)
 
         if os.path.isdir(item) and not os.path.islink(item):
 
             # Get list of files and directories
-            listing = [os.path.join(item, file) for file in os.listdir(item)]
-            self.compare_ceda_fbi(item, listing)
-            self.compare_ceda_dirs(item, listing)
+            with metrics.timer('listdir'):
+                entries, complete = self._list_directory(item)
+
+            if not complete:
+                # Listing exceeded the threshold, switch to streaming
+                del entries
+                changes = self.process_large_directory(item)
+
+                if self.scheduler is not None:
+                    self.scheduler.record_drift(item, changes)
+
+                with metrics.timer('queue_ack'):
+                    self.work_queue.ack(queue, item)
+                metrics.inc('fbi_directories_processed_total', queue=queue)
+                return
+
+            listing = [entry.path for entry in entries]
+
+            if self.digest_store:
+                digest = listing_digest(entries)
+                unchanged = self.digest_store.check(item, digest)
+                metrics.inc('fbi_listing_digest_total', result='hit' if unchanged else 'miss')
+                self._report_digests()
+
+                if unchanged:
+                    logger.debug('Listing unchanged since last check: {}'.format(item))
+                    with metrics.timer('queue_ack'):
+                        self.work_queue.ack(queue, item)
+                    metrics.inc('fbi_directories_processed_total', queue=queue)
+                    return
+
+            changes = self.compare_ceda_fbi(item, listing)
+            changes += self.compare_ceda_dirs(item, listing)
 
-        q.ack(item)
+            if self.scheduler is not None:
+                self.scheduler.record_drift(item, changes)
+
+            if self.digest_store:
+                self.digest_store.set(item, digest)
+
+        with metrics.timer('queue_ack'):
+            self.work_queue.ack(queue, item)
+        metrics.inc('fbi_directories_processed_total', queue=queue)
+
+    def get_scheduled_spot(self):
+        """
+        Get the spot most likely to have changed from the scheduler.
+        The spot file is downloaded again once it is older than the
+        refresh interval.
+
+        :return: Next spot, or None if no spots are loaded
+        """
+
+        if not os.path.exists(self.spot_file) or \
+                time.time() - os.path.getmtime(self.spot_file) > self.spot_refresh:
+            logger.info('Refreshing spot file')
+            self._download_spot_conf()
+            self.scheduler.load_spots(self._read_spots())
+
+        path = self.scheduler.next_spot()
+        if path is None:
+            logger.warning('No spots loaded from {}'.format(self.spot_file))
+            return None
+
+        logger.debug('Loading scheduled spot: {}'.format(path))
+
+        return path
 
     def get_next_spot(self):
         """
         Get the next spot to add to the bot queue
 
-        :return: Next spot
+        :return: Next spot, or None if there is none to crawl
         """
 
+        if self.scheduler is not None:
+            return self.get_scheduled_spot()
+
         # Download the configuration if it does not exist
         if not os.path.exists(self.spot_file):
             logger.debug('Spot file does not exist. Downloading...')
@@ -359,6 +950,23 @@ class ElasticsearchConsistencyChecker(object):
 
         return path
 
+    def claim_spot(self, path):
+        """
+        Claim a spot in the work queue so that checkers sharing the queue
+        do not all crawl it. A spot claimed elsewhere counts as checked
+        by the scheduler.
+
+        :param path: Spot path
+        :return: Whether this checker should crawl the spot
+        """
+        if self.work_queue.claim('spot:{}'.format(path), self.spot_lease):
+            return True
+
+        logger.info('Spot claimed by another checker: {}'.format(path))
+        if self.scheduler is not None:
+            self.scheduler.record_check(path)
+        return False
+
     def add_dirs_to_queue(self, path):
         """
         Walks a directory tree, given a path and adds the directories to the bot queue
@@ -366,9 +974,135 @@ class ElasticsearchConsistencyChecker(object):
         if not os.path.exists(path):
             logger.error('Path not found: {}'.format(path))
 
+        if self.scheduler is not None:
+            self._add_scheduled_dirs_to_queue(path)
+            return
+
         for root, dirs, _ in os.walk(path):
             abs_root = os.path.abspath(root)
-            self.bot_queue.put(abs_root)
+            self.work_queue.put('bot_queue', abs_root)
+
+    def iter_indexed_subtree(self, root):
+        """
+        Yield every ceda-fbi and ceda-dirs entry under a directory, each
+        index read in one projected pass
+
+        :param root: Directory at the top of the tree
+        :return: Iterator of (path, FILE or DIR) in no particular order
+        """
+
+        results = self.scan_index('ceda-fbi', self.get_subtree_query('ceda-fbi', root), ['info.directory', 'info.name'])
+        for result in metrics.timed(results, 'index_scroll'):
+            yield os.path.join(result['_source']['info']['directory'], result['_source']['info']['name']), FILE
+
+        results = self.scan_index('ceda-dirs', self.get_subtree_query('ceda-dirs', root), ['path'])
+        for result in metrics.timed(results, 'index_scroll'):
+            yield result['_source']['path'], DIR
+
+    def reconcile_subtree(self, root):
+        """
+        Reconcile a whole spot with ceda-fbi and ceda-dirs in one sweep. The
+        tree is walked once and merged with the index entries under it, in
+        place of queueing each directory to be checked on its own. Listing
+        digests are not used as nothing is listed per directory.
+
+        :param root: Spot path
+        :return: Number of changes published
+        """
+
+        # A missing spot would otherwise remove everything under it
+        if not os.path.isdir(root) or os.path.islink(root):
+            logger.error('Path not found: {}'.format(root))
+            return 0
+
+        logger.info('Reconciling subtree: {}'.format(root))
+
+        walk = SubtreeWalk(root, mtimes=self.scheduler is not None)
+        counts = {DEPOSIT: 0, REMOVE: 0, MKDIR: 0, RMDIR: 0}
+
+        removers = {}
+        if self.bulk_removal:
+            removers = {FILE: self.get_remover('ceda-fbi', REMOVE), DIR: self.get_remover('ceda-dirs', RMDIR)}
+
+        changes = subtree_diff(
+            walk,
+            self.iter_indexed_subtree(walk.root),
+            chunk_size=self.streaming_chunk_size
+        )
+
+        for path, kind, action in changes:
+            index = 'ceda-fbi' if kind == FILE else 'ceda-dirs'
+
+            if action == ADD:
+                message_action = DEPOSIT if kind == FILE else MKDIR
+                self.publish_message(self.create_message(path, message_action))
+            else:
+                message_action = REMOVE if kind == FILE else RMDIR
+                if kind in removers:
+                    removers[kind].add(path)
+                else:
+                    self.publish_message(self.create_message(path, message_action))
+
+            counts[message_action] += 1
+            logger.log(TRACE, '%s: %s', message_action, path, extra={'path': path, 'action': message_action})
+
+            if self.index_mirror:
+                # Directories are held in their own listing and their parent's
+                directories = [os.path.dirname(path)] + ([path] if kind == DIR else [])
+                for directory in directories:
+                    if action == ADD:
+                        self.index_mirror.update(index, directory, added=[path])
+                    else:
+                        self.index_mirror.update(index, directory, removed=[path])
+
+        for kind, remover in removers.items():
+            index = 'ceda-fbi' if kind == FILE else 'ceda-dirs'
+            remover.flush()
+            metrics.inc('fbi_bulk_removed_total', remover.removed, index=index)
+            metrics.inc('fbi_bulk_remove_failed_total', remover.failed, index=index)
+
+        for readme in walk.readmes:
+            self.publish_message(self.create_message(readme, README))
+
+        for action, count in counts.items():
+            index = 'ceda-fbi' if action in (DEPOSIT, REMOVE) else 'ceda-dirs'
+            metrics.inc('fbi_index_changes_total', count, index=index, action=action)
+        metrics.inc('fbi_directories_processed_total', walk.directories, queue='subtree')
+
+        logger.info('{} directories checked: {} files to add to ES {} files to delete from ES, '
+                    '{} dirs to add to ES {} dirs to delete from ES'.format(
+                        walk.directories, counts[DEPOSIT], counts[REMOVE], counts[MKDIR], counts[RMDIR]))
+
+        total = sum(counts.values())
+
+        if self.scheduler is not None:
+            self.scheduler.record_check(root, walk.last_mtime)
+            self.scheduler.record_drift(root, total)
+
+        return total
+
+    def _add_scheduled_dirs_to_queue(self, path):
+        """
+        Add the directories under a spot to the bot queue, most recently
+        modified first, and record the check with the scheduler.
+        """
+        directories = []
+
+        for root, dirs, _ in os.walk(path):
+            abs_root = os.path.abspath(root)
+            try:
+                mtime = os.stat(abs_root).st_mtime
+            except OSError:
+                mtime = 0
+            directories.append((mtime, abs_root))
+
+        directories.sort(reverse=True)
+
+        for _, abs_root in directories:
+            self.work_queue.put('bot_queue', abs_root)
+
+        last_mtime = directories[0][0] if directories else 0
+        self.scheduler.record_check(path, last_mtime)
 
     def consume(self, dev=False):
         """
@@ -377,49 +1111,122 @@ class ElasticsearchConsistencyChecker(object):
         :param dev: Flag to turn off the crawler activities
         """
 
-        manual_qsize = self.manual_queue._count()
-        bot_qsize = self.bot_queue._count()
+        if self.index_mirror and time.time() - self._last_mirror_sync > self.mirror_sync_interval:
+            self.refresh_index_mirror()
+            self._last_mirror_sync = time.time()
+
+        self._report_queue_depths()
+
+        # The crawler keeps the bot queue topped up so only wait for work in
+        # dev mode or until the next sweep is due
+        try:
+            with metrics.timer('queue_get'):
+                queue, item = self.work_queue.get(timeout=self._get_timeout(dev))
+
+        except persistqueue.Empty:
+            if not dev and not self._sweep_wait():
+                logger.info('Bot queues empty, retrieving next spot.')
+                spot = self.get_next_spot()
+                if spot is None:
+                    # Wait for the spot file to be refreshed
+                    time.sleep(self.idle_timeout)
+                    return
+                if not self.claim_spot(spot):
+                    return
+                if self.crawl_mode == 'subtree':
+                    self.reconcile_subtree(spot)
+                else:
+                    self.add_dirs_to_queue(spot)
+                self._last_sweep = time.time()
+            return
+
+        self.process_item(queue, item)
+
+    def _sweep_wait(self):
+        """
+        :return: Seconds until the crawler may load the next spot
+        """
+        return max(0, self.sweep_interval - (time.time() - self._last_sweep))
+
+    def _get_timeout(self, dev=False):
+        """
+        :return: Seconds to wait for an item from the work queue
+        """
+        if dev:
+            return self.idle_timeout
+        return min(self._sweep_wait(), self.idle_timeout)
+
+    def _report_queue_depths(self):
+        """
+        Update the queue depth metrics. Counting is a query on each queue
+        so it is limited to once per depth-interval.
+        """
+        if time.time() - self._last_depth_report < self.conf.getfloat('metrics', 'depth-interval', fallback=30):
+            return
+
+        for queue in ('manual_queue', 'bot_queue'):
+            metrics.set('fbi_queue_depth', self.work_queue.qsize(queue), queue=queue)
 
-        if manual_qsize:
-            self.process_queue('manual_queue')
+        self._last_depth_report = time.time()
+
+    def resume_after_busy(self, error):
+        """
+        Wait for a local queue which stayed locked past the busy timeout,
+        such as while fbi_q_maintain vacuums it, then put back the items
+        taken but not acknowledged when processing stopped.
 
-        elif bot_qsize:
-            self.process_queue('bot_queue')
+        :param error: Busy error raised while processing
+        """
+        logger.warning(f'Local queue busy, retrying: {error}')
 
-        if bot_qsize == 0 and not dev:
-            logger.info('Bot queues empty, retrieving next spot.')
-            spot = self.get_next_spot()
-            self.add_dirs_to_queue(spot)
+        while True:
+            time.sleep(QUEUE_BUSY_RETRY)
+            try:
+                self.work_queue.resume_unacked()
+                return
+            except Exception as e:
+                if not is_busy_error(e):
+                    raise
+                logger.warning(f'Local queue still busy: {e}')
 
     @classmethod
     def main(cls):
 
+        configure_logging()
+
         parser = argparse.ArgumentParser(description='Check directories with the elasticsearch indices to maintain'
                                                      'consistency between the archive and the indices')
 
         parser.add_argument('--dev', action='store_true',
                             help='Disables the crawler to reduce number of events to process')
+        add_profile_argument(parser)
 
         args = parser.parse_args()
 
         checker = cls()
 
         print("Ready")
-        while True:
-
-            try:
-                checker.consume(dev=args.dev)
-
-            except pika.exceptions.StreamLostError as e:
-                logger.error('Connection lost, reconnecting', exc_info=e)
-                checker.rabbit_connect()
-
-            except KeyboardInterrupt:
-                break
-
-            except Exception as e:
-                logger.error(e, exc_info=True)
-                break
+        # The profile is also written on SIGUSR1 as the checker runs until stopped
+        with profiling(args.profile, dump_on_signal=True):
+            while True:
+
+                try:
+                    checker.consume(dev=args.dev)
+
+                except pika.exceptions.StreamLostError as e:
+                    logger.error('Connection lost, reconnecting', exc_info=e)
+                    checker.rabbit_connect()
+                    checker.work_queue.resume_unacked()
+
+                except KeyboardInterrupt:
+                    break
+
+                except Exception as e:
+                    if is_busy_error(e):
+                        checker.resume_after_busy(e)
+                        continue
+                    logger.error(e, exc_info=True)
+                    break
 
 
 if __name__ == '__main__':
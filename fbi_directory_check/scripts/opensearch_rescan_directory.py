@@ -10,14 +10,31 @@ __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 import argparse
 import json
+import logging
 import os
 from configparser import RawConfigParser
 from datetime import datetime
 
-import pika
-
+from fbi_directory_check import configure_logging, logstream
 from fbi_directory_check.utils import walk_storage_links
 from fbi_directory_check.utils.constants import DEPOSIT
+from fbi_directory_check.utils.metrics import metrics
+from fbi_directory_check.utils.mounts import (add_mount_health_arguments,
+                                              mount_health_from_args)
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 profiling, stage)
+from fbi_directory_check.utils.progress import ProgressLog
+from fbi_directory_check.utils.prune import (add_prune_arguments,
+                                             prune_rules_from_args)
+from fbi_directory_check.utils.scan_stats import (add_stats_argument,
+                                                  scan_stats_from_args)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+INGEST_ROUTING_KEY = 'elasticsearch_update_queue_opensearch_ingest'
+TAG_ROUTING_KEY = 'opensearch.tagger.cci'
 
 
 class RabbitMQConnection(object):
@@ -34,6 +51,9 @@ class RabbitMQConnection(object):
         # Get the opensearch exchange
         self.opensearch_exchange = self.conf.get('server', 'opensearch_exchange')
 
+        # Only loaded when publishing
+        import pika
+
         # Start the rabbitMQ connection
         connection = pika.BlockingConnection(
             pika.ConnectionParameters(
@@ -62,22 +82,24 @@ class RabbitMQConnection(object):
         :param action: Action constant
         :return: string which matches deposit log format
         """
-        time = datetime.now().isoformat(sep='-')
+        with stage('encode'):
+            time = datetime.now().isoformat(sep='-')
 
-        return json.dumps({
-            'datetime': time,
-            'filepath': path,
-            'action': action.upper(),
-            'filesize': 0,
-            'message': ''
-        })
+            return json.dumps({
+                'datetime': time,
+                'filepath': path,
+                'action': action.upper(),
+                'filesize': 0,
+                'message': ''
+            })
 
     def publish_message(self, msg, routing_key=''):
-        self.channel.basic_publish(
-            exchange=self.opensearch_exchange,
-            routing_key=routing_key,
-            body=msg
-        )
+        with metrics.timer('publish'):
+            self.channel.basic_publish(
+                exchange=self.opensearch_exchange,
+                routing_key=routing_key,
+                body=msg
+            )
 
 
 def get_args():
@@ -92,30 +114,68 @@ def get_args():
                         help='Add this flag to only send to tag queue. '
                              'Use this if the files are present but need to rescan for opensearch tags.')
     parser.add_argument('--conf', help='Optional path to configuration file', default=default_config)
+    parser.add_argument('--metrics-file', dest='metrics_file', default=None,
+                        help='Write Prometheus metrics for the scan to this file.')
+    parser.add_argument('--progress-interval', dest='progress_interval', type=float, default=10,
+                        help='Seconds between progress summaries')
+    parser.add_argument('--routing-key', dest='routing_key', default=None,
+                        help='Routing key for the published messages. Overrides -t')
+    add_stats_argument(parser)
+    add_prune_arguments(parser)
+    add_mount_health_arguments(parser)
+    add_profile_argument(parser)
 
     return parser.parse_args()
 
 
 def main():
 
+    configure_logging()
+
     args = get_args()
 
-    output_files = []
+    with profiling(args.profile):
+        file_count = rescan(args, mount_health=mount_health_from_args(args), scan_stats=scan_stats_from_args(args),
+                            prune=prune_rules_from_args(args, conf=args.conf))
+
+    print(f'Found and submitted {file_count} files.')
+
+
+def rescan(args, rabbit_connection=None, progress=None, mount_health=None, scan_stats=None, prune=None):
+    """
+    Publish a DEPOSIT message for each file under args.dir
+
+    :param args: Arguments as given by get_args
+    :param rabbit_connection: Open RabbitMQConnection. One is made from
+        args.conf if not given
+    :param progress: ProgressLog to count the files with
+    :param mount_health: MountHealth checked before and during the walk
+    :param scan_stats: ScanStats to estimate progress from and record the
+        scan in
+    :param prune: PruneRules for the directories not walked
+    :return: Number of files submitted
+    """
+
+    if mount_health is not None and not mount_health.check(args.dir):
+        raise OSError(f'{args.dir} is on an unhealthy mount')
 
     if not os.path.exists(args.dir):
         raise OSError(f'{args.dir} is not accessible')
 
     # Check for tags only flag
-    if args.tag:
-        routing_key='opensearch.tagger.cci'
+    if args.routing_key:
+        routing_key = args.routing_key
+    elif args.tag:
+        routing_key = TAG_ROUTING_KEY
     else:
-        routing_key='elasticsearch_update_queue_opensearch_ingest'
+        routing_key = INGEST_ROUTING_KEY
 
     # Get the full path
     abs_root = os.path.abspath(args.dir)
 
     # Submit items to rabbit queue for processing
-    rabbit_connection = RabbitMQConnection(args.conf)
+    if rabbit_connection is None:
+        rabbit_connection = RabbitMQConnection(args.conf)
 
     # If -r flag, walk the whole tree, if not walk only the immediate directory
     if args.recursive:
@@ -124,18 +184,41 @@ def main():
         max_depth = 1
 
     file_count = 0
+    if progress is None:
+        progress = ProgressLog(logger, 'files submitted', interval=args.progress_interval)
+
+    kind = 'opensearch-r' if args.recursive else 'opensearch'
+    if scan_stats is not None:
+        expected = scan_stats.expected(abs_root, kind)
+        if expected is not None:
+            progress.expect(expected['files'])
+
+    walk = walk_storage_links(abs_root, max_depth=max_depth, mount_health=mount_health, prune=prune)
 
-    for root, dirs, files in walk_storage_links(abs_root, max_depth=max_depth):
+    for root, dirs, files in metrics.timed(walk, 'walk'):
+        progress.directory()
         for file in files:
             # Ignore hidden files
-            if not os.path.basename(file).startswith('.'):
+            with stage('filter'):
+                hidden = os.path.basename(file).startswith('.')
+            if not hidden:
                 # Submit items to rabbit queue for processing during recursion
                 msg = rabbit_connection.create_message(os.path.join(root, file), DEPOSIT)
                 rabbit_connection.publish_message(msg, routing_key=routing_key)
                 
                 file_count += 1
+                metrics.inc('fbi_files_found_total', action=DEPOSIT)
+                progress.update()
 
-    print(f'Found and submitted {file_count} files.')
+    progress.done()
+
+    if scan_stats is not None:
+        scan_stats.record(abs_root, kind, progress.elapsed(), file_count, progress.directories)
+
+    if args.metrics_file:
+        metrics.write_textfile(args.metrics_file)
+
+    return file_count
 
 if __name__ == '__main__':
     main()
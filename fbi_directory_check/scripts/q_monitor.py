@@ -1,6 +1,7 @@
 # encoding: utf-8
 """
-
+Report the state of the local queues. The databases are opened read-only
+so the monitor can be left running alongside the consistency checker.
 """
 __author__ = 'Richard Smith'
 __date__ = '09 Jul 2019'
@@ -8,33 +9,179 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
+import argparse
+import json
 import os
+import time
 
-import persistqueue
 from six.moves.configparser import RawConfigParser
 
+from fbi_directory_check import configure_logging
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 profiling, stage)
+from fbi_directory_check.utils.queues import (ACK_TABLE, QUEUE_DIRS, AckStatus,
+                                              connect_readonly, queue_counts,
+                                              queue_db_path)
+
+
+def get_args():
+    default_config = os.path.join(os.path.dirname(__file__), '../conf/index_updater.ini')
+
+    parser = argparse.ArgumentParser(description='Display the number of directories in the local queues')
+
+    parser.add_argument('--conf', type=str, default=default_config, help='Optional path to configuration file')
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help='Report every SECONDS with rates and an estimated time to drain each queue')
+    parser.add_argument('--json', action='store_true', help='Print one JSON object per queue per report')
+    add_profile_argument(parser)
+
+    return parser.parse_args()
+
+
+def snapshot(path):
+    """
+    Read the state of one queue database
+
+    :param path: Path to the queue database
+    :return: dict of counts, the total ever enqueued, the timestamp of the
+        oldest waiting item and the time the snapshot was taken
+    """
+    state = {'ready': 0, 'unack': 0, 'acked': 0, 'failed': 0, 'enqueued': 0, 'oldest': None}
+
+    if os.path.exists(path):
+        conn = connect_readonly(path)
+        try:
+            state.update(queue_counts(conn))
+
+            # AUTOINCREMENT ids are never reused so the sequence counts every
+            # item ever put, including those since purged
+            row = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (ACK_TABLE,)).fetchone()
+            state['enqueued'] = row[0] if row else 0
+
+            row = conn.execute(
+                f'SELECT timestamp FROM {ACK_TABLE} WHERE status IN (?, ?) ORDER BY _id LIMIT 1',
+                (int(AckStatus.inited), int(AckStatus.ready))
+            ).fetchone()
+            state['oldest'] = row[0] if row else None
+        finally:
+            conn.close()
+
+    state['time'] = time.time()
+    return state
+
+
+def summarise(queue, current, previous=None):
+    """
+    Build the report for one queue
+
+    :param queue: Queue name
+    :param current: Latest snapshot
+    :param previous: Snapshot from the last report, needed for rates
+    :return: dict
+    """
+    dequeued = current['enqueued'] - current['ready']
+
+    report = {
+        'queue': queue,
+        'time': round(current['time'], 3),
+        'ready': current['ready'],
+        'in_flight': current['unack'],
+        'unacked': current['ready'] + current['unack'],
+        'failed': current['failed'],
+        'enqueued': current['enqueued'],
+        'dequeued': dequeued,
+        'oldest_age': round(current['time'] - current['oldest'], 1) if current['oldest'] is not None else None,
+        'enqueue_rate': None,
+        'dequeue_rate': None,
+        'eta': None,
+    }
+
+    if previous:
+        elapsed = current['time'] - previous['time']
+        if elapsed > 0:
+            enqueue_rate = (current['enqueued'] - previous['enqueued']) / elapsed
+            dequeue_rate = (dequeued - (previous['enqueued'] - previous['ready'])) / elapsed
+            report['enqueue_rate'] = round(enqueue_rate, 3)
+            report['dequeue_rate'] = round(dequeue_rate, 3)
+
+            drain_rate = dequeue_rate - enqueue_rate
+            if not current['ready']:
+                report['eta'] = 0
+            elif drain_rate > 0:
+                report['eta'] = round(current['ready'] / drain_rate, 1)
+
+    return report
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '-'
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return f'{seconds / size:.1f}{unit}'
+    return f'{seconds:.0f}s'
+
+
+def format_report(report):
+    line = (
+        f'{report["queue"]:<13} ready={report["ready"]} in_flight={report["in_flight"]} '
+        f'unacked={report["unacked"]} failed={report["failed"]} '
+        f'oldest={format_duration(report["oldest_age"])}'
+    )
+
+    if report['enqueue_rate'] is not None:
+        line += (
+            f' in={report["enqueue_rate"]:.2f}/s out={report["dequeue_rate"]:.2f}/s'
+            f' eta={format_duration(report["eta"])}'
+        )
+
+    return line
+
 
 def main():
-    base = os.path.dirname(__file__)
-    default_config = os.path.join(base, '../conf/index_updater.ini')
+
+    configure_logging()
+
+    args = get_args()
+
+    # Watch mode runs until stopped so also write the profile on SIGUSR1
+    with profiling(args.profile, dump_on_signal=bool(args.watch)):
+        monitor(args)
+
+
+def monitor(args):
 
     conf = RawConfigParser()
-    conf.read(default_config)
+    conf.read(args.conf)
 
     db_location = conf.get('local-queue', 'queue-location')
+    paths = {queue: queue_db_path(db_location, queue) for queue in QUEUE_DIRS}
 
-    # Setup local queues
-    manual_queue = persistqueue.SQLiteAckQueue(
-        os.path.join(db_location, 'priority')
-    )
-    bot_queue = persistqueue.SQLiteAckQueue(
-        os.path.join(db_location, 'bot')
-    )
+    if not args.watch and not args.json:
+        manual_qsize = snapshot(paths['manual_queue'])['ready']
+        bot_qsize = snapshot(paths['bot_queue'])['ready']
+
+        print("Crawler Queue Size: {} User Submitted Queue Size: {}".format(bot_qsize, manual_qsize))
+        return
+
+    previous = {}
+    try:
+        while True:
+            for queue, path in paths.items():
+                with stage('queue_read'):
+                    current = snapshot(path)
+                report = summarise(queue, current, previous.get(queue))
+                previous[queue] = current
+
+                print(json.dumps(report) if args.json else format_report(report), flush=True)
+
+            if not args.watch:
+                return
 
-    manual_qsize = manual_queue._count()
-    bot_qsize = bot_queue._count()
+            time.sleep(args.watch)
 
-    print ("Crawler Queue Size: {} User Submitted Queue Size: {}".format(bot_qsize, manual_qsize))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == '__main__':
@@ -0,0 +1,198 @@
+# encoding: utf-8
+"""
+Maintenance of the local SQLite queues used by the consistency checker.
+
+Purges acknowledged items, checkpoints the write ahead log and vacuums
+fragmented databases. Deletes are made in small batches with a busy
+timeout so that the checker can keep using the queues while this runs.
+VACUUM locks the database for its whole run, so the checker waits on it
+for up to its own busy timeout, and a step which cannot get its lock in
+time is skipped rather than retried.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import os
+import sqlite3
+import time
+
+from six.moves.configparser import RawConfigParser
+
+from fbi_directory_check import configure_logging
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 profiling)
+from fbi_directory_check.utils.queues import (ACK_TABLE, QUEUE_DIRS,
+                                              QUEUE_PRAGMAS, AckStatus,
+                                              is_busy_error, queue_counts,
+                                              queue_db_path)
+
+
+def get_args():
+    default_config = os.path.join(os.path.dirname(__file__), '../conf/index_updater.ini')
+
+    parser = argparse.ArgumentParser(description='Purge acknowledged items from the local queues, '
+                                                 'checkpoint and vacuum the databases.')
+
+    parser.add_argument('--conf', type=str, default=default_config, help='Optional path to configuration file')
+    parser.add_argument('--queue', choices=list(QUEUE_DIRS), action='append',
+                        help='Queue to maintain. Defaults to all queues')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='Number of acknowledged items deleted per transaction')
+    parser.add_argument('--purge-failed', action='store_true',
+                        help='Also purge items which were marked as failed')
+    parser.add_argument('--vacuum-ratio', type=float, default=0.2,
+                        help='Vacuum when at least this fraction of the database pages are free')
+    parser.add_argument('--force-vacuum', action='store_true', help='Always vacuum')
+    parser.add_argument('--busy-timeout', type=float, default=60,
+                        help='Seconds to wait for the checker to release a lock')
+    add_profile_argument(parser)
+
+    return parser.parse_args()
+
+
+def db_size(path):
+    """
+    :return: Size in bytes of the database and its write ahead log
+    """
+    size = 0
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            size += os.path.getsize(path + suffix)
+        except OSError:
+            pass
+    return size
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TB'
+
+
+def queue_stats(conn):
+    """
+    :return: dict of item counts by status and page usage
+    """
+    stats = queue_counts(conn)
+    stats['pages'] = conn.execute('PRAGMA page_count').fetchone()[0]
+    stats['free_pages'] = conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+    return stats
+
+
+def purge(conn, statuses, batch_size):
+    """
+    Delete items with the given statuses in batches so the checker is only
+    locked out for one short transaction at a time.
+
+    :return: Number of items deleted
+    """
+    placeholders = ','.join('?' * len(statuses))
+    sql = (
+        f'DELETE FROM {ACK_TABLE} WHERE _id IN ('
+        f'SELECT _id FROM {ACK_TABLE} WHERE status IN ({placeholders}) LIMIT ?)'
+    )
+
+    deleted = 0
+    while True:
+        with conn:
+            cur = conn.execute(sql, (*statuses, batch_size))
+        deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            return deleted
+
+
+def timed(label, func, *args):
+    """
+    Run a step and report how long it took. Steps which cannot get a lock
+    before the busy timeout are skipped.
+
+    :return: Result of the step, or None if skipped
+    """
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    except sqlite3.OperationalError as e:
+        if not is_busy_error(e):
+            raise
+        print(f'  {label:<12} skipped ({e})')
+        return None
+    print(f'  {label:<12} {time.perf_counter() - start:8.3f}s')
+    return result
+
+
+def maintain(path, args):
+    """
+    Run all maintenance steps on one queue database
+
+    :param path: Path to the queue database
+    :param args: Command line arguments
+    """
+    conn = sqlite3.connect(path, timeout=args.busy_timeout)
+
+    before_size = db_size(path)
+    before = queue_stats(conn)
+
+    print(f'{path}')
+    print(f'  before       {format_size(before_size)} ready={before["ready"]} unack={before["unack"]} '
+          f'acked={before["acked"]} failed={before["failed"]}')
+
+    statuses = [int(AckStatus.acked)]
+    if args.purge_failed:
+        statuses.append(int(AckStatus.ack_failed))
+
+    deleted = timed('purge', purge, conn, statuses, args.batch_size) or 0
+
+    for pragma, value in QUEUE_PRAGMAS:
+        timed(pragma, conn.execute, f'PRAGMA {pragma}={value}')
+
+    timed('checkpoint', conn.execute, 'PRAGMA wal_checkpoint(TRUNCATE)')
+
+    stats = queue_stats(conn)
+    free_ratio = stats['free_pages'] / stats['pages'] if stats['pages'] else 0
+
+    if args.force_vacuum or free_ratio >= args.vacuum_ratio:
+        # VACUUM cannot run inside a transaction
+        conn.isolation_level = None
+        timed('vacuum', conn.execute, 'VACUUM')
+        timed('checkpoint', conn.execute, 'PRAGMA wal_checkpoint(TRUNCATE)')
+    else:
+        print(f'  vacuum       skipped ({free_ratio:.1%} free pages)')
+
+    after = queue_stats(conn)
+    conn.close()
+
+    print(f'  after        {format_size(db_size(path))} ready={after["ready"]} unack={after["unack"]} '
+          f'acked={after["acked"]} failed={after["failed"]} (purged {deleted})')
+
+
+def main():
+
+    configure_logging()
+
+    args = get_args()
+
+    conf = RawConfigParser()
+    conf.read(args.conf)
+
+    db_location = conf.get('local-queue', 'queue-location')
+
+    with profiling(args.profile):
+        for queue in args.queue or QUEUE_DIRS:
+            path = queue_db_path(db_location, queue)
+
+            if not os.path.exists(path):
+                print(f'{path} does not exist, skipping')
+                continue
+
+            maintain(path, args)
+
+
+if __name__ == '__main__':
+    main()
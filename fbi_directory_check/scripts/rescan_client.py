@@ -0,0 +1,219 @@
+# encoding: utf-8
+"""
+Thin client for the rescan daemon. Rescans are submitted to a running
+``fbi_rescan_daemon`` over its Unix socket or HTTP port, so nothing is
+walked or published by this process.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from typing import List, Optional
+from urllib.parse import urlparse
+
+
+def default_socket() -> str:
+    """
+    :return: Socket in the user's runtime directory, or in a directory of
+        their own under the temporary directory
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir:
+        runtime_dir = os.path.join(tempfile.gettempdir(), f'fbi_rescan-{os.getuid()}')
+    return os.path.join(runtime_dir, 'fbi_rescan.sock')
+
+
+# Socket the daemon listens on by default
+DEFAULT_SOCKET = default_socket()
+
+# States after which a rescan does not change
+FINISHED = ('done', 'failed')
+
+
+class RescanError(Exception):
+    """Raised when the daemon rejects a request"""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a Unix socket
+
+    :param socket_path: Path to the socket
+    :param timeout: Socket timeout in seconds
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30) -> None:
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RescanClient:
+    """
+    :param address: Path to the daemon's Unix socket or an http:// URL
+    :param timeout: Socket timeout in seconds
+    """
+
+    def __init__(self, address: str = DEFAULT_SOCKET, timeout: float = 30) -> None:
+        self.address = address
+        self.timeout = timeout
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.address.startswith('http://'):
+            url = urlparse(self.address)
+            return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=self.timeout)
+        return UnixHTTPConnection(self.address, timeout=self.timeout)
+
+    def _request(self, method: str, path: str, body: Optional[dict] = None):
+        conn = self._connection()
+        try:
+            headers = {}
+            data = None
+            if body is not None:
+                data = json.dumps(body).encode('utf-8')
+                headers['Content-Type'] = 'application/json'
+
+            conn.request(method, path, body=data, headers=headers)
+            response = conn.getresponse()
+            result = json.loads(response.read() or b'null')
+        finally:
+            conn.close()
+
+        if response.status >= 400:
+            raise RescanError(result.get('error') if isinstance(result, dict) else response.reason)
+
+        return result
+
+    def submit(self, path: str, **request) -> dict:
+        """
+        :param path: Directory to rescan or manifest with scan_level 3
+        :param request: Other request fields, see fbi_rescan_daemon
+        :return: Status of the queued rescan
+        """
+        return self._request('POST', '/rescans', dict(request, path=os.path.abspath(path)))
+
+    def status(self, rescan_id: str) -> dict:
+        return self._request('GET', f'/rescans/{rescan_id}')
+
+    def list(self) -> List[dict]:
+        return self._request('GET', '/rescans')
+
+    def health(self) -> dict:
+        return self._request('GET', '/health')
+
+    def wait(self, rescan_id: str, poll: float = 1, timeout: Optional[float] = None) -> dict:
+        """
+        Wait for a rescan to finish
+
+        :param rescan_id: Id returned by submit
+        :param poll: Seconds between status requests
+        :param timeout: Longest time to wait in seconds
+        :return: Final status
+        :raises TimeoutError: if the rescan has not finished in time
+        """
+        endtime = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            status = self.status(rescan_id)
+            if status['state'] in FINISHED:
+                return status
+
+            if endtime is not None and time.monotonic() >= endtime:
+                raise TimeoutError(f'Rescan {rescan_id} still {status["state"]}')
+
+            time.sleep(poll)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Submit a rescan to the rescan daemon and print its status as JSON')
+
+    parser.add_argument('dir', nargs='?', help='Directory to scan, or with -l 3 a file manifest readable by the daemon')
+    parser.add_argument('-r', dest='recursive', action='store_true',
+                        help='Recursive. Will include all directories below this point as well')
+    parser.add_argument('-l', '--scan-level', type=int, dest='scan_level', default=2,
+                        help='1 to read datasets from the JSON files under dir, 2 to walk dir, '
+                             '3 to read the paths from a manifest (default 2)')
+    parser.add_argument('--file-regex', dest='file_regex', help='Matching file regex')
+    parser.add_argument('--extension', help='Matching files by file extension')
+    parser.add_argument('--routing-key', dest='routing_key', help='Routing key for the published messages')
+    parser.add_argument('--opensearch', action='store_true',
+                        help='Publish to the opensearch exchange as opensearch_rescan_dir does')
+    parser.add_argument('-t', '--tag-only', dest='tag_only', action='store_true',
+                        help='With --opensearch, only send to the tag queue')
+    parser.add_argument('--dry-run', dest='dryrun', action='store_true', help='Count the files without publishing')
+    parser.add_argument('--snapshot', help='Only publish the changes since the snapshot in this file, '
+                                           'see fbi_rescan_dir --snapshot')
+    parser.add_argument('--wait', action='store_true',
+                        help='Wait for the rescan to finish. Exits non-zero if it fails')
+    parser.add_argument('--status', metavar='ID', help='Print the status of a rescan')
+    parser.add_argument('--list', action='store_true', help='Print the status of recent rescans')
+    parser.add_argument('--address', default=os.environ.get('FBI_RESCAN_ADDRESS', DEFAULT_SOCKET),
+                        help='Daemon Unix socket or http:// URL (default: $FBI_RESCAN_ADDRESS or %(default)s)')
+
+    args = parser.parse_args()
+
+    if not (args.dir or args.status or args.list):
+        parser.error('a directory, --status or --list is required')
+
+    return args
+
+
+def main():
+
+    args = get_args()
+    client = RescanClient(args.address)
+
+    try:
+        if args.list:
+            for status in client.list():
+                print(json.dumps(status))
+            return
+
+        if args.status:
+            status = client.status(args.status)
+        else:
+            request = {
+                'target': 'opensearch' if args.opensearch else 'fbi',
+                'scan_level': args.scan_level,
+                'recursive': args.recursive,
+                'dryrun': args.dryrun,
+            }
+            if args.opensearch:
+                request['tag_only'] = args.tag_only
+            for key in ('file_regex', 'extension', 'routing_key'):
+                if getattr(args, key):
+                    request[key] = getattr(args, key)
+            if args.snapshot:
+                request['snapshot'] = os.path.abspath(args.snapshot)
+
+            status = client.submit(args.dir, **request)
+
+        if args.wait:
+            status = client.wait(status['id'])
+
+    except (OSError, RescanError) as e:
+        print(f'fbi_rescan_client: {e}', file=sys.stderr)
+        sys.exit(2)
+
+    print(json.dumps(status))
+
+    if status['state'] == 'failed':
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,544 @@
+# encoding: utf-8
+"""
+Long running service for rescans. Requests are accepted as JSON over a
+local Unix socket, and optionally a TCP port, and run concurrently on a pool
+of worker threads. Each worker keeps its RabbitMQ connections open between
+requests and mount health probes are cached for ``--mount-ttl`` seconds.
+
+API::
+
+    POST /rescans         Queue a rescan, returns its status
+    GET  /rescans         Status of recent rescans
+    GET  /rescans/<id>    Status of one rescan
+    GET  /health          Worker count and rescans in each state
+
+Rescan requests take the fields in REQUEST_FIELDS. ``path`` is required.
+
+Requests are not authenticated. The Unix socket is limited to its owner,
+or a group with ``--socket-mode``, and the TCP port is open to anyone who
+can reach it.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from fbi_directory_check import configure_logging, logstream
+from fbi_directory_check.scripts import opensearch_rescan_directory
+from fbi_directory_check.scripts.rescan_client import DEFAULT_SOCKET, FINISHED
+from fbi_directory_check.scripts.rescan_directory import (DEFAULT_ROUTING_KEY,
+                                                          RabbitMQConnection,
+                                                          RescanDirs)
+from fbi_directory_check.utils.mounts import (MountHealth,
+                                              add_mount_health_arguments,
+                                              mount_health_from_args)
+from fbi_directory_check.utils.profiling import add_profile_argument, profiling
+from fbi_directory_check.utils.progress import ProgressLog
+from fbi_directory_check.utils.prune import (PruneRules, add_prune_arguments,
+                                             prune_rules_from_args)
+from fbi_directory_check.utils.scan_stats import (ScanStats,
+                                                  add_stats_argument,
+                                                  scan_stats_from_args)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE, FAILED = FINISHED
+
+FBI = 'fbi'
+OPENSEARCH = 'opensearch'
+
+# Accepted request fields and their types
+REQUEST_FIELDS = {
+    'path': str,
+    'target': str,
+    'scan_level': int,
+    'recursive': bool,
+    'file_regex': str,
+    'extension': str,
+    'routing_key': str,
+    'tag_only': bool,
+    'dryrun': bool,
+    'snapshot': str,
+}
+
+
+def validate_request(request: dict) -> dict:
+    """
+    :param request: Rescan request
+    :return: Request with the defaults filled in
+    :raises ValueError: if the request is not valid
+    """
+    if not isinstance(request, dict):
+        raise ValueError('Request must be a JSON object')
+
+    unknown = set(request) - set(REQUEST_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+
+    for key, value in request.items():
+        if value is not None and not isinstance(value, REQUEST_FIELDS[key]):
+            raise ValueError(f'{key} must be {REQUEST_FIELDS[key].__name__}')
+
+    request = dict({'target': FBI, 'scan_level': 2, 'recursive': False, 'tag_only': False, 'dryrun': False},
+                   **{key: value for key, value in request.items() if value is not None})
+
+    if not request.get('path'):
+        raise ValueError('path is required')
+    if not os.path.isabs(request['path']):
+        raise ValueError('path must be absolute')
+    if request['target'] not in (FBI, OPENSEARCH):
+        raise ValueError(f'target must be {FBI} or {OPENSEARCH}')
+    if request['scan_level'] not in (1, 2, 3):
+        raise ValueError('scan_level must be 1, 2 or 3')
+    if request['target'] == OPENSEARCH and request['dryrun']:
+        raise ValueError('dryrun is only supported for the fbi target')
+    if request.get('snapshot'):
+        if request['target'] == OPENSEARCH:
+            raise ValueError('snapshot is only supported for the fbi target')
+        if not os.path.isabs(request['snapshot']):
+            raise ValueError('snapshot must be absolute')
+
+    return request
+
+
+@dataclass
+class Rescan:
+    """
+    State of one rescan request
+    """
+    id: str
+    request: dict
+    state: str = QUEUED
+    files: int = 0
+    error: Optional[str] = None
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    # Counts the files while running
+    progress: Optional[ProgressLog] = field(default=None, repr=False)
+
+    def as_dict(self) -> dict:
+        running = self.state == RUNNING and self.progress
+        status = {
+            'id': self.id,
+            'state': self.state,
+            'files': self.progress.count if running else self.files,
+            'error': self.error,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'request': self.request,
+        }
+
+        estimate = self.progress.estimate() if running else None
+        if estimate is not None:
+            status['expected'] = self.progress.expected
+            status['fraction'], status['eta'] = estimate
+
+        return status
+
+
+class RescanService:
+    """
+    Runs rescan requests on a pool of worker threads. pika connections are
+    not thread safe so each worker opens its own, once per target, and
+    keeps it for later requests.
+
+    :param conf: Configuration for the fbi exchange, as used by fbi_rescan_dir
+    :param opensearch_conf: Configuration for the opensearch exchange
+    :param workers: Number of rescans run at once
+    :param mount_health: MountHealth checked before and during each rescan
+    :param keep: Number of finished rescans kept for status requests
+    :param progress_interval: Seconds between progress summaries in the log
+    :param scan_stats: ScanStats to estimate progress from and record
+        finished rescans in
+    :param prune: PruneRules for the directories not walked
+    """
+
+    def __init__(self, conf: Optional[str] = None, opensearch_conf: Optional[str] = None,
+                 workers: int = 4, mount_health: Optional[MountHealth] = None,
+                 keep: int = 1000, progress_interval: float = 60,
+                 scan_stats: Optional[ScanStats] = None, prune: Optional[PruneRules] = None) -> None:
+        self.conf = conf
+        self.opensearch_conf = opensearch_conf
+        self.workers = workers
+        self.mount_health = mount_health
+        self.keep = keep
+        self.progress_interval = progress_interval
+        self.scan_stats = scan_stats
+        self.prune = prune
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='rescan')
+        self._lock = threading.Lock()
+        self._rescans: Dict[str, Rescan] = OrderedDict()
+
+        self._local = threading.local()
+        self._connections: List[RabbitMQConnection] = []
+
+    def submit(self, request: dict) -> Rescan:
+        """
+        :param request: Rescan request
+        :return: Queued rescan
+        :raises ValueError: if the request is not valid
+        """
+        rescan = Rescan(uuid.uuid4().hex, validate_request(request))
+        snapshot = rescan.request.get('snapshot')
+
+        with self._lock:
+            if snapshot and any(r.request.get('snapshot') == snapshot and r.state not in FINISHED
+                                for r in self._rescans.values()):
+                raise ValueError(f'A rescan using snapshot {snapshot} is already queued or running')
+
+            self._rescans[rescan.id] = rescan
+            self._prune()
+
+        self._executor.submit(self._run, rescan)
+        logger.info(f'Queued rescan {rescan.id}: {rescan.request}')
+        return rescan
+
+    def get(self, rescan_id: str) -> Optional[Rescan]:
+        with self._lock:
+            return self._rescans.get(rescan_id)
+
+    def list(self) -> List[Rescan]:
+        with self._lock:
+            return list(self._rescans.values())
+
+    def health(self) -> dict:
+        states = Counter(rescan.state for rescan in self.list())
+        unhealthy = self.mount_health.unhealthy() if self.mount_health is not None else []
+        return {'workers': self.workers, 'rescans': dict(states), 'unhealthy_mounts': unhealthy}
+
+    def _prune(self) -> None:
+        finished = [rescan_id for rescan_id, rescan in self._rescans.items() if rescan.state in FINISHED]
+        for rescan_id in finished[:max(len(finished) - self.keep, 0)]:
+            del self._rescans[rescan_id]
+
+    def _check_mount(self, path: str) -> None:
+        if self.mount_health is not None and not self.mount_health.check(path):
+            raise OSError(f'Mount {self.mount_health.mount_for(path)} is unhealthy')
+
+    def _connection(self, target: str) -> RabbitMQConnection:
+        """
+        :param target: fbi or opensearch
+        :return: This worker's connection for the target, reconnecting if it
+            was closed while idle
+        """
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        connection = connections.get(target)
+        if connection is not None:
+            try:
+                # Serve heartbeats missed while idle
+                connection.channel.connection.process_data_events(time_limit=0)
+                return connection
+            except Exception as e:
+                logger.warning(f'Reconnecting to RabbitMQ: {e!r}')
+                self._drop_connection(target)
+
+        if target == OPENSEARCH:
+            connection = opensearch_rescan_directory.RabbitMQConnection(self.opensearch_conf)
+        else:
+            if not self.conf:
+                raise ValueError('The daemon was started without --conf')
+            connection = RabbitMQConnection(self.conf)
+
+        connections[target] = connection
+        with self._lock:
+            self._connections.append(connection)
+
+        return connection
+
+    def _drop_connection(self, target: str) -> None:
+        connection = getattr(self._local, 'connections', {}).pop(target, None)
+        if connection is None:
+            return
+
+        with self._lock:
+            self._connections.remove(connection)
+
+        try:
+            connection.channel.connection.close()
+        except Exception:
+            pass
+
+    def _run(self, rescan: Rescan) -> None:
+        request = rescan.request
+        rescan.state = RUNNING
+        rescan.started = time.time()
+        rescan.progress = ProgressLog(logger, f'files processed by {rescan.id}', interval=self.progress_interval)
+
+        try:
+            self._check_mount(request['path'])
+
+            if request['target'] == OPENSEARCH:
+                args = argparse.Namespace(
+                    dir=request['path'],
+                    recursive=request['recursive'],
+                    tag=request['tag_only'],
+                    routing_key=request.get('routing_key'),
+                    conf=self.opensearch_conf,
+                    metrics_file=None,
+                    progress_interval=self.progress_interval
+                )
+                rescan.files = opensearch_rescan_directory.rescan(
+                    args, rabbit_connection=self._connection(OPENSEARCH), progress=rescan.progress,
+                    mount_health=self.mount_health, scan_stats=self.scan_stats, prune=self.prune
+                )
+            else:
+                rd = RescanDirs(
+                    request['path'],
+                    scan_level=request['scan_level'],
+                    use_rabbit=not request['dryrun'],
+                    conf=self.conf,
+                    dryrun=request['dryrun'],
+                    recursive=request['recursive'],
+                    file_regex=request.get('file_regex'),
+                    extension=request.get('extension'),
+                    progress_interval=self.progress_interval,
+                    routing_key=request.get('routing_key') or DEFAULT_ROUTING_KEY,
+                    rabbit_connection=None if request['dryrun'] else self._connection(FBI),
+                    mount_health=self.mount_health,
+                    snapshot=request.get('snapshot'),
+                    scan_stats=self.scan_stats,
+                    prune=self.prune
+                )
+                rd.scan(progress=rescan.progress)
+                rescan.files = rescan.progress.count
+
+            rescan.state = DONE
+            logger.info(f'Rescan {rescan.id} finished: {rescan.files} files')
+
+        except Exception as e:
+            rescan.files = rescan.progress.count
+            rescan.error = f'{type(e).__name__}: {e}'
+            rescan.state = FAILED
+            logger.error(f'Rescan {rescan.id} failed: {rescan.error}')
+
+            # The connection may be left part way through a publish
+            if not request['dryrun']:
+                self._drop_connection(request['target'])
+
+        finally:
+            rescan.finished = time.time()
+
+    def close(self) -> None:
+        """
+        Wait for running rescans and close the connections
+        """
+        self._executor.shutdown(wait=True)
+
+        for connection in self._connections:
+            try:
+                connection.channel.connection.close()
+            except Exception:
+                pass
+        self._connections.clear()
+
+
+class RescanHandler(BaseHTTPRequestHandler):
+    """
+    JSON API for a RescanService set on the server as ``service``
+    """
+
+    def _send(self, status: int, body) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        path = self.path.split('?')[0].rstrip('/')
+
+        if path == '/health':
+            self._send(200, service.health())
+        elif path == '/rescans':
+            self._send(200, [rescan.as_dict() for rescan in service.list()])
+        elif path.startswith('/rescans/'):
+            rescan = service.get(path[len('/rescans/'):])
+            if rescan is None:
+                self._send(404, {'error': 'Unknown rescan'})
+            else:
+                self._send(200, rescan.as_dict())
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path.split('?')[0].rstrip('/') != '/rescans':
+            self._send(404, {'error': 'Not found'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            rescan = self.server.service.submit(request)
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        self._send(202, rescan.as_dict())
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def bind_unix_socket(path: str, service: RescanService, mode: int = 0o600) -> UnixHTTPServer:
+    """
+    Listen on a Unix socket, removing it first if left behind by a daemon
+    which did not shut down. A missing directory is created for the owner
+    only.
+
+    :param path: Socket path
+    :param service: RescanService handling the requests
+    :param mode: Permissions of the socket
+    :raises OSError: if another daemon is listening on the socket or the
+        directory belongs to another user
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    # Another user could replace the socket
+    owner = os.stat(directory).st_uid
+    if owner not in (0, os.getuid()):
+        raise OSError(f'{directory} belongs to another user')
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+        else:
+            raise OSError(f'A rescan daemon is already listening on {path}')
+        finally:
+            probe.close()
+
+    # The socket is created without group or other access and only then
+    # given the requested mode
+    umask = os.umask(0o177)
+    try:
+        server = UnixHTTPServer(path, RescanHandler)
+    finally:
+        os.umask(umask)
+    os.chmod(path, mode)
+
+    server.service = service
+    return server
+
+
+def get_args():
+    default_config = os.path.join(os.path.dirname(__file__), '../conf/rabbit_updater.ini')
+    default_opensearch_config = os.path.join(os.path.dirname(__file__), '../conf/opensearch_updater.ini')
+
+    parser = argparse.ArgumentParser(description='Run rescans submitted by fbi_rescan_client with warm connections.')
+
+    parser.add_argument('--conf', default=default_config, help='Configuration for the fbi exchange')
+    parser.add_argument('--opensearch-conf', dest='opensearch_conf', default=default_opensearch_config,
+                        help='Configuration for the opensearch exchange')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='Unix socket to listen on (default: %(default)s)')
+    parser.add_argument('--socket-mode', dest='socket_mode', type=lambda mode: int(mode, 8), default=0o600,
+                        help='Permissions of the socket in octal, 660 to allow the group (default: 600)')
+    parser.add_argument('--http-port', dest='http_port', type=int, default=0,
+                        help='Also listen for HTTP on this port (0 to disable). '
+                             'Requests on the port are not authenticated')
+    parser.add_argument('--http-address', dest='http_address', default='127.0.0.1',
+                        help='Address to bind the HTTP port to (default: 127.0.0.1)')
+    parser.add_argument('--workers', type=int, default=4, help='Number of rescans run at once')
+    parser.add_argument('--keep', type=int, default=1000, help='Number of finished rescans kept for status requests')
+    parser.add_argument('--progress-interval', dest='progress_interval', type=float, default=60,
+                        help='Seconds between progress summaries for each rescan')
+    add_stats_argument(parser)
+    add_prune_arguments(parser)
+    add_mount_health_arguments(parser)
+    add_profile_argument(parser)
+
+    return parser.parse_args()
+
+
+def main():
+
+    configure_logging(logging.INFO)
+
+    args = get_args()
+
+    service = RescanService(
+        conf=args.conf,
+        opensearch_conf=args.opensearch_conf,
+        workers=args.workers,
+        mount_health=mount_health_from_args(args),
+        keep=args.keep,
+        progress_interval=args.progress_interval,
+        scan_stats=scan_stats_from_args(args),
+        prune=prune_rules_from_args(args, conf=args.conf)
+    )
+
+    servers = [bind_unix_socket(args.socket, service, mode=args.socket_mode)]
+    logger.info(f'Listening on {args.socket}')
+
+    if args.http_port:
+        server = ThreadingHTTPServer((args.http_address, args.http_port), RescanHandler)
+        server.service = service
+        servers.append(server)
+        logger.info(f'Listening on http://{args.http_address}:{server.server_port}')
+        logger.warning('Requests on the HTTP port are not authenticated')
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    with profiling(args.profile, dump_on_signal=True):
+        for server in servers:
+            threading.Thread(target=server.serve_forever, name='rescan-http', daemon=True).start()
+
+        try:
+            while not stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+
+        logger.info('Shutting down, waiting for running rescans')
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        service.close()
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
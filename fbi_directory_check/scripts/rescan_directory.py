@@ -17,18 +17,34 @@ import re
 from datetime import datetime
 from typing import Union
 
-import pika
 from six.moves.configparser import RawConfigParser
 
-from fbi_directory_check import logstream
-from fbi_directory_check.utils import (check_timeout, set_verbose,
+from fbi_directory_check import TRACE, configure_logging, logstream
+from fbi_directory_check.utils import (STORAGE_PREFIX, set_verbose,
                                        walk_storage_links)
-from fbi_directory_check.utils.constants import DEPOSIT, MKDIR, README, SYMLINK
+from fbi_directory_check.utils.constants import (DEPOSIT, MKDIR, README,
+                                                 REMOVE, SYMLINK)
+from fbi_directory_check.utils.manifest import STDIN, iter_manifest
+from fbi_directory_check.utils.metrics import metrics
+from fbi_directory_check.utils.mounts import (MountHealth,
+                                              add_mount_health_arguments,
+                                              mount_health_from_args)
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 profiling, stage)
+from fbi_directory_check.utils.progress import ProgressLog
+from fbi_directory_check.utils.prune import (PruneRules, add_prune_arguments,
+                                             prune_rules_from_args)
+from fbi_directory_check.utils.scan_stats import (ScanStats,
+                                                  add_stats_argument,
+                                                  scan_stats_from_args)
+from fbi_directory_check.utils.snapshot import SnapshotDelta, stat_entry
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logstream)
 logger.propagate = False
 
+DEFAULT_ROUTING_KEY = 'elasticsearch_update_queue_opensearch_ingest'
+
 
 class RabbitMQConnection:
     """
@@ -56,6 +72,9 @@ class RabbitMQConnection:
         # Get the fbi exchange
         self.exchange = self.conf.get('server','exchange')
 
+        # Only loaded when publishing
+        import pika
+
         # Start the rabbitMQ connection
         connection = pika.BlockingConnection(
             pika.ConnectionParameters(
@@ -84,15 +103,16 @@ class RabbitMQConnection:
         :param action: Action constant
         :return: string which matches deposit log format
         """
-        time = datetime.now().isoformat(sep='-')
+        with stage('encode'):
+            time = datetime.now().isoformat(sep='-')
 
-        return json.dumps({
-            'datetime': time,
-            'filepath': path,
-            'action': action.upper(),
-            'filesize': 0,
-            'message': ''
-        })
+            return json.dumps({
+                'datetime': time,
+                'filepath': path,
+                'action': action.upper(),
+                'filesize': 0,
+                'message': ''
+            })
 
     def publish_message(self, msg: str, routing_key: str = ''):
         self.channel.basic_publish(
@@ -160,7 +180,17 @@ class RescanDirs:
             recursive: bool = False,
             file_regex: Union[str,None] = None,
             extension: Union[str,None] = None,
-            output: str = None
+            output: str = None,
+            metrics_file: Union[str,None] = None,
+            storage_prefix: str = STORAGE_PREFIX,
+            profile: Union[str,None] = None,
+            progress_interval: float = 10,
+            routing_key: str = DEFAULT_ROUTING_KEY,
+            rabbit_connection: Union['RabbitMQConnection',None] = None,
+            mount_health: Union[MountHealth,None] = None,
+            snapshot: Union[str,None] = None,
+            scan_stats: Union[ScanStats,None] = None,
+            prune: Union[PruneRules,None] = None
         ) -> None:
 
         if scan_path == '':
@@ -186,11 +216,40 @@ class RescanDirs:
         self._dryrun = dryrun
         self._recursive = recursive
         self._output = output
+        self._metrics_file = metrics_file
+        self._storage_prefix = storage_prefix
+        self._progress_interval = progress_interval
+        self.profile = profile
 
         self.skip_dirs = skip_dirs
         self.skip_files = skip_files
 
-        self.routing_key = 'elasticsearch_update_queue_opensearch_ingest'
+        self.routing_key = routing_key
+
+        # Connection shared with other scans, e.g. by the rescan daemon
+        self.rabbit_connection = rabbit_connection
+
+        # Progress of the current scan
+        self.progress = None
+
+        # Mounts known to be hung are not scanned
+        self.mount_health = mount_health
+
+        # Only changes since the snapshot are published
+        self.snapshot = snapshot
+        if snapshot and not use_rabbit and not dryrun:
+            raise ValueError(
+                'A snapshot (--snapshot) needs rabbit (-R) or --dry-run, as removals are only published to rabbit'
+            )
+
+        # Paths the walk could not see, carried forward in the snapshot
+        self.skipped = set()
+
+        # Earlier scans of the tree give the progress of this one
+        self.scan_stats = scan_stats
+
+        # Directories which are not walked
+        self.prune = prune
 
     @property
     def file_regex(self):
@@ -224,22 +283,24 @@ class RescanDirs:
         default_config = os.path.join(os.path.dirname(__file__), '../conf/rabbit_updater.ini')
 
         parser = argparse.ArgumentParser(description='Submit directories/items to be re-scanned.')
-        parser.add_argument('dir', type=str, help='Directory to scan')
+        parser.add_argument('dir', type=str, help='Directory to scan, or with -l 3 a file manifest (- for stdin)')
         parser.add_argument('-r', dest='recursive', action='store_true',
                             help='Recursive. Will include all directories below this point as well')
 
         parser.add_argument('-l','--scan-level',type=int, dest='scan_level',
-                            help='Level of depth for scanning (1,2,3)')
+                            help='1 to read datasets from the JSON files under dir, 2 to walk dir, '
+                                 '3 to read the paths from a manifest of one path per line, '
+                                 'plain or gzipped, e.g. from lfs find or a previous --output')
         parser.add_argument('-R','--use-rabbit',dest='use_rabbit',
                             help='Deposit to rabbit queues or return list of paths')
-        parser.add_argument('-v','--verbose', action='count', default=2, help='Set level of verbosity for logs')
+        parser.add_argument('-v','--verbose', action='count', default=2, help='Set level of verbosity for logs. -v logs every file')
 
         #parser.add_argument('--no-files', dest='nofiles', action='store_true', help='Ignore files')
         
         # Removed the ability to publish whole directories
         #parser.add_argument('--no-dirs', dest='nodirs', action='store_true', help='Ignore directories')
         parser.add_argument('--conf', type=str, default=default_config, help='Optional path to configuration file')
-        parser.add_argument('--dry-run', dest='dryrun', action='store_true', help='Display log messages to screen rather than pushing to rabbit')
+        parser.add_argument('--dry-run', dest='dryrun', action='store_true', help='Count the files rather than pushing to rabbit. Add -v to log each file')
 
         parser.add_argument('-o','--output',dest='output', help='Store output list in a file.')
 
@@ -248,6 +309,20 @@ class RescanDirs:
                             default=None)
         parser.add_argument('--extension', dest='extension', 
                             help='Matching files by file extension.', default=None)
+        parser.add_argument('--metrics-file', dest='metrics_file', default=None,
+                            help='Write Prometheus metrics for the scan to this file.')
+        parser.add_argument('--progress-interval', dest='progress_interval', type=float, default=10,
+                            help='Seconds between progress summaries. Use -v for a message per file')
+        parser.add_argument('--routing-key', dest='routing_key', default=DEFAULT_ROUTING_KEY,
+                            help=f'Routing key for the published messages (default: {DEFAULT_ROUTING_KEY})')
+        parser.add_argument('--snapshot', dest='snapshot', default=None,
+                            help='Compare with the snapshot of the previous scan in this file and only publish '
+                                 'new or changed files, and REMOVE for files which have gone. '
+                                 'The snapshot is replaced when the scan finishes')
+        add_stats_argument(parser)
+        add_prune_arguments(parser)
+        add_mount_health_arguments(parser)
+        add_profile_argument(parser)
         args = parser.parse_args()
 
         set_verbose(args.verbose)
@@ -261,7 +336,15 @@ class RescanDirs:
             recursive=args.recursive,
             file_regex=args.file_regex,
             output=args.output,
-            extension=args.extension
+            extension=args.extension,
+            metrics_file=args.metrics_file,
+            profile=args.profile,
+            progress_interval=args.progress_interval,
+            routing_key=args.routing_key,
+            mount_health=mount_health_from_args(args),
+            snapshot=args.snapshot,
+            scan_stats=scan_stats_from_args(args),
+            prune=prune_rules_from_args(args, conf=args.conf)
         )
 
     def _setup_rabbit(self):
@@ -279,10 +362,60 @@ class RescanDirs:
         All checks in relation to filepath should be checked
         before this stage.
         """
-        logger.info(f'Depositing {item} to Rabbit')
+        logger.log(TRACE, 'Depositing %s to Rabbit', item, extra={'path': item, 'action': itype})
 
         msg = self.rabbit_connection.create_message(item, itype) #Deposit
-        self.rabbit_connection.publish_message(msg, routing_key=self.routing_key) #'opensearch.tagger.cci')
+        with metrics.timer('publish'):
+            self.rabbit_connection.publish_message(msg, routing_key=self.routing_key) #'opensearch.tagger.cci')
+
+    def _manifest_paths(self):
+        """
+        Stream the paths in the manifest at scan_path which match the
+        file regex. Nothing is walked so the manifest can come from any
+        listing tool.
+        """
+        logger.info(f'Reading manifest: {self.scan_path}')
+
+        file_regex = re.compile(self.file_regex)
+        skipped = 0
+
+        for path in iter_manifest(self.scan_path):
+            with stage('filter'):
+                matched = file_regex.match(os.path.basename(path))
+            if not matched:
+                continue
+
+            if self.mount_health is not None and not self.mount_health.check(path):
+                skipped += 1
+                continue
+
+            yield path
+
+        if skipped:
+            logger.warning(f'Skipped {skipped} paths on unhealthy mounts')
+
+    def _walk_paths(self):
+        """
+        Stream the paths under scan_path which match the file regex
+        """
+        logger.info('Scanning directories')
+
+        file_regex = re.compile(self.file_regex)
+
+        for root, dirs, files in walk_storage_links(self.scan_path, max_depth=self.max_depth,
+                                                     storage_prefix=self._storage_prefix,
+                                                     mount_health=self.mount_health, prune=self.prune,
+                                                     skipped=self.skipped):
+            if self.progress is not None:
+                self.progress.directory()
+
+            for file in files:
+                with stage('filter'):
+                    matched = file_regex.match(file)
+                if not matched:
+                    continue
+
+                yield f'{root}/{file}'
 
     def _determine_paths(self):
         """
@@ -291,19 +424,16 @@ class RescanDirs:
 
         This is either based on a file path, gathering
         all files under a directory (with a given regex),
-        or based on a submission of JSON files.
+        a submission of JSON files or a file manifest.
         """
 
         scan_files = []
 
-        if self.scan_level == 2: # All files under a directory
-            logger.info('Scanning directories')
-            for root, dirs, files in walk_storage_links(self.scan_path, max_depth=self.max_depth):
-                for file in files:
-                    if not re.match(self.file_regex, file):
-                        continue
+        if self.scan_level == 3:
+            scan_files = list(self._manifest_paths())
 
-                    scan_files.append(f'{root}/{file}')
+        elif self.scan_level == 2: # All files under a directory
+            scan_files = list(self._walk_paths())
 
         else:
             # Pull files from json
@@ -330,8 +460,14 @@ class RescanDirs:
 
                 dfiles = []
                 for ds_count, d in enumerate(ds):
+                    if self.mount_health is not None and not self.mount_health.check(d):
+                        logger.warning(f'Skipping {d}: mount {self.mount_health.mount_for(d)} is unhealthy')
+                        continue
+
                     # Find all single files
-                    dfiles = [f for f in glob.glob(f'{d}/**/*.*', recursive=True) if re.match(self.file_regex,f)]
+                    found = glob.glob(f'{d}/**/*.*', recursive=True)
+                    with stage('filter'):
+                        dfiles = [f for f in found if re.match(self.file_regex,f)]
                     scan_files += dfiles
 
                     logger.info(f'(j: {js_count+1}/{len(jsons)}, d: {ds_count+1}/{len(ds)})')
@@ -339,37 +475,147 @@ class RescanDirs:
 
         return scan_files
 
-    def scan(self) -> list:
-        output_files = 0
+    @property
+    def snapshot_scope(self) -> dict:
+        """
+        Settings which decide the files found, recorded with the snapshot.
+        Pruned directories are not part of it as their entries are carried
+        forward, so patterns and ignore files can change between scans.
+        """
+        return {
+            'scan_path': self.scan_path if self.scan_path == STDIN else os.path.abspath(self.scan_path),
+            'scan_level': self.scan_level,
+            'recursive': self._recursive,
+            'file_regex': self.file_regex,
+            'storage_prefix': self._storage_prefix,
+        }
+
+    @property
+    def stats_kind(self) -> str:
+        """
+        Type of scan the statistics are kept under, as only scans of the
+        same kind find the same files
+        """
+        kind = f'fbi-l{self.scan_level}'
+        if self._recursive:
+            kind += '-r'
+        if self.file_regex != '.+':
+            kind += f' {self.file_regex}'
+        return kind
+
+    def _count_paths(self, paths):
+        # Counted as found rather than published so a snapshot delta,
+        # which only publishes after the walk, still shows progress
+        for path in paths:
+            self.progress.update()
+            yield path
+
+    def _stat_paths(self, paths):
+        for path in paths:
+            try:
+                with stage('stat'):
+                    entry = stat_entry(path)
+            except OSError as e:
+                logger.warning(f'Skipping {path}: {e}')
+                self.skipped.add(path)
+                continue
+            yield entry
 
-        if self.use_rabbit:
+    def scan(self, progress: Union[ProgressLog,None] = None) -> list:
+        """
+        :param progress: ProgressLog to count the files with
+        :return: Paths found when not publishing to rabbit
+        """
+        deposited = 0
+        removed = 0
+
+        if self.use_rabbit and self.rabbit_connection is None:
             self._setup_rabbit()
 
         deposit_paths = []
 
-        for path in self._determine_paths():
-            # Note the mkdir and symlink messages are no longer
-            # required as all files have been ingested separately.
+        progress = self.progress = progress or ProgressLog(logger, 'files processed',
+                                                           interval=self._progress_interval)
+
+        tree = self.snapshot_scope['scan_path']
+        if self.scan_stats is not None and tree != STDIN:
+            expected = self.scan_stats.expected(tree, self.stats_kind)
+            if expected is not None:
+                progress.expect(expected['files'])
+                logger.info(f'Expecting {expected["files"]} files in {expected["seconds"]:.0f}s '
+                            'from earlier scans')
+
+        # Published as found so the paths are never held in memory
+        if self.scan_level == 3:
+            paths = metrics.timed(self._manifest_paths(), 'walk')
+        elif self.scan_level == 2:
+            paths = metrics.timed(self._walk_paths(), 'walk')
+        else:
+            with metrics.timer('walk'):
+                paths = self._determine_paths()
 
-            output_files += 1
+        paths = self._count_paths(paths)
 
-            # Create symlink message for file links
-            if os.path.islink(path):
-                action = SYMLINK
-            else:
-                action = DEPOSIT
+        delta = None
+        if self.snapshot:
+            self.skipped.clear()
+            delta = SnapshotDelta(self.snapshot, self.snapshot_scope, mount_health=self.mount_health,
+                                  skipped=self.skipped)
+            changes = delta.changes(self._stat_paths(paths))
+        else:
+            changes = ((path, DEPOSIT) for path in paths)
 
-            if self._dryrun:
-                logger.info(f'{action}: {path}')
-                continue
+        try:
+            for path, action in changes:
+                # Note the mkdir and symlink messages are no longer
+                # required as all files have been ingested separately.
 
-            if self.use_rabbit:
-                self._submit_to_rabbit(path, itype=action)
+                if action == REMOVE:
+                    removed += 1
+                else:
+                    deposited += 1
+
+                # Create symlink message for file links
+                if action != REMOVE and os.path.islink(path):
+                    action = SYMLINK
+
+                metrics.inc('fbi_files_found_total', action=action)
+
+                if self._dryrun:
+                    logger.log(TRACE, '%s: %s', action, path, extra={'path': path, 'action': action})
+                    continue
+
+                if self.use_rabbit:
+                    self._submit_to_rabbit(path, itype=action)
+                else:
+                    # Do something with the paths here.
+                    deposit_paths.append(path)
+
+        except BaseException:
+            if delta is not None:
+                delta.discard()
+            raise
+
+        if delta is not None:
+            # A dry run leaves the snapshot for the real scan
+            if self._dryrun:
+                delta.discard()
             else:
-                # Do something with the paths here.
-                deposit_paths.append(path)
+                delta.commit()
+
+        progress.done()
+        if delta is not None:
+            logger.info(f'Submitted {deposited} files and {removed} removals')
+        else:
+            logger.info(f'Submitted {deposited} files')
+
+        if self.scan_stats is not None and tree != STDIN:
+            self.scan_stats.record(tree, self.stats_kind, progress.elapsed(), progress.count,
+                                   progress.directories)
+
+        if self._metrics_file:
+            metrics.write_textfile(self._metrics_file)
 
-        logger.info(f'Submitted {output_files} files')
         return deposit_paths
 
     def save_data(self, outdata):
@@ -384,16 +630,22 @@ class RescanDirs:
 
 def main():
 
+    configure_logging()
+
     logger.info("Starting rescan check")
-    if check_timeout():
-        return
-    logger.info("Archive access check: SUCCESS")
 
     r = RescanDirs('')
-    if not r.use_rabbit:
-        r.save_data(r.scan())
-    else:
-        _ = r.scan()
+
+    # A manifest's paths are checked as they are read
+    if r.mount_health is not None and r.scan_level != 3:
+        if not r.mount_health.check(r.scan_path):
+            return
+        logger.info("Archive access check: SUCCESS")
+    with profiling(r.profile):
+        if not r.use_rabbit:
+            r.save_data(r.scan())
+        else:
+            _ = r.scan()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,73 @@
+# encoding: utf-8
+"""
+Report the statistics of earlier scans kept with --stats-db: by default
+the trees whose scans have slowed down the most, or the history of one
+tree with --tree.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from fbi_directory_check.utils.scan_stats import STATS_DB_ENV, ScanStats
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Report scan statistics and which trees are getting slower to walk')
+
+    parser.add_argument('--stats-db', dest='stats_db', default=os.environ.get(STATS_DB_ENV),
+                        help=f'SQLite file of scan statistics (default: ${STATS_DB_ENV})')
+    parser.add_argument('--tree', help='Show the scans of this directory')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='Number of recent scans of each tree to compare (default 10)')
+    parser.add_argument('--limit', type=int, default=20, help='Number of trees to show (default 20)')
+
+    args = parser.parse_args()
+
+    if not args.stats_db:
+        parser.error(f'--stats-db or ${STATS_DB_ENV} is required')
+
+    return args
+
+
+def print_history(stats: ScanStats, tree: str, runs: int) -> None:
+    print(f'{"finished":19}  {"kind":16}  {"files":>10}  {"dirs":>8}  {"seconds":>9}  {"files/s":>9}')
+    for scan in stats.history(os.path.abspath(tree), limit=runs):
+        finished = datetime.fromtimestamp(scan['finished']).strftime('%Y-%m-%d %H:%M:%S')
+        print(f'{finished:19}  {scan["kind"]:16}  {scan["files"]:>10}  {scan["directories"]:>8}  '
+              f'{scan["seconds"]:>9.1f}  {scan["rate"]:>9.0f}')
+
+
+def print_trends(stats: ScanStats, runs: int, limit: int) -> None:
+    print(f'{"change":>7}  {"files/s":>9}  {"was":>9}  {"runs":>4}  {"files":>10}  {"kind":16}  tree')
+    for trend in stats.trends(runs)[:limit]:
+        print(f'{trend["change"]:>+7.0%}  {trend["newer_rate"]:>9.0f}  {trend["older_rate"]:>9.0f}  '
+              f'{trend["runs"]:>4}  {trend["files"]:>10}  {trend["kind"]:16}  {trend["tree"]}')
+
+
+def main():
+
+    args = get_args()
+
+    if not os.path.exists(args.stats_db):
+        print(f'fbi_scan_stats: {args.stats_db} does not exist', file=sys.stderr)
+        sys.exit(2)
+
+    stats = ScanStats(args.stats_db)
+    try:
+        if args.tree:
+            print_history(stats, args.tree, args.runs)
+        else:
+            print_trends(stats, args.runs, args.limit)
+    finally:
+        stats.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,11 +11,21 @@ __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 import argparse
 import os
+import sqlite3
+import time
 
-import persistqueue
 from six.moves import configparser
 
+from fbi_directory_check import configure_logging
 from fbi_directory_check.utils import walk_storage_links
+from fbi_directory_check.utils.metrics import metrics
+from fbi_directory_check.utils.profiling import (add_profile_argument,
+                                                 profiling, stage)
+from fbi_directory_check.utils.prune import (add_prune_arguments,
+                                             prune_rules_from_args)
+from fbi_directory_check.utils.queues import (PriorityWorkQueue, WorkQueue,
+                                              open_work_queue, pending_items,
+                                              put_many)
 
 ###############################################################
 #                                                             #
@@ -57,6 +67,12 @@ def get_args():
     parser.add_argument('-r', dest='recursive', action='store_true',
                         help='Recursive. Will include all directories below this point as well')
     parser.add_argument('--conf', type=str, default=default_config, help='Optional path to configuration file')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='Number of directories added to the queue in each transaction')
+    parser.add_argument('--progress-interval', type=float, default=10,
+                        help='Seconds between progress reports')
+    add_prune_arguments(parser)
+    add_profile_argument(parser)
 
     return parser.parse_args()
 
@@ -70,6 +86,100 @@ def check_path(path):
     return bool(os.path.exists(path) and os.path.isdir(path))
 
 
+def iter_directories(args, prune=None):
+    """
+    Yield the directories to submit without reading all the input first
+    :param args: Command line arguments
+    :param prune: PruneRules for the directories not walked with -r
+    :return: generator of directory paths
+    """
+    if args.dir:
+        if not check_path(args.dir):
+            raise OSError('{} is not a directory'.format(args.dir))
+
+        abs_root = os.path.abspath(args.dir)
+
+        if args.recursive:
+            for root, dirs, _ in metrics.timed(walk_storage_links(abs_root, prune=prune), 'walk'):
+                yield root
+        else:
+            yield abs_root
+
+    elif args.file:
+        with args.file as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+def submit(queue, directories, batch_size=10000, progress_interval=10, name='manual_queue'):
+    """
+    Add directories to the queue in batches, skipping any which are repeated
+    in the input or already waiting in the queue. Paths seen so far are kept
+    in a temporary on-disk SQLite database so memory use does not grow with
+    the size of the input.
+
+    :param queue: SQLiteAckQueue or shared WorkQueue
+    :param directories: Iterable of directory paths
+    :param batch_size: Number of directories added in each transaction
+    :param progress_interval: Seconds between progress reports
+    :param name: Queue name when submitting to a shared WorkQueue
+    :return: (number read, number submitted)
+    """
+    if isinstance(queue, WorkQueue):
+        existing = queue.pending(name)
+        put_batch = lambda batch: queue.put_many(name, batch)
+    else:
+        existing = pending_items(queue)
+        put_batch = lambda batch: put_many(queue, batch)
+
+    def put(batch):
+        with metrics.timer('queue_put'):
+            return put_batch(batch)
+
+    # An empty filename gives a private temporary database which spills to disk
+    seen = sqlite3.connect('')
+    seen.execute('CREATE TABLE seen (path TEXT PRIMARY KEY) WITHOUT ROWID')
+
+    with seen:
+        seen.executemany(
+            'INSERT OR IGNORE INTO seen VALUES (?)',
+            ((os.path.normpath(item),) for item in existing)
+        )
+
+    read = submitted = 0
+    batch = []
+    last_report = time.monotonic()
+
+    for directory in directories:
+        read += 1
+        directory = os.path.normpath(directory)
+
+        with stage('filter'):
+            new = seen.execute('INSERT OR IGNORE INTO seen VALUES (?)', (directory,)).rowcount
+
+        if new:
+            batch.append(directory)
+
+        if len(batch) >= batch_size:
+            submitted += put(batch)
+            seen.commit()
+            batch = []
+
+        if time.monotonic() - last_report >= progress_interval:
+            print('Read {} directories, submitted {}, skipped {} duplicates'.format(
+                read, submitted + len(batch), read - submitted - len(batch)), flush=True)
+            last_report = time.monotonic()
+
+    if batch:
+        submitted += put(batch)
+
+    seen.close()
+
+    return read, submitted
+
+
 ###############################################################
 #                                                             #
 #                          Script                             #
@@ -78,6 +188,9 @@ def check_path(path):
 
 
 def main():
+
+    configure_logging()
+
     # Get arguments
     args = get_args()
 
@@ -86,37 +199,15 @@ def main():
     configuration.read(args.conf)
 
     # Load database target
-    db_location = configuration.get('local-queue', 'queue-location')
-    queue = persistqueue.SQLiteAckQueue(os.path.join(db_location, 'priority'), multithreading=True)
-
-    # Process directories
-    directories = []
-
-    if args.dir:
-        if check_path(args.dir):
-            abs_root = os.path.abspath(args.dir)
-
-            if args.recursive:
-                for root, dirs, _ in walk_storage_links(abs_root):
-                    directories.append(root)
-            else:
-                directories.append(abs_root)
-
-        else:
-            raise OSError('{} is not a directory'.format(args.dir))
-
-    elif args.file:
-        with args.file as f:
-            data = f.readlines()
-
-        for line in data:
-            if line.strip():
-                directories.append(line.strip())
+    queue = open_work_queue(configuration)
+    if isinstance(queue, PriorityWorkQueue):
+        queue = queue['manual_queue']
 
-    print('Found {} directories. Submitting...'.format(len(directories)))
+    with profiling(args.profile):
+        directories = iter_directories(args, prune=prune_rules_from_args(args, conf=args.conf))
+        read, submitted = submit(queue, directories, args.batch_size, args.progress_interval)
 
-    for _dir in directories:
-        queue.put(_dir)
+    print('Found {} directories. Submitted {}, skipped {} duplicates'.format(read, submitted, read - submitted))
 
 
 if __name__ == '__main__':
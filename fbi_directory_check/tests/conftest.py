@@ -0,0 +1,82 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import logging
+
+import pika
+import pytest
+
+
+class FakeConnection:
+    """
+    Stands in for pika.BlockingConnection. Messages from every connection
+    are kept on the class, and the next ``fail`` publishes lose the stream.
+    """
+
+    published = []
+    connections = 0
+    fail = 0
+
+    def __init__(self, parameters):
+        FakeConnection.connections += 1
+        self.closed = False
+
+    def channel(self):
+        return self
+
+    def exchange_declare(self, **kwargs):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body):
+        if self.closed:
+            raise pika.exceptions.StreamLostError('Stream connection lost')
+        if FakeConnection.fail:
+            FakeConnection.fail -= 1
+            self.closed = True
+            raise pika.exceptions.StreamLostError('Stream connection lost')
+        FakeConnection.published.append(body)
+
+
+@pytest.fixture
+def make_checker(tmp_path, monkeypatch):
+    """
+    Build a consistency checker against a queue location under tmp_path
+    with rabbit and Elasticsearch replaced. Options are given as
+    {section: {option: value}} on top of index_updater.ini.
+    """
+    module = pytest.importorskip('fbi_directory_check.scripts.consistency_checker')
+
+    monkeypatch.setattr(FakeConnection, 'published', [])
+    monkeypatch.setattr(FakeConnection, 'connections', 0)
+    monkeypatch.setattr(FakeConnection, 'fail', 0)
+    monkeypatch.setattr(pika, 'BlockingConnection', FakeConnection)
+
+    handlers = list(logging.root.handlers)
+    level = logging.root.level
+
+    def make(cls=module.ElasticsearchConsistencyChecker, es=None, options=None):
+        options = dict(options or {})
+        options.setdefault('local-queue', {})['queue-location'] = str(tmp_path)
+
+        class Config(module.RawConfigParser):
+            def read(self, filenames, encoding=None):
+                read = super().read(filenames, encoding)
+                self.read_dict(options)
+                return read
+
+        monkeypatch.setattr(module, 'RawConfigParser', Config)
+        monkeypatch.setattr(module, 'CEDAElasticsearchClient', lambda **kwargs: es)
+
+        return cls()
+
+    yield make
+
+    # The checker adds its handler to the root logger
+    for handler in logging.root.handlers[:]:
+        if handler not in handlers:
+            logging.root.removeHandler(handler)
+    logging.root.setLevel(level)
@@ -0,0 +1,148 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import asyncio
+import os
+import threading
+
+import pytest
+
+from fbi_directory_check.tests.conftest import FakeConnection
+
+async_checker = pytest.importorskip('fbi_directory_check.scripts.async_consistency_checker')
+
+
+class FakeAsyncElasticsearch:
+    """Async client serving a single scroll page of documents per index"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def search(self, index, **kwargs):
+        hits = [{'_source': doc} for doc in self.docs.get(index, [])]
+        return {'_scroll_id': 'scroll', '_shards': {'total': 1, 'successful': 1}, 'hits': {'hits': hits}}
+
+    async def scroll(self, **kwargs):
+        return {'_scroll_id': 'scroll', '_shards': {'total': 1, 'successful': 1}, 'hits': {'hits': []}}
+
+    async def clear_scroll(self, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+
+def messages():
+    return sorted(tuple(body.split(':')[3:5]) for body in FakeConnection.published)
+
+
+class TestPipeline:
+
+    def test_stages(self, make_checker, tmp_path, monkeypatch):
+        item = tmp_path / 'data'
+        os.makedirs(item / 'sub')
+        (item / 'a.nc').touch()
+        (item / 'b.nc').touch()
+
+        es = FakeAsyncElasticsearch({
+            'ceda-fbi': [{'info': {'directory': str(item), 'name': name}} for name in ('a.nc', 'gone.nc')],
+            'ceda-dirs': [{'path': str(item)}],
+        })
+
+        checker = make_checker(async_checker.AsyncConsistencyChecker,
+                               options={'local-queue': {'idle-timeout': '0.1'}})
+        monkeypatch.setattr(checker, '_async_es_connect', lambda: es)
+        checker.work_queue.put('manual_queue', str(item))
+
+        threads = []
+        publish = checker._publish
+
+        def _publish(listing):
+            threads.append(threading.get_ident())
+            publish(listing)
+
+        monkeypatch.setattr(checker, '_publish', _publish)
+
+        async def run():
+            task = asyncio.create_task(checker.run(dev=True))
+            for _ in range(100):
+                if threads and len(FakeConnection.published) == 3:
+                    break
+                await asyncio.sleep(0.05)
+            loop_thread = checker._loop_thread
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return loop_thread
+
+        loop_thread = asyncio.run(run())
+
+        assert messages() == [
+            (str(item / 'b.nc'), 'DEPOSIT'),
+            (str(item / 'gone.nc'), 'REMOVE'),
+            (str(item / 'sub'), 'MKDIR'),
+        ]
+        # Reconciliation runs off the event loop
+        assert threads and loop_thread not in threads
+        assert checker.work_queue.qsize('manual_queue') == 0
+
+    def test_subtree(self, make_checker, monkeypatch):
+        checker = make_checker(async_checker.AsyncConsistencyChecker,
+                               options={'crawler': {'mode': 'subtree'}, 'local-queue': {'idle-timeout': '0'}})
+        threads = []
+
+        class Stop(Exception):
+            pass
+
+        def reconcile_subtree(spot):
+            threads.append(threading.get_ident())
+            checker.publish_message(spot)
+            raise Stop
+
+        monkeypatch.setattr(checker, 'get_next_spot', lambda: '/badc/spot')
+        monkeypatch.setattr(checker, 'reconcile_subtree', reconcile_subtree)
+
+        async def feed():
+            checker._loop = asyncio.get_running_loop()
+            checker._loop_thread = threading.get_ident()
+            with pytest.raises(Stop):
+                await checker.feed(asyncio.Queue())
+
+        asyncio.run(feed())
+
+        # The sweep runs in a worker and only the publish is on the loop
+        assert threads and checker._loop_thread not in threads
+        assert FakeConnection.published == ['/badc/spot']
+
+
+class TestPublish:
+
+    def test_reconnect(self, make_checker):
+        checker = make_checker(async_checker.AsyncConsistencyChecker)
+        FakeConnection.fail = 1
+
+        async def publish():
+            checker._loop = asyncio.get_running_loop()
+            checker._loop_thread = threading.get_ident()
+            await asyncio.to_thread(lambda: [checker.publish_message(str(i)) for i in range(3)])
+
+        asyncio.run(publish())
+
+        # Only the message which failed is sent again
+        assert FakeConnection.published == ['0', '1', '2']
+        assert FakeConnection.connections == 2
+
+    def test_loop_thread(self, make_checker):
+        checker = make_checker(async_checker.AsyncConsistencyChecker)
+
+        async def publish():
+            checker._loop = asyncio.get_running_loop()
+            checker._loop_thread = threading.get_ident()
+            checker.publish_message('0')
+
+        asyncio.run(publish())
+
+        assert FakeConnection.published == ['0']
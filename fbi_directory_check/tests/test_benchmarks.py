@@ -0,0 +1,37 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+from fbi_directory_check.benchmarks.archive import (ArchiveSpec,
+                                                    generate_archive)
+from fbi_directory_check.benchmarks.suite import compare, run_suite
+from fbi_directory_check.utils import walk_storage_links
+
+SPEC = ArchiveSpec(datasets=3, depth=2, fanout=2, files=3, storage_links=1, loops=1)
+
+
+class TestBenchmarks:
+    def test_walk_follows_storage_links_only(self, tmp_path):
+        archive = generate_archive(str(tmp_path), SPEC)
+
+        roots = [root for root, _, _ in walk_storage_links(archive.root, storage_prefix=archive.storage)]
+        assert len(roots) == 1 + SPEC.datasets * SPEC.directories
+        assert not any('loop_' in root for root in roots)
+
+        # Storage links are not followed when they are outside the prefix
+        roots = [root for root, _, _ in walk_storage_links(archive.root)]
+        assert len(roots) == 1 + (SPEC.datasets - SPEC.storage_links) * SPEC.directories
+
+    def test_suite(self, tmp_path):
+        report = run_suite(SPEC, str(tmp_path), repeat=1)
+
+        for result in report['results']:
+            assert result['files'] == SPEC.total_files
+            assert result['fs_calls'] > 0
+
+        lines = compare(report, report)
+        assert len(lines) == 1 + 3 * len(report['results'])
+        assert all('!' not in line for line in lines)
@@ -0,0 +1,115 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import json
+import os
+
+from fbi_directory_check.scripts import change_feed
+from fbi_directory_check.utils.change_feed import (Coalescer, LogFollower,
+                                                   changed_directory,
+                                                   parse_line)
+
+
+class FakeWorkQueue:
+    def __init__(self):
+        self.items = []
+
+    def put(self, queue, item):
+        self.items.append((queue, item))
+
+
+class TestParsing:
+    def test_parse_line(self):
+        assert parse_line('2024-01-02 10:11:12:/badc/a/b.nc:DEPOSIT:1024:') == ('/badc/a/b.nc', 'DEPOSIT')
+        assert parse_line('2024-01-02-10:11:12.5:/badc/a:RMDIR::some: message') == ('/badc/a', 'RMDIR')
+        assert parse_line('2024-01-02 10:11:12:/badc/a/b.nc:UNKNOWN:1:') is None
+        assert parse_line('not a log line') is None
+
+    def test_changed_directory(self):
+        assert changed_directory('/badc/a/b.nc', 'DEPOSIT') == '/badc/a'
+        assert changed_directory('/badc/a/', 'MKDIR') == '/badc'
+
+
+class TestCoalescer:
+    def test_due(self):
+        coalescer = Coalescer(settle=5, max_delay=20)
+
+        for t in range(0, 30, 2):
+            coalescer.add('/badc/busy', now=t)
+        coalescer.add('/badc/quiet', now=0)
+
+        assert coalescer.due(now=4) == []
+        assert coalescer.due(now=6) == ['/badc/quiet']
+        assert coalescer.due(now=21) == ['/badc/busy']
+        assert len(coalescer) == 0
+
+    def test_oldest_event(self):
+        coalescer = Coalescer(settle=5, max_delay=6)
+        assert coalescer.oldest_event() is None
+
+        coalescer.add('/badc/a', now=0)
+        coalescer.add('/badc/b', now=4)
+        coalescer.add('/badc/a', now=4)
+        assert coalescer.oldest_event() == 1
+
+        assert coalescer.due(now=6) == ['/badc/a']
+        assert coalescer.oldest_event() == 2
+
+
+class TestLogFollower:
+    def test_follow(self, tmp_path):
+        log = tmp_path / 'deposit.log'
+        state = str(tmp_path / 'state.json')
+        log.write_text('old:/badc/old:DEPOSIT:1:\n')
+
+        follower = LogFollower([str(log)], state_file=state)
+        assert list(follower.read()) == []
+
+        with open(log, 'a') as f:
+            f.write('new:/badc/a:DEPOSIT:1:\nnew:/badc/b:DEP')
+        assert list(follower.read()) == ['new:/badc/a:DEPOSIT:1:']
+
+        with open(log, 'a') as f:
+            f.write('OSIT:1:\n')
+        assert list(follower.read()) == ['new:/badc/b:DEPOSIT:1:']
+        follower.save()
+
+        # Rotated log is read from the start
+        os.rename(log, tmp_path / 'deposit.log.1')
+        log.write_text('rotated:/badc/c:REMOVE::\n')
+
+        restarted = LogFollower([str(log)], state_file=state)
+        assert list(restarted.read()) == ['rotated:/badc/c:REMOVE::']
+
+
+class TestFollow:
+    def test_saves_queued(self, tmp_path, monkeypatch):
+        log = tmp_path / 'deposit.log'
+        state = tmp_path / 'state.json'
+        log.write_text('new:/badc/a/1.nc:DEPOSIT:1:\n')
+
+        source = LogFollower([str(log)], from_start=True, state_file=str(state))
+        coalescer = Coalescer(settle=1000, max_delay=1000)
+        work_queue = FakeWorkQueue()
+        polls = []
+
+        def sleep(seconds):
+            polls.append(seconds)
+            if len(polls) == 1:
+                # Read but still held, so the offset must not move past it
+                assert work_queue.items == []
+                assert not state.exists()
+                coalescer.settle = 0
+            else:
+                assert work_queue.items == [('bot_queue', '/badc/a')]
+                assert json.loads(state.read_text()) == {str(log): [os.stat(log).st_ino, os.path.getsize(log)]}
+                source.closed = True
+
+        monkeypatch.setattr(change_feed.time, 'sleep', sleep)
+
+        assert change_feed.follow(source, work_queue, coalescer, save_interval=0) == 1
+        assert len(polls) == 2
@@ -0,0 +1,265 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+import sqlite3
+
+import pytest
+
+from fbi_directory_check.tests.conftest import FakeConnection
+from fbi_directory_check.utils.shared_queue import SharedWorkQueue
+
+checker_module = pytest.importorskip('fbi_directory_check.scripts.consistency_checker')
+
+
+class FakeElasticsearch:
+    """Client serving a single scroll page of documents per index"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def search(self, index, **kwargs):
+        self.queries.append((index, kwargs))
+        hits = [{'_source': doc} for doc in self.docs.get(index, [])]
+        return {'_scroll_id': 'scroll', '_shards': {'total': 1, 'successful': 1}, 'hits': {'hits': hits}}
+
+    def scroll(self, **kwargs):
+        return {'_scroll_id': 'scroll', '_shards': {'total': 1, 'successful': 1}, 'hits': {'hits': []}}
+
+    def clear_scroll(self, **kwargs):
+        pass
+
+
+def messages():
+    return sorted(tuple(body.split(':')[3:5]) for body in FakeConnection.published)
+
+
+def make_spot(tmp_path):
+    spot = tmp_path / 'spot'
+    os.makedirs(spot / 'a' / 'b')
+    os.makedirs(spot / 'elsewhere')
+    for name in ('a/1.nc', 'a/b/2.nc', 'a/00README', 'elsewhere/3.nc'):
+        (spot / name).touch()
+    os.symlink(spot / 'elsewhere', spot / 'a' / 'link')
+    return spot
+
+
+def fbi_doc(path):
+    return {'info': {'directory': os.path.dirname(path), 'name': os.path.basename(path)}}
+
+
+class FakeSortedElasticsearch:
+    """Client paging through documents with sort and search_after"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.bodies = []
+
+    def search(self, index, body):
+        self.bodies.append(dict(body))
+        hits = sorted(({'_source': doc, 'sort': [doc['info']['name']]} for doc in self.docs),
+                      key=lambda hit: hit['sort'])
+        if 'search_after' in body:
+            hits = [hit for hit in hits if hit['sort'] > body['search_after']]
+        return {'hits': {'hits': hits[:body['size']]}}
+
+
+class TestStreaming:
+
+    def test_search_after(self, make_checker):
+        # Upper case sorts first, as it does in Python
+        docs = [{'info': {'name': name}} for name in ['b', 'a', 'C', 'e', 'd']]
+        es = FakeSortedElasticsearch(docs)
+        checker = make_checker(es=es, options={'elasticsearch': {'page-size': '2'}})
+
+        paths = list(checker.iter_indexed_files('/badc'))
+
+        assert paths == ['/badc/C', '/badc/a', '/badc/b', '/badc/d', '/badc/e']
+        assert len(es.bodies) == 4
+        assert es.bodies[0]['sort'] == [{'info.name': 'asc'}]
+
+
+class TestSubtreeQuery:
+
+    def test_fields(self, make_checker):
+        checker = make_checker()
+
+        query = checker.get_subtree_query('ceda-fbi', '/badc/cmip6/')
+        assert query['query']['bool']['should'] == [
+            {'term': {'info.directory': '/badc/cmip6/'}},
+            {'prefix': {'info.directory': '/badc/cmip6/'}},
+        ]
+
+        query = checker.get_subtree_query('ceda-dirs', '/badc/cmip6')
+        assert query['query']['bool']['should'] == [
+            {'term': {'path.keyword': '/badc/cmip6'}},
+            {'prefix': {'path.keyword': '/badc/cmip6/'}},
+        ]
+
+
+class TestReconcileSubtree:
+
+    def test_reconcile(self, make_checker, tmp_path):
+        spot = make_spot(tmp_path)
+        es = FakeElasticsearch({
+            'ceda-fbi': [fbi_doc(str(spot / name)) for name in ('a/1.nc', 'a/gone.nc', 'a/link/kept.nc')],
+            'ceda-dirs': [{'path': str(spot / name)} for name in ('', 'a', 'old')],
+        })
+        checker = make_checker(es=es)
+
+        assert checker.reconcile_subtree(str(spot)) == 8
+
+        assert messages() == [
+            (str(spot / 'a/00README'), '00README'),
+            (str(spot / 'a/00README'), 'DEPOSIT'),
+            (str(spot / 'a/b'), 'MKDIR'),
+            (str(spot / 'a/b/2.nc'), 'DEPOSIT'),
+            (str(spot / 'a/gone.nc'), 'REMOVE'),
+            (str(spot / 'a/link'), 'MKDIR'),
+            (str(spot / 'elsewhere'), 'MKDIR'),
+            (str(spot / 'elsewhere/3.nc'), 'DEPOSIT'),
+            (str(spot / 'old'), 'RMDIR'),
+        ]
+        assert [index for index, _ in es.queries] == ['ceda-fbi', 'ceda-dirs']
+        assert es.queries[0][1]['_source'] == ['info.directory', 'info.name']
+
+    def test_missing_spot(self, make_checker, tmp_path):
+        es = FakeElasticsearch({'ceda-fbi': [fbi_doc(str(tmp_path / 'spot/1.nc'))]})
+        checker = make_checker(es=es)
+
+        assert checker.reconcile_subtree(str(tmp_path / 'spot')) == 0
+        assert FakeConnection.published == []
+        assert es.queries == []
+
+
+class TestIndexMirrorSync:
+
+    def test_sync_from_latest_value(self, make_checker):
+        docs = [fbi_doc('/badc/a/1.nc'), fbi_doc('/badc/a/2.nc'), fbi_doc('/badc/a/3.nc')]
+        for doc, modified in zip(docs, ['2026-03-01T00:00:00', '2026-05-01T00:00:00', None]):
+            doc['info']['last_modified'] = modified
+        es = FakeElasticsearch({'ceda-fbi': docs})
+        checker = make_checker(es=es, options={'index-mirror': {'enabled': 'true'}})
+        checker.index_mirror.store('ceda-fbi', '/badc/a', set())
+
+        # The first sync only records where to start from
+        checker.refresh_index_mirror()
+        assert checker.index_mirror.get_last_sync('ceda-fbi').endswith('+00:00')
+        assert es.queries == []
+
+        checker.index_mirror.set_last_sync('ceda-fbi', '2026-01-01T00:00:00')
+        checker.refresh_index_mirror()
+
+        assert es.queries[0][1]['query'] == {
+            'range': {'info.last_modified': {'gte': '2026-01-01T00:00:00'}}
+        }
+        assert checker.index_mirror.get('ceda-fbi', '/badc/a') == {'/badc/a/1.nc', '/badc/a/2.nc', '/badc/a/3.nc'}
+        assert checker.index_mirror.get_last_sync('ceda-fbi') == '2026-05-01T00:00:00'
+
+        # Nothing new keeps the previous value
+        es.docs = {}
+        checker.refresh_index_mirror()
+        assert checker.index_mirror.get_last_sync('ceda-fbi') == '2026-05-01T00:00:00'
+
+
+class TestDigestReport:
+
+    @pytest.mark.parametrize('interval, logged', [('0', False), ('1', True)])
+    def test_interval(self, make_checker, caplog, interval, logged):
+        checker = make_checker(options={'listing-digest': {'enabled': 'true', 'report-interval': interval}})
+
+        with caplog.at_level('INFO'):
+            checker._report_digests()
+
+        assert ('Listing digests' in caplog.text) == logged
+
+
+class TestCrawlMode:
+
+    @pytest.mark.parametrize('mode, method', [('directory', 'add_dirs_to_queue'), ('subtree', 'reconcile_subtree')])
+    def test_dispatch(self, make_checker, monkeypatch, mode, method):
+        checker = make_checker(options={'crawler': {'mode': mode}, 'local-queue': {'idle-timeout': '0'}})
+        calls = []
+
+        monkeypatch.setattr(checker, 'get_next_spot', lambda: '/badc/spot')
+        monkeypatch.setattr(checker, 'add_dirs_to_queue', lambda spot: calls.append(('add_dirs_to_queue', spot)))
+        monkeypatch.setattr(checker, 'reconcile_subtree', lambda spot: calls.append(('reconcile_subtree', spot)))
+
+        checker.consume()
+
+        assert calls == [(method, '/badc/spot')]
+
+    def test_claimed_elsewhere(self, make_checker, monkeypatch, tmp_path):
+        location = str(tmp_path / 'shared.db')
+        other = SharedWorkQueue(location, ['bot_queue'], worker='other')
+        other.claim('spot:/badc/spot', 60)
+
+        checker = make_checker(options={'local-queue': {'backend': 'shared', 'shared-location': location,
+                                                        'idle-timeout': '0'}})
+        calls = []
+
+        monkeypatch.setattr(checker, 'get_next_spot', lambda: '/badc/spot')
+        monkeypatch.setattr(checker, 'add_dirs_to_queue', calls.append)
+
+        checker.consume()
+
+        assert calls == []
+        other.close()
+        checker.work_queue.close()
+
+    def test_no_spots(self, make_checker, monkeypatch, tmp_path):
+        checker = make_checker(options={'scheduler': {'enabled': 'true'}, 'local-queue': {'idle-timeout': '0'}})
+        calls = []
+
+        # The downloaded spot file is empty
+        monkeypatch.setattr(checker, '_download_spot_conf', lambda: (tmp_path / 'spot_file.txt').touch())
+        monkeypatch.setattr(checker, 'claim_spot', calls.append)
+        monkeypatch.setattr(checker, 'add_dirs_to_queue', calls.append)
+
+        assert checker.get_next_spot() is None
+        checker.consume()
+
+        assert calls == []
+
+    def test_unknown(self, make_checker):
+        with pytest.raises(ValueError, match='subtre'):
+            make_checker(options={'crawler': {'mode': 'subtre'}})
+
+
+class TestBusyQueue:
+
+    @pytest.mark.parametrize('backend', ['sqlite', 'shared'])
+    def test_resume(self, make_checker, monkeypatch, tmp_path, backend):
+        checker = make_checker(options={'local-queue': {'backend': backend, 'idle-timeout': '0',
+                                                        'shared-location': str(tmp_path / 'shared.db')}})
+        checker.work_queue.put('manual_queue', '/badc/a')
+        locks = [sqlite3.OperationalError('database is locked')] * 2
+
+        def process_item(queue, item):
+            raise locks.pop()
+
+        def resume_unacked(resume=checker.work_queue.resume_unacked):
+            # Still locked on the first retry
+            if locks:
+                raise locks.pop()
+            resume()
+
+        monkeypatch.setattr(checker, 'process_item', process_item)
+        monkeypatch.setattr(checker.work_queue, 'resume_unacked', resume_unacked)
+        monkeypatch.setattr(checker_module, 'QUEUE_BUSY_RETRY', 0)
+
+        with pytest.raises(sqlite3.OperationalError) as e:
+            checker.consume()
+        assert checker.work_queue.qsize('manual_queue') == 0
+
+        checker.resume_after_busy(e.value)
+
+        assert locks == []
+        assert checker.work_queue.get(timeout=0) == ('manual_queue', '/badc/a')
+        checker.work_queue.close()
+
@@ -0,0 +1,53 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+import time
+
+import pytest
+
+from fbi_directory_check.utils.digests import DigestStore, listing_digest
+
+
+def scan_digest(path):
+    with os.scandir(path) as it:
+        return listing_digest(list(it))
+
+
+class TestDigests:
+    def test_digest_changes(self, tmp_path):
+        (tmp_path / 'a.nc').write_text('a')
+        (tmp_path / 'sub').mkdir()
+        first = scan_digest(tmp_path)
+
+        assert scan_digest(tmp_path) == first
+
+        (tmp_path / 'a.nc').write_text('ab')
+        assert scan_digest(tmp_path) != first
+
+    def test_store_hits(self, tmp_path):
+        store = DigestStore(str(tmp_path / 'digests.db'))
+
+        assert not store.check('/badc/a', 'abc')
+        store.set('/badc/a', 'abc')
+        assert store.check('/badc/a', 'abc')
+        assert not store.check('/badc/a', 'def')
+
+        assert (store.hits, store.misses) == (1, 2)
+
+    def test_expiry(self, tmp_path, monkeypatch):
+        store = DigestStore(str(tmp_path / 'digests.db'), max_age=60)
+        store.set('/badc/a', 'abc')
+
+        now = time.time()
+        monkeypatch.setattr(time, 'time', lambda: now + 61)
+        assert store.get('/badc/a') is None
+
+    @pytest.mark.parametrize('max_age', [0, -1])
+    def test_max_age_positive(self, tmp_path, max_age):
+        with pytest.raises(ValueError, match='max_age'):
+            DigestStore(str(tmp_path / 'digests.db'), max_age=max_age)
@@ -0,0 +1,102 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import json
+
+from elasticsearch import Transport
+
+from fbi_directory_check.utils.elastic import (BulkRemover, path_id, project,
+                                               sliced_scan)
+
+
+class FakeElasticsearch:
+    """Minimal client serving scroll requests from a list of documents"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.scrolls = {}
+        self.requests = []
+
+    def count(self, index, body):
+        return {'count': len(self.docs)}
+
+    def _page(self, scroll_id):
+        hits, size = self.scrolls[scroll_id]
+        page, self.scrolls[scroll_id] = hits[:size], (hits[size:], size)
+        return {'_scroll_id': scroll_id, '_shards': {}, 'hits': {'hits': page}}
+
+    def search(self, **kwargs):
+        self.requests.append(kwargs)
+        hits = [{'_source': doc} for doc in self.docs]
+        if 'slice' in kwargs:
+            s = kwargs['slice']
+            hits = hits[s['id']::s['max']]
+        scroll_id = str(len(self.requests))
+        self.scrolls[scroll_id] = (hits, kwargs['size'])
+        return self._page(scroll_id)
+
+    def scroll(self, scroll_id, **kwargs):
+        return self._page(scroll_id)
+
+    def clear_scroll(self, **kwargs):
+        pass
+
+
+class TestSlicedScan:
+    docs = [{'path': f'/badc/{i}'} for i in range(25)]
+
+    def test_single_scroll(self):
+        es = FakeElasticsearch(self.docs)
+        hits = list(sliced_scan(es, 'ceda-dirs', project({'query': {}}, ['path']), size=10))
+
+        assert len(hits) == 25
+        assert es.requests[0]['_source'] == ['path']
+
+    def test_sliced_scroll(self):
+        es = FakeElasticsearch(self.docs)
+        hits = list(sliced_scan(es, 'ceda-dirs', {'query': {}}, slices=3, size=4, threshold=10))
+
+        assert sorted(hit['_source']['path'] for hit in hits) == sorted(d['path'] for d in self.docs)
+        assert len(es.requests) == 3
+
+    def test_below_threshold(self):
+        es = FakeElasticsearch(self.docs)
+        list(sliced_scan(es, 'ceda-dirs', {'query': {}}, slices=3, threshold=100))
+
+        assert len(es.requests) == 1
+
+
+class FakeBulkElasticsearch:
+    """Minimal client answering bulk deletes"""
+
+    def __init__(self, missing=(), failing=()):
+        self.missing = {path_id(p) for p in missing}
+        self.failing = {path_id(p) for p in failing}
+        self.requests = 0
+        self.transport = Transport([{}])
+
+    def bulk(self, body, **kwargs):
+        self.requests += 1
+        items = []
+        for line in body.splitlines():
+            _id = json.loads(line)['delete']['_id']
+            status = 404 if _id in self.missing else 500 if _id in self.failing else 200
+            items.append({'delete': {'_id': _id, 'status': status}})
+        return {'errors': any(i['delete']['status'] >= 300 for i in items), 'items': items}
+
+
+class TestBulkRemover:
+    def test_batches(self):
+        es = FakeBulkElasticsearch(missing=['/badc/1'], failing=['/badc/2'])
+        failed = []
+
+        with BulkRemover(es, 'ceda-fbi', batch_size=2, on_failure=failed.append) as remover:
+            remover.extend(f'/badc/{i}' for i in range(5))
+
+        assert es.requests == 3
+        assert remover.removed == 4
+        assert failed == ['/badc/2']
@@ -0,0 +1,70 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import json
+import os
+import subprocess
+import sys
+
+import persistqueue.sqlackqueue
+import pytest
+
+from fbi_directory_check.utils.queues import AckStatus
+
+# Entry points run from cron which should start without the heavy backends
+ENTRY_POINTS = (
+    'fbi_directory_check.scripts.q_monitor',
+    'fbi_directory_check.scripts.queue_maintenance',
+    'fbi_directory_check.scripts.submit_directories',
+    'fbi_directory_check.scripts.change_feed',
+    'fbi_directory_check.scripts.rescan_directory',
+    'fbi_directory_check.scripts.opensearch_rescan_directory',
+    'fbi_directory_check.scripts.rescan_client',
+    'fbi_directory_check.scripts.scan_stats',
+)
+
+# Only loaded when first used
+LAZY = ('pika', 'persistqueue', 'elasticsearch', 'ceda_elasticsearch_tools', 'requests',
+        'aiofiles', 'asyncio', 'http.server', 'cProfile', 'pstats')
+
+# Seconds allowed to import an entry point in a fresh interpreter. Generous
+# so slow machines pass while a heavy import creeping back in does not.
+IMPORT_BUDGET = float(os.environ.get('FBI_IMPORT_BUDGET', 0.5))
+
+SCRIPT = """
+import json, logging, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': seconds,
+    'loaded': [name for name in {lazy!r} if name in sys.modules],
+    'root_handlers': len(logging.root.handlers),
+}}))
+"""
+
+
+def import_fresh(module: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT.format(module=module, lazy=LAZY)],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+class TestImports:
+    @pytest.mark.parametrize('module', ENTRY_POINTS)
+    def test_entry_point_import(self, module):
+        result = import_fresh(module)
+
+        assert result['loaded'] == []
+        assert result['root_handlers'] == 0
+        assert result['seconds'] < IMPORT_BUDGET, f'{module} took {result["seconds"]:.3f}s to import'
+
+    def test_ack_status(self):
+        for name in ('inited', 'ready', 'unack', 'acked', 'ack_failed'):
+            assert getattr(AckStatus, name) == int(getattr(persistqueue.sqlackqueue.AckStatus, name))
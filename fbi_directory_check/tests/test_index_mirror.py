@@ -0,0 +1,39 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+from fbi_directory_check.utils.index_mirror import IndexMirror
+
+
+class TestIndexMirror:
+    def test_store_and_update(self, tmp_path):
+        mirror = IndexMirror(str(tmp_path / 'mirror.db'))
+
+        assert mirror.get('ceda-fbi', '/badc/a') is None
+
+        mirror.store('ceda-fbi', '/badc/a', {'/badc/a/1.nc', '/badc/a/2.nc'})
+        mirror.update('ceda-fbi', '/badc/a', added={'/badc/a/3.nc'}, removed={'/badc/a/1.nc'})
+
+        assert mirror.get('ceda-fbi', '/badc/a') == {'/badc/a/2.nc', '/badc/a/3.nc'}
+
+    def test_refresh_only_mirrored(self, tmp_path):
+        mirror = IndexMirror(str(tmp_path / 'mirror.db'))
+        mirror.store('ceda-fbi', '/badc/a', set())
+
+        count = mirror.refresh('ceda-fbi', [
+            ('/badc/a', '/badc/a/new.nc'),
+            ('/badc/b', '/badc/b/new.nc'),
+        ])
+
+        assert count == 1
+        assert mirror.get('ceda-fbi', '/badc/a') == {'/badc/a/new.nc'}
+        assert mirror.get('ceda-fbi', '/badc/b') is None
+
+    def test_expiry(self, tmp_path):
+        mirror = IndexMirror(str(tmp_path / 'mirror.db'), max_age=-1)
+        mirror.store('ceda-dirs', '/badc', {'/badc'})
+
+        assert mirror.get('ceda-dirs', '/badc') is None
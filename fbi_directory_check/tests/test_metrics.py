@@ -0,0 +1,30 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+from fbi_directory_check.utils.metrics import STAGE_SECONDS, Metrics
+
+
+class TestMetrics:
+    def test_render(self):
+        m = Metrics(buckets=(0.1, 1))
+        m.inc('fbi_messages_published_total', 3)
+        m.set('fbi_queue_depth', 5, queue='bot_queue')
+        m.observe(STAGE_SECONDS, 0.5, stage='walk')
+        m.observe(STAGE_SECONDS, 2, stage='walk')
+
+        text = m.render()
+
+        assert '# TYPE fbi_messages_published_total counter' in text
+        assert 'fbi_queue_depth{queue="bot_queue"} 5' in text
+        assert f'{STAGE_SECONDS}_bucket{{stage="walk",le="1"}} 1' in text
+        assert f'{STAGE_SECONDS}_bucket{{stage="walk",le="+Inf"}} 2' in text
+        assert f'{STAGE_SECONDS}_count{{stage="walk"}} 2' in text
+
+    def test_timed(self):
+        m = Metrics()
+        assert list(m.timed(range(3), 'walk')) == [0, 1, 2]
+        assert m.get(STAGE_SECONDS, stage='walk') == 4
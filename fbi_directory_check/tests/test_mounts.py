@@ -0,0 +1,102 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import errno
+import os
+import threading
+
+import pytest
+
+from fbi_directory_check.utils import check_timeout, walk_storage_links
+from fbi_directory_check.utils import mounts
+from fbi_directory_check.utils.mounts import MountHealth, read_mount_points
+
+
+def make_tree(tmp_path):
+    for name in ('good/a', 'hung/b', 'hung/c'):
+        os.makedirs(tmp_path / 'archive' / name)
+        (tmp_path / 'archive' / name / 'file.nc').touch()
+    return str(tmp_path / 'archive')
+
+
+class TestMountPoints:
+    def test_read(self, tmp_path):
+        table = tmp_path / 'mounts'
+        table.write_text(
+            'proc /proc proc rw 0 0\n'
+            'server:/export /neodc/with\\040space nfs rw 0 0\n'
+            '/dev/sda1 / ext4 rw 0 0\n'
+        )
+        assert read_mount_points(str(table)) == ['/neodc/with space', '/']
+
+    def test_mount_for(self):
+        health = MountHealth({'/neodc/esacci': '/neodc/esacci/sentinel'}, mounts=['/', '/neodc'])
+
+        assert health.mount_for('/neodc/esacci/cloud') == '/neodc/esacci'
+        assert health.mount_for('/neodc/esacci2') == '/neodc'
+        assert health.mount_for('/badc/cmip6') == '/'
+
+
+class TestProbe:
+    def test_timeout_is_cached(self, tmp_path, monkeypatch):
+        release = threading.Event()
+        calls = []
+
+        def hang(path):
+            calls.append(path)
+            release.wait()
+
+        monkeypatch.setattr(mounts, 'probe_path', hang)
+        health = MountHealth(mounts=['/neodc'], timeout=0.1, ttl=0)
+
+        try:
+            assert not health.check('/neodc/x')
+            # The first probe is still hung so no new probe is started
+            assert not health.check('/neodc/x')
+            assert calls == ['/neodc']
+        finally:
+            release.set()
+
+
+class TestWalk:
+    def test_skips_unhealthy_mount(self, tmp_path):
+        root = make_tree(tmp_path)
+        hung = os.path.join(root, 'hung')
+
+        health = MountHealth(mounts=['/', hung], ttl=60)
+        health.mark_unhealthy(hung, 'test')
+
+        roots = [top for top, _, _ in walk_storage_links(root, mount_health=health)]
+
+        assert sorted(os.path.relpath(top, root) for top in roots) == ['.', 'good', 'good/a']
+        assert health.unhealthy() == [hung]
+
+    def test_reports_stalled_mount(self, tmp_path, monkeypatch):
+        root = make_tree(tmp_path)
+        health = MountHealth(mounts=['/'], ttl=60)
+        scandir = os.scandir
+
+        def stale(path):
+            if os.path.basename(path) == 'hung':
+                raise OSError(errno.ESTALE, 'Stale file handle', path)
+            return scandir(path)
+
+        monkeypatch.setattr(os, 'scandir', stale)
+        list(walk_storage_links(root, mount_health=health))
+
+        # Directories left on the same mount are skipped once it has gone
+        assert health.unhealthy() == ['/']
+        assert not health.check(os.path.join(root, 'good'))
+
+
+class TestCheckTimeout:
+    def test_deprecated(self, tmp_path):
+        sentinel = tmp_path / 'sentinel'
+        sentinel.touch()
+
+        with pytest.deprecated_call():
+            assert not check_timeout(str(sentinel), timeout=5)
@@ -0,0 +1,46 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+import pstats
+
+from fbi_directory_check.utils import profiling
+from fbi_directory_check.utils.metrics import metrics
+
+
+class TestProfiling:
+    def test_stage_off(self):
+        assert profiling.stage('filter') is profiling._NULL
+        assert metrics.stage_listener is None
+
+    def test_enabled(self, tmp_path):
+        path = str(tmp_path / 'run.prof')
+
+        with profiling.profiling(path) as profiler:
+            with metrics.timer('walk'):
+                os.listdir(tmp_path)
+                with profiling.stage('profiled_filter'):
+                    os.stat(tmp_path)
+
+            assert profiler._fs_calls[('walk', 'listdir')] == 1
+            assert profiler._fs_calls[('profiled_filter', 'stat')] == 1
+
+        # Everything is restored once the run ends
+        assert metrics.stage_listener is None
+        assert profiling.stage('filter') is profiling._NULL
+        assert not hasattr(os.stat, '__wrapped__') and os.stat.__name__ == 'stat'
+
+        pstats.Stats(path)
+        with open(f'{path}.txt') as f:
+            summary = f.read()
+
+        assert 'profiled_filter' in summary
+        assert 'fs calls by function' in summary
+
+    def test_disabled(self):
+        with profiling.profiling(None) as profiler:
+            assert profiler is None
@@ -0,0 +1,121 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import io
+import logging
+
+from fbi_directory_check import TRACE, LogStream
+from fbi_directory_check.utils.progress import ProgressLog
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def make_logger(name):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = Records()
+    logger.addHandler(handler)
+    return logger, handler
+
+
+class TestProgressLog:
+    def test_every(self):
+        logger, handler = make_logger('test_progress_every')
+        progress = ProgressLog(logger, 'files', every=10, interval=0)
+
+        for _ in range(25):
+            progress.update()
+        progress.done()
+
+        assert len(handler.messages) == 3
+        assert handler.messages[0].startswith('10 files in ')
+        assert handler.messages[-1].startswith('Finished: 25 files in ')
+
+    def test_interval(self, monkeypatch):
+        logger, handler = make_logger('test_progress_interval')
+        now = [100.0]
+        monkeypatch.setattr('fbi_directory_check.utils.progress.time.monotonic', lambda: now[0])
+
+        progress = ProgressLog(logger, 'files', every=0, interval=10)
+        progress.update(5)
+        assert handler.messages == []
+
+        now[0] = 110.0
+        progress.update()
+        assert handler.messages == ['6 files in 10.0s (1/s)']
+
+    def test_estimate(self, monkeypatch):
+        logger, handler = make_logger('test_progress_estimate')
+        now = [100.0]
+        monkeypatch.setattr('fbi_directory_check.utils.progress.time.monotonic', lambda: now[0])
+
+        progress = ProgressLog(logger, 'files', every=0, interval=0, expected=100)
+        progress.directory(2)
+
+        now[0] = 110.0
+        progress.update(25)
+        assert progress.estimate() == (0.25, 30)
+        assert progress.summary() == '25 files from 2 directories in 10.0s (2/s), 25% of 100 expected, ETA 0:00:30'
+
+        progress.update(100)
+        assert progress.summary().endswith(', more than the 100 expected')
+
+        progress.done()
+        assert handler.messages == ['Finished: 125 files from 2 directories in 10.0s (12/s)']
+
+
+class TestLogStream:
+    def test_background(self):
+        stream = io.StringIO()
+        handler = LogStream(stream)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+
+        logger = logging.getLogger('test_background_stream')
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(handler)
+
+        handler.start()
+        try:
+            items = ['a']
+            logger.info('items %s', items)
+            # Arguments are merged when the record is made
+            items.append('b')
+            logger.log(TRACE, 'hidden %s', items)
+        finally:
+            handler.stop()
+            logger.removeHandler(handler)
+
+        assert stream.getvalue() == "INFO items ['a']\n"
+
+    def test_extra(self):
+        stream = io.StringIO()
+        handler = LogStream(stream)
+        handler.setFormatter(logging.Formatter('%(action)s %(path)s %(message)s'))
+
+        logger = logging.getLogger('test_extra')
+        logger.setLevel(TRACE)
+        logger.propagate = False
+        logger.addHandler(handler)
+
+        handler.start()
+        try:
+            logger.log(TRACE, '%s: %s', 'DEPOSIT', '/badc/a.nc', extra={'path': '/badc/a.nc', 'action': 'DEPOSIT'})
+        finally:
+            handler.stop()
+            logger.removeHandler(handler)
+
+        # The fields are still on the record when it is written
+        assert stream.getvalue() == 'DEPOSIT /badc/a.nc DEPOSIT: /badc/a.nc\n'
@@ -0,0 +1,60 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import os
+
+from fbi_directory_check.utils import walk_storage_links
+from fbi_directory_check.utils.prune import (PruneRules, add_prune_arguments,
+                                             prune_rules_from_args)
+
+
+def make_tree(tmp_path):
+    for name in ('data/2020', 'data/.snapshot/hourly', 'data/cache/tmp', 'quicklooks/2020',
+                 'raw/scratch', 'raw/keep/scratch'):
+        os.makedirs(tmp_path / 'archive' / name)
+        (tmp_path / 'archive' / name / 'file.nc').touch()
+    return tmp_path / 'archive'
+
+
+def walked(root, prune):
+    return sorted(os.path.relpath(top, root) for top, _, _ in walk_storage_links(str(root), prune=prune))
+
+
+class TestPruneRules:
+    def test_patterns(self, tmp_path):
+        root = make_tree(tmp_path)
+        prune = PruneRules(['.snapshot', 'cache*', f'{root}/raw/*/scratch'])
+
+        assert walked(root, prune) == ['.', 'data', 'data/2020', 'quicklooks', 'quicklooks/2020',
+                                       'raw', 'raw/keep', 'raw/scratch']
+
+    def test_ignore_file(self, tmp_path):
+        root = make_tree(tmp_path)
+        (root / '.fbiignore').write_text('# not ingested\nquicklooks/\n\nraw/scratch\n')
+
+        assert walked(root, PruneRules()) == ['.', 'data', 'data/2020', 'data/cache', 'data/cache/tmp',
+                                              'raw', 'raw/keep', 'raw/keep/scratch']
+
+        # Ignore files in a dataset do not apply above it
+        (root / '.fbiignore').unlink()
+        (root / 'raw' / '.fbiignore').write_text('scratch')
+        assert 'raw/keep/scratch' not in walked(root, PruneRules())
+        assert 'quicklooks' in walked(root, PruneRules())
+
+        assert 'raw/keep/scratch' in walked(root, PruneRules(ignore_file=None))
+
+    def test_from_args(self, tmp_path):
+        conf = tmp_path / 'conf.ini'
+        conf.write_text('[prune]\npatterns =\n    cache\n    quicklooks\nignore-file =\n')
+
+        parser = argparse.ArgumentParser()
+        add_prune_arguments(parser)
+        prune = prune_rules_from_args(parser.parse_args(['--prune', 'scratch']), conf=str(conf))
+
+        assert prune.patterns == ['.snapshot', 'cache', 'quicklooks', 'scratch']
+        assert prune.ignore_file is None
@@ -0,0 +1,53 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import persistqueue
+
+from fbi_directory_check.scripts.q_monitor import snapshot, summarise
+
+
+class TestSnapshot:
+    def test_counts(self, tmp_path):
+        q = persistqueue.SQLiteAckQueue(str(tmp_path))
+        for i in range(3):
+            q.put(f'/badc/{i}')
+        q.ack(q.get())
+        q.get()
+
+        state = snapshot(str(tmp_path / 'data.db'))
+
+        assert state['ready'] == 1
+        assert state['unack'] == 1
+        assert state['acked'] == 1
+        assert state['enqueued'] == 3
+        assert state['oldest'] is not None
+
+    def test_missing(self, tmp_path):
+        state = snapshot(str(tmp_path / 'data.db'))
+        assert state['ready'] == 0
+        assert state['oldest'] is None
+
+
+class TestSummarise:
+    def test_rates(self):
+        previous = {'ready': 100, 'unack': 0, 'failed': 0, 'enqueued': 100, 'oldest': 0, 'time': 0}
+        current = {'ready': 60, 'unack': 2, 'failed': 0, 'enqueued': 120, 'oldest': 5, 'time': 10}
+
+        report = summarise('bot_queue', current, previous)
+
+        assert report['enqueue_rate'] == 2
+        assert report['dequeue_rate'] == 6
+        assert report['eta'] == 15
+        assert report['unacked'] == 62
+        assert report['oldest_age'] == 5
+
+    def test_not_draining(self):
+        previous = {'ready': 10, 'unack': 0, 'failed': 0, 'enqueued': 10, 'oldest': 0, 'time': 0}
+        current = {'ready': 20, 'unack': 0, 'failed': 0, 'enqueued': 20, 'oldest': 0, 'time': 10}
+
+        assert summarise('bot_queue', current, previous)['eta'] is None
+        assert summarise('bot_queue', current)['enqueue_rate'] is None
@@ -0,0 +1,103 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import argparse
+import sqlite3
+
+import persistqueue
+
+from fbi_directory_check.scripts.queue_maintenance import maintain
+from fbi_directory_check.utils.queues import (QUEUE_DIRS, queue_counts,
+                                              queue_db_path, tune_queue)
+
+
+def make_queue(tmp_path, ready=2, acked=3, failed=1):
+    q = persistqueue.SQLiteAckQueue(str(tmp_path / QUEUE_DIRS['bot_queue']), multithreading=True)
+    for i in range(ready + acked + failed):
+        q.put(f'/badc/{i}')
+    for _ in range(acked):
+        q.ack(q.get())
+    for _ in range(failed):
+        q.ack_failed(q.get())
+    return q
+
+
+def make_args(**kwargs):
+    args = dict(batch_size=2, purge_failed=False, vacuum_ratio=0.2, force_vacuum=False, busy_timeout=0.1)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def counts(path):
+    conn = sqlite3.connect(path)
+    try:
+        return queue_counts(conn)
+    finally:
+        conn.close()
+
+
+class TestTuneQueue:
+    def test_pragmas(self, tmp_path):
+        q = make_queue(tmp_path)
+        tune_queue(q)
+
+        conn = sqlite3.connect(queue_db_path(str(tmp_path), 'bot_queue'))
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        conn.close()
+
+        # NORMAL
+        assert q._putter.execute('PRAGMA synchronous').fetchone()[0] == 1
+
+
+class TestMaintain:
+    def test_purge(self, tmp_path):
+        make_queue(tmp_path)
+        path = queue_db_path(str(tmp_path), 'bot_queue')
+
+        maintain(path, make_args())
+
+        assert counts(path) == {'ready': 2, 'unack': 0, 'acked': 0, 'failed': 1}
+
+    def test_purge_failed(self, tmp_path):
+        make_queue(tmp_path)
+        path = queue_db_path(str(tmp_path), 'bot_queue')
+
+        maintain(path, make_args(purge_failed=True))
+
+        assert counts(path) == {'ready': 2, 'unack': 0, 'acked': 0, 'failed': 0}
+
+    def test_vacuum(self, tmp_path):
+        q = make_queue(tmp_path, ready=0, acked=0, failed=0)
+        for i in range(2000):
+            q.put('/badc/' + 'x' * 200 + str(i))
+        for _ in range(2000):
+            q.ack(q.get())
+        path = queue_db_path(str(tmp_path), 'bot_queue')
+
+        maintain(path, make_args(batch_size=500))
+
+        conn = sqlite3.connect(path)
+        assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+        conn.close()
+
+    def test_busy(self, tmp_path, capsys):
+        make_queue(tmp_path)
+        path = queue_db_path(str(tmp_path), 'bot_queue')
+
+        # The checker part way through a write
+        checker = sqlite3.connect(path, isolation_level=None)
+        checker.execute('BEGIN IMMEDIATE')
+
+        maintain(path, make_args(force_vacuum=True))
+
+        out = capsys.readouterr().out
+        assert 'purge        skipped' in out
+        assert 'vacuum       skipped' in out
+
+        checker.execute('ROLLBACK')
+        checker.close()
+        assert counts(path)['acked'] == 3
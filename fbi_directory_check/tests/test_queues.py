@@ -0,0 +1,214 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import sqlite3
+import threading
+import time
+
+import persistqueue
+import pytest
+
+from fbi_directory_check.utils.queues import (ACK_TABLE, PriorityWorkQueue,
+                                              WorkQueue, pending_items,
+                                              put_many)
+from fbi_directory_check.utils.shared_queue import SharedWorkQueue
+
+
+def make_queues(tmp_path):
+    manual = persistqueue.SQLiteAckQueue(str(tmp_path / 'priority'), multithreading=True)
+    bot = persistqueue.SQLiteAckQueue(str(tmp_path / 'bot'), multithreading=True)
+    return PriorityWorkQueue([('manual_queue', manual), ('bot_queue', bot)], max_wait=0.2)
+
+
+class TestPriorityWorkQueue:
+    def test_priority(self, tmp_path):
+        queue = make_queues(tmp_path)
+        queue.put('bot_queue', '/badc/bot')
+        queue.put('manual_queue', '/badc/manual')
+
+        assert queue.get(timeout=0) == ('manual_queue', '/badc/manual')
+        assert queue.get(timeout=0) == ('bot_queue', '/badc/bot')
+
+        with pytest.raises(persistqueue.Empty):
+            queue.get(timeout=0)
+
+    def test_timeout(self, tmp_path):
+        queue = make_queues(tmp_path)
+
+        start = time.monotonic()
+        with pytest.raises(persistqueue.Empty):
+            queue.get(timeout=0.3)
+        assert time.monotonic() - start >= 0.3
+
+    def test_wakes_on_external_put(self, tmp_path):
+        queue = make_queues(tmp_path)
+
+        # A separate connection stands in for another process
+        other = persistqueue.SQLiteAckQueue(str(tmp_path / 'priority'), multithreading=True)
+        timer = threading.Timer(0.2, other.put, args=('/badc/new',))
+        timer.start()
+
+        assert queue.get(timeout=5) == ('manual_queue', '/badc/new')
+        timer.join()
+
+    def test_put_many_and_pending(self, tmp_path):
+        queue = make_queues(tmp_path)
+
+        assert queue.put_many('bot_queue', ['/badc/1', '/badc/2']) == 2
+        assert list(queue.pending('bot_queue')) == ['/badc/1', '/badc/2']
+        assert queue.claim('spot:/badc', 60)
+
+    def test_resume_unacked(self, tmp_path):
+        queue = make_queues(tmp_path)
+        queue.put('bot_queue', '/badc/bot')
+        queue.put('manual_queue', '/badc/manual')
+        queue.get(timeout=0)
+        queue.get(timeout=0)
+
+        queue.resume_unacked()
+
+        assert queue.qsize('manual_queue') == queue.qsize('bot_queue') == 1
+        assert queue.get(timeout=0) == ('manual_queue', '/badc/manual')
+
+    def test_interface(self):
+        with pytest.raises(TypeError):
+            WorkQueue(['manual_queue'])
+
+
+class TestSharedWorkQueue:
+    def test_priority_and_ack(self, tmp_path):
+        queue = SharedWorkQueue(str(tmp_path / 'shared.db'), ['manual_queue', 'bot_queue'], worker='a')
+        queue.put('bot_queue', '/badc/bot')
+        queue.put('manual_queue', '/badc/manual')
+
+        assert queue.qsize('bot_queue') == 1
+        assert queue.get(timeout=0) == ('manual_queue', '/badc/manual')
+        assert queue.get(timeout=0) == ('bot_queue', '/badc/bot')
+        assert queue.qsize('bot_queue') == 0
+
+        queue.ack('manual_queue', '/badc/manual')
+        assert list(queue.pending('manual_queue')) == []
+        assert list(queue.pending('bot_queue')) == ['/badc/bot']
+
+        queue.close()
+
+    def test_shared_between_workers(self, tmp_path):
+        path = str(tmp_path / 'shared.db')
+        first = SharedWorkQueue(path, ['manual_queue', 'bot_queue'], worker='a')
+        second = SharedWorkQueue(path, ['manual_queue', 'bot_queue'], worker='b')
+
+        first.put_many('bot_queue', ['/badc/1', '/badc/2'])
+
+        assert first.get(timeout=0) == ('bot_queue', '/badc/1')
+        assert second.get(timeout=0) == ('bot_queue', '/badc/2')
+
+        with pytest.raises(persistqueue.Empty):
+            second.get(timeout=0)
+
+        first.close()
+        second.close()
+
+    def test_expired_lease_returns(self, tmp_path):
+        path = str(tmp_path / 'shared.db')
+        crashed = SharedWorkQueue(path, ['manual_queue', 'bot_queue'], lease_time=0.2, worker='a')
+        crashed.put('manual_queue', '/badc/item')
+        crashed.get(timeout=0)
+
+        # Stop renewing without acknowledging, as if the worker died
+        crashed.close()
+
+        other = SharedWorkQueue(path, ['manual_queue', 'bot_queue'], lease_time=60, worker='b')
+        assert other.get(timeout=2) == ('manual_queue', '/badc/item')
+        other.ack('manual_queue', '/badc/item')
+        assert list(other.pending('manual_queue')) == []
+
+        other.close()
+
+    def test_resume_unacked(self, tmp_path):
+        queue = SharedWorkQueue(str(tmp_path / 'shared.db'), ['manual_queue'], max_attempts=1, worker='a')
+        queue.put('manual_queue', '/badc/item')
+        queue.get(timeout=0)
+
+        queue.resume_unacked()
+
+        # The lease given up does not count as an attempt
+        assert queue.get(timeout=0) == ('manual_queue', '/badc/item')
+        queue.ack('manual_queue', '/badc/item')
+        assert list(queue.pending('manual_queue')) == []
+
+        queue.close()
+
+    def test_max_attempts(self, tmp_path):
+        queue = SharedWorkQueue(str(tmp_path / 'shared.db'), ['manual_queue'], lease_time=0,
+                                max_attempts=2, worker='a')
+        queue.put('manual_queue', '/badc/poison')
+
+        assert queue.get(timeout=0) == ('manual_queue', '/badc/poison')
+        assert queue.get(timeout=0) == ('manual_queue', '/badc/poison')
+
+        with pytest.raises(persistqueue.Empty):
+            queue.get(timeout=0)
+
+        queue.close()
+
+    def test_pending_pages(self, tmp_path):
+        queue = SharedWorkQueue(str(tmp_path / 'shared.db'), ['bot_queue'], worker='a')
+        items = [f'/badc/{i}' for i in range(25)]
+        queue.put_many('bot_queue', items)
+
+        assert list(queue.pending('bot_queue', page_size=10)) == items
+
+        queue.close()
+
+    def test_claim(self, tmp_path):
+        path = str(tmp_path / 'shared.db')
+        first = SharedWorkQueue(path, ['bot_queue'], worker='a')
+        second = SharedWorkQueue(path, ['bot_queue'], worker='b')
+
+        assert first.claim('spot:/badc/cmip6', 60)
+        assert first.claim('spot:/badc/cmip6', 60)
+        assert not second.claim('spot:/badc/cmip6', 60)
+        assert second.claim('spot:/badc/cru', 0)
+
+        # An expired claim can be taken over
+        assert first.claim('spot:/badc/cru', 60)
+
+        first.close()
+        second.close()
+
+
+class TestPersistqueueInternals:
+    """
+    put_many, pending_items and tune_queue reach into SQLiteAckQueue. These
+    fail if a persistqueue release changes what they rely on. The status
+    values are checked in test_imports.
+    """
+
+    def test_attributes(self, tmp_path):
+        q = persistqueue.SQLiteAckQueue(str(tmp_path), multithreading=True)
+
+        assert isinstance(q._getter, sqlite3.Connection)
+        assert isinstance(q._putter, sqlite3.Connection)
+        assert q._table_name.strip('`') == ACK_TABLE
+        assert callable(q._serializer.dumps) and callable(q._serializer.loads)
+        assert hasattr(q.tran_lock, '__enter__')
+        assert isinstance(q.total, int)
+        assert isinstance(q.put_event, threading.Event)
+        assert (q.path, q.db_file_name) == (str(tmp_path), 'data.db')
+
+        columns = {row[1] for row in q._getter.execute(f'PRAGMA table_info({ACK_TABLE})')}
+        assert {'_id', 'data', 'timestamp', 'status'} <= columns
+
+    def test_put_many(self, tmp_path):
+        q = persistqueue.SQLiteAckQueue(str(tmp_path), multithreading=True)
+        q.put('/badc/0')
+
+        assert put_many(q, ['/badc/1', '/badc/2']) == 2
+        assert q.qsize() == 3
+        assert list(pending_items(q)) == ['/badc/0', '/badc/1', '/badc/2']
+
+        assert [q.get(block=False) for _ in range(3)] == ['/badc/0', '/badc/1', '/badc/2']
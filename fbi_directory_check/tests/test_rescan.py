@@ -5,6 +5,9 @@ __copyright__ = 'Copyright 2024 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'daniel.westwood@stfc.ac.uk'
 
+import gzip
+import io
+
 from fbi_directory_check.scripts.rescan_directory import RescanDirs
 
 
@@ -37,6 +40,30 @@ class TestRescan:
 
         assert len(rd.scan()) == 10
 
+    def test_rescan_3(self, tmp_path):
+        # Manifest from a previous level 2 scan
+        paths = RescanDirs('fbi_directory_check/tests/rain/', scan_level=2, recursive=True).scan()
+        assert len(paths) == 11
+
+        plain = tmp_path / 'manifest.txt'
+        plain.write_text('\n'.join(paths + ['']))
+        compressed = tmp_path / 'manifest.txt.gz'
+        with gzip.open(compressed, 'wt') as f:
+            f.write('\n'.join(paths))
+
+        for manifest in (plain, compressed):
+            rd = RescanDirs(str(manifest), scan_level=3, extension='nc')
+            assert rd.scan() == [p for p in paths if p.endswith('.nc')]
+            assert rd._determine_paths() == rd.scan()
+
+    def test_rescan_3_stdin(self, monkeypatch):
+        monkeypatch.setattr('sys.stdin', io.TextIOWrapper(io.BufferedReader(io.BytesIO(
+            b'/data/a.nc\n/data/b.txt\r\n\n/data/c.nc'
+        ))))
+
+        rd = RescanDirs('-', scan_level=3, extension='nc')
+        assert rd.scan() == ['/data/a.nc', '/data/c.nc']
+
 if __name__ == '__main__':
     TestRescan().test_rescan_1()
     TestRescan().test_rescan_2()
\ No newline at end of file
@@ -0,0 +1,170 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+import stat
+import threading
+
+import pytest
+
+from fbi_directory_check.scripts import rescan_daemon
+from fbi_directory_check.scripts.rescan_client import RescanClient, RescanError
+from fbi_directory_check.scripts.rescan_daemon import (FBI, RescanService,
+                                                       bind_unix_socket)
+from fbi_directory_check.utils.mounts import MountHealth
+
+RAIN = 'fbi_directory_check/tests/rain/'
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    health = MountHealth(mounts=['/'])
+    checks = []
+
+    probe = health.probe
+
+    def counted_probe(key):
+        checks.append(key)
+        return probe(key)
+
+    health.probe = counted_probe
+
+    service = RescanService(workers=2, mount_health=health)
+    path = str(tmp_path / 'rescan.sock')
+    server = bind_unix_socket(path, service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield RescanClient(path, timeout=5), service, checks
+
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+class FakeRabbitConnection:
+    """
+    Stands in for RabbitMQConnection. ``channel.connection`` is the
+    connection itself.
+    """
+
+    def __init__(self, conf):
+        self.channel = self
+        self.connection = self
+        self.lost = False
+        self.closed = False
+        self.polls = 0
+
+    def process_data_events(self, time_limit=None):
+        self.polls += 1
+        if self.lost:
+            raise ConnectionResetError('Connection reset by peer')
+
+    def close(self):
+        self.closed = True
+
+
+class TestDaemon:
+    def test_dryrun(self, daemon):
+        client, service, checks = daemon
+
+        first = client.submit(RAIN, extension='nc', recursive=True, dryrun=True)
+        second = client.submit(RAIN, extension='nc', recursive=True, dryrun=True)
+
+        for rescan in (first, second):
+            status = client.wait(rescan['id'], poll=0.05, timeout=10)
+            assert status['state'] == 'done'
+            assert status['files'] == 10
+
+        # The mount probe is trusted between requests
+        assert checks == ['/']
+        assert client.health() == {'workers': 2, 'rescans': {'done': 2}, 'unhealthy_mounts': []}
+        assert [status['id'] for status in client.list()] == [first['id'], second['id']]
+
+    def test_invalid_request(self, daemon):
+        client, _, _ = daemon
+
+        with pytest.raises(RescanError, match='scan_level'):
+            client.submit(RAIN, scan_level=4)
+
+        with pytest.raises(RescanError, match='Unknown rescan'):
+            client.status('missing')
+
+    def test_inaccessible(self, daemon):
+        client, service, _ = daemon
+        service.mount_health = MountHealth({'/': '/missing/sentinel'}, mounts=[])
+
+        status = client.wait(client.submit(RAIN, dryrun=True)['id'], poll=0.05, timeout=10)
+
+        assert status['state'] == 'failed'
+        assert status['error'] == 'OSError: Mount / is unhealthy'
+        assert client.health()['unhealthy_mounts'] == ['/']
+
+
+class TestConnections:
+    @pytest.fixture
+    def service(self, monkeypatch):
+        monkeypatch.setattr(rescan_daemon, 'RabbitMQConnection', FakeRabbitConnection)
+        service = RescanService(conf='rabbit.ini', workers=1)
+        yield service
+        service.close()
+
+    def test_reuse(self, service):
+        connection = service._connection(FBI)
+
+        assert service._connection(FBI) is connection
+        assert connection.polls == 1
+        assert service._connections == [connection]
+
+    def test_reconnect(self, service):
+        connection = service._connection(FBI)
+        connection.lost = True
+
+        replacement = service._connection(FBI)
+
+        assert replacement is not connection
+        assert connection.closed
+        assert service._connections == [replacement]
+
+    def test_drop(self, service):
+        connection = service._connection(FBI)
+        service._drop_connection(FBI)
+
+        assert connection.closed
+        assert service._connections == []
+        assert service._connection(FBI) is not connection
+
+    def test_per_thread(self, service):
+        connection = service._connection(FBI)
+        other = []
+
+        thread = threading.Thread(target=lambda: other.append(service._connection(FBI)))
+        thread.start()
+        thread.join()
+
+        assert other[0] is not connection
+        assert service._connections == [connection, other[0]]
+
+
+class TestSocket:
+    def test_private(self, tmp_path):
+        path = str(tmp_path / 'run' / 'rescan.sock')
+        server = bind_unix_socket(path, RescanService(workers=1))
+
+        assert stat.S_IMODE(os.stat(tmp_path / 'run').st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        server.server_close()
+
+    def test_group(self, tmp_path):
+        path = str(tmp_path / 'rescan.sock')
+        server = bind_unix_socket(path, RescanService(workers=1), mode=0o660)
+
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o660
+        server.server_close()
+
+    def test_already_listening(self, daemon, tmp_path):
+        with pytest.raises(OSError, match='already listening'):
+            bind_unix_socket(str(tmp_path / 'rescan.sock'), RescanService(workers=1))
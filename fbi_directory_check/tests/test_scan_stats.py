@@ -0,0 +1,59 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+
+from fbi_directory_check.scripts.rescan_directory import RescanDirs
+from fbi_directory_check.utils.scan_stats import ScanStats
+
+RAIN = os.path.abspath('fbi_directory_check/tests/rain')
+
+
+class TestScanStats:
+    def test_expected(self, tmp_path):
+        stats = ScanStats(str(tmp_path / 'stats.db'), runs=3)
+        assert stats.expected('/archive', 'fbi-l2') is None
+
+        for files in (1000, 90, 100, 110):
+            stats.record('/archive', 'fbi-l2', 10, files, 5)
+        stats.record('/archive', 'fbi-l2-r', 10, 5000)
+
+        # Median of the last three scans of the same kind
+        assert stats.expected('/archive', 'fbi-l2') == {'files': 100, 'directories': 5, 'seconds': 10}
+        assert [scan['files'] for scan in stats.history('/archive', 'fbi-l2')] == [110, 100, 90, 1000]
+
+    def test_trends(self, tmp_path):
+        stats = ScanStats(str(tmp_path / 'stats.db'))
+
+        for seconds in (10, 10, 20, 20):
+            stats.record('/slower', 'fbi-l2', seconds, 100)
+        for seconds in (10, 10):
+            stats.record('/steady', 'fbi-l2', seconds, 100)
+        stats.record('/once', 'fbi-l2', 10, 100)
+
+        trends = stats.trends()
+        assert [trend['tree'] for trend in trends] == ['/slower', '/steady']
+        assert trends[0]['change'] == -0.5
+        assert trends[0]['older_rate'] == 10 and trends[0]['newer_rate'] == 5
+
+    def test_rescan_stats(self, tmp_path):
+        stats = ScanStats(str(tmp_path / 'stats.db'))
+
+        def scan():
+            rd = RescanDirs(RAIN, scan_level=2, recursive=True, extension='nc', scan_stats=stats)
+            rd.scan()
+            return rd
+
+        first = scan()
+        assert first.progress.expected is None
+
+        second = scan()
+        assert second.progress.expected == 10
+        assert second.progress.estimate() == (1.0, None)
+
+        scans = stats.history(RAIN, 'fbi-l2-r .+?(.nc)$')
+        assert [(scan['files'], scan['directories'] > 0) for scan in scans] == [(10, True), (10, True)]
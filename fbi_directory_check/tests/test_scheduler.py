@@ -0,0 +1,39 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import time
+
+from fbi_directory_check.utils.scheduler import SpotScheduler
+
+
+class TestSpotScheduler:
+    def test_unchecked_first(self, tmp_path):
+        scheduler = SpotScheduler(str(tmp_path / 'scheduler.db'))
+        scheduler.load_spots([('spot_a', '/badc/a'), ('spot_b', '/badc/b')])
+
+        scheduler.record_check('/badc/a')
+
+        assert scheduler.next_spot() == '/badc/b'
+
+    def test_drift_raises_score(self, tmp_path):
+        scheduler = SpotScheduler(str(tmp_path / 'scheduler.db'))
+        scheduler.load_spots([('spot_a', '/badc/a'), ('spot_b', '/badc/b')])
+
+        scheduler.record_check('/badc/a')
+        scheduler.record_check('/badc/b')
+        scheduler.record_drift('/badc/a/sub/dir', 100)
+
+        now = time.time() + 86400
+        assert scheduler.score(now - 86400, 100, 0, now=now) > scheduler.score(now - 86400, 0, 0, now=now)
+        assert scheduler.next_spot() == '/badc/a'
+
+    def test_load_spots_removes_old(self, tmp_path):
+        scheduler = SpotScheduler(str(tmp_path / 'scheduler.db'))
+        scheduler.load_spots([('spot_a', '/badc/a'), ('spot_b', '/badc/b')])
+        scheduler.load_spots([('spot_b', '/badc/b')])
+
+        assert len(scheduler) == 1
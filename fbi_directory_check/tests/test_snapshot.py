@@ -0,0 +1,172 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+
+import pytest
+
+from fbi_directory_check.scripts.rescan_directory import RescanDirs
+from fbi_directory_check.utils import utils
+from fbi_directory_check.utils.constants import DEPOSIT, REMOVE
+from fbi_directory_check.utils.mounts import MountHealth
+from fbi_directory_check.utils.prune import IGNORE_FILE, PruneRules
+from fbi_directory_check.utils.snapshot import SnapshotDelta, read_snapshot
+
+SCOPE = {'scan_path': '/archive'}
+
+
+def run(path, entries, scope=SCOPE, **kwargs):
+    delta = SnapshotDelta(str(path), scope, chunk_size=2, **kwargs)
+    changes = list(delta.changes(entries))
+    delta.commit()
+    return changes, delta.counts
+
+
+class TestSnapshotDelta:
+
+    def test_delta(self, tmp_path):
+        snapshot = tmp_path / 'snapshot.gz'
+
+        changes, counts = run(snapshot, [('/archive/b', 2, 1), ('/archive/a', 1, 1), ('/archive/c', 3, 1)])
+        assert changes == [('/archive/a', DEPOSIT), ('/archive/b', DEPOSIT), ('/archive/c', DEPOSIT)]
+
+        # b changed, c removed, d added and a duplicated by overlapping datasets
+        changes, counts = run(snapshot, [('/archive/d', 4, 1), ('/archive/a', 1, 1), ('/archive/b', 2, 2),
+                                         ('/archive/a', 1, 1)])
+        assert changes == [('/archive/b', DEPOSIT), ('/archive/c', REMOVE), ('/archive/d', DEPOSIT)]
+        assert counts == {'new': 1, 'changed': 1, 'unchanged': 1, 'removed': 1}
+
+        scope, entries = read_snapshot(str(snapshot))
+        assert scope == SCOPE
+        assert list(entries) == [('/archive/a', 1, 1), ('/archive/b', 2, 2), ('/archive/d', 4, 1)]
+
+
+    def test_scope(self, tmp_path):
+        snapshot = tmp_path / 'snapshot.gz'
+        run(snapshot, [('/archive/a', 1, 1)])
+
+        with pytest.raises(ValueError, match='was taken of'):
+            run(snapshot, [], scope={'scan_path': '/other'})
+
+
+    def test_unhealthy_kept(self, tmp_path):
+        snapshot = tmp_path / 'snapshot.gz'
+        run(snapshot, [('/archive/good/a', 1, 1), ('/archive/hung/b', 1, 1)])
+
+        health = MountHealth(mounts=['/archive/good', '/archive/hung'])
+        health.mark_unhealthy('/archive/hung')
+
+        changes, _ = run(snapshot, [], mount_health=health)
+        assert changes == [('/archive/good/a', REMOVE)]
+        assert [entry[0] for entry in read_snapshot(str(snapshot))[1]] == ['/archive/hung/b']
+
+
+
+    def test_skipped_kept(self, tmp_path):
+        snapshot = tmp_path / 'snapshot.gz'
+        run(snapshot, [('/archive/a/1', 1, 1), ('/archive/a/b/2', 1, 1), ('/archive/c', 1, 1), ('/archive/d', 1, 1)])
+
+        # a/ could not be listed and c could not be stat'ed
+        changes, counts = run(snapshot, [], skipped={'/archive/a/', '/archive/c'})
+        assert changes == [('/archive/d', REMOVE)]
+        assert [entry[0] for entry in read_snapshot(str(snapshot))[1]] == ['/archive/a/1', '/archive/a/b/2', '/archive/c']
+
+
+class FakeRabbit:
+    """Collects the messages a scan publishes"""
+
+    def __init__(self):
+        self.messages = []
+
+    @staticmethod
+    def create_message(path, action):
+        return path, action
+
+    def publish_message(self, msg, routing_key=''):
+        self.messages.append(msg)
+
+
+class TestRescanSnapshot:
+
+    def make_archive(self, tmp_path):
+        archive = tmp_path / 'archive'
+        (archive / 'sub').mkdir(parents=True)
+        for name in ('a.nc', 'b.nc', 'c.txt', 'sub/d.nc'):
+            (archive / name).write_text(name)
+        return archive
+
+    def test_rescan_snapshot(self, tmp_path):
+        archive = self.make_archive(tmp_path)
+        snapshot = str(tmp_path / 'snapshot.gz')
+
+        def scan(**kwargs):
+            rabbit = FakeRabbit()
+            if not kwargs.get('dryrun'):
+                kwargs.update(use_rabbit=True, rabbit_connection=rabbit)
+            RescanDirs(str(archive), scan_level=2, recursive=True, extension='nc', snapshot=snapshot, **kwargs).scan()
+            return sorted((os.path.relpath(path, archive), action) for path, action in rabbit.messages)
+
+        # A dry run leaves no snapshot behind
+        scan(dryrun=True)
+        assert not os.path.exists(snapshot)
+
+        assert scan() == [('a.nc', DEPOSIT), ('b.nc', DEPOSIT), ('sub/d.nc', DEPOSIT)]
+        assert scan() == []
+
+        (archive / 'a.nc').write_text('changed')
+        (archive / 'b.nc').unlink()
+        assert scan() == [('a.nc', DEPOSIT), ('b.nc', REMOVE)]
+        assert [os.path.relpath(entry[0], archive) for entry in read_snapshot(snapshot)[1]] == ['a.nc', 'sub/d.nc']
+        assert sorted(os.listdir(tmp_path)) == ['archive', 'snapshot.gz']
+
+    def test_needs_rabbit(self, tmp_path):
+        with pytest.raises(ValueError, match='--snapshot'):
+            RescanDirs(str(tmp_path), scan_level=2, snapshot=str(tmp_path / 'snapshot.gz'))
+
+    def test_unlisted_kept(self, tmp_path, monkeypatch):
+        archive = self.make_archive(tmp_path)
+        snapshot = str(tmp_path / 'snapshot.gz')
+
+        def scan():
+            rabbit = FakeRabbit()
+            RescanDirs(str(archive), scan_level=2, recursive=True, extension='nc', snapshot=snapshot,
+                       use_rabbit=True, rabbit_connection=rabbit).scan()
+            return sorted((os.path.relpath(path, archive), action) for path, action in rabbit.messages)
+
+        scan()
+
+        scandir = os.scandir
+
+        def failing_scandir(path):
+            if os.fspath(path) == str(archive / 'sub'):
+                raise PermissionError(13, 'Permission denied', path)
+            return scandir(path)
+
+        monkeypatch.setattr(utils.os, 'scandir', failing_scandir)
+        (archive / 'b.nc').unlink()
+
+        # d.nc could not be seen so is not removed
+        assert scan() == [('b.nc', REMOVE)]
+        assert [os.path.relpath(entry[0], archive) for entry in read_snapshot(snapshot)[1]] == ['a.nc', 'sub/d.nc']
+
+    def test_pruned_kept(self, tmp_path):
+        archive = self.make_archive(tmp_path)
+        snapshot = str(tmp_path / 'snapshot.gz')
+
+        def scan():
+            rabbit = FakeRabbit()
+            RescanDirs(str(archive), scan_level=2, recursive=True, extension='nc', snapshot=snapshot,
+                       use_rabbit=True, rabbit_connection=rabbit, prune=PruneRules()).scan()
+            return sorted((os.path.relpath(path, archive), action) for path, action in rabbit.messages)
+
+        scan()
+        (archive / IGNORE_FILE).write_text('sub\n')
+
+        # Pruning a directory does not remove what was found under it
+        assert scan() == []
+        assert [os.path.relpath(entry[0], archive) for entry in read_snapshot(snapshot)[1]] == \
+            ['a.nc', 'b.nc', 'sub/d.nc']
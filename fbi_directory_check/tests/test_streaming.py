@@ -0,0 +1,33 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import random
+
+from fbi_directory_check.utils.streaming import (ADD, DELETE, external_sort,
+                                                 merge_diff)
+
+
+class TestStreaming:
+    def test_external_sort(self):
+        items = [f'/badc/a/{i}.nc' for i in range(1000)]
+        shuffled = random.sample(items, len(items))
+
+        assert list(external_sort(shuffled, chunk_size=64)) == sorted(items)
+
+    def test_merge_diff(self):
+        live = ['/a/1', '/a/2', '/a/4', '/a/4']
+        indexed = ['/a/2', '/a/3', '/a/4', '/a/5']
+
+        assert list(merge_diff(live, indexed)) == [
+            ('/a/1', ADD),
+            ('/a/3', DELETE),
+            ('/a/5', DELETE),
+        ]
+
+    def test_merge_diff_empty(self):
+        assert list(merge_diff([], ['/a/1'])) == [('/a/1', DELETE)]
+        assert list(merge_diff(['/a/1'], [])) == [('/a/1', ADD)]
@@ -0,0 +1,38 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import persistqueue
+
+from fbi_directory_check.scripts.submit_directories import submit
+
+
+def drain(queue):
+    items = []
+    while True:
+        try:
+            items.append(queue.get(block=False))
+        except persistqueue.Empty:
+            return items
+
+
+class TestSubmit:
+    def test_batches(self, tmp_path):
+        queue = persistqueue.SQLiteAckQueue(str(tmp_path), multithreading=True)
+
+        read, submitted = submit(queue, (f'/badc/{i}' for i in range(25)), batch_size=10)
+
+        assert (read, submitted) == (25, 25)
+        assert drain(queue) == [f'/badc/{i}' for i in range(25)]
+
+    def test_deduplicates(self, tmp_path):
+        queue = persistqueue.SQLiteAckQueue(str(tmp_path), multithreading=True)
+        queue.put('/badc/a')
+
+        read, submitted = submit(queue, ['/badc/a/', '/badc/b', '/badc/b', '/badc/c'])
+
+        assert (read, submitted) == (4, 2)
+        assert drain(queue) == ['/badc/a', '/badc/b', '/badc/c']
@@ -0,0 +1,116 @@
+# encoding: utf-8
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+
+from fbi_directory_check.utils import subtree
+from fbi_directory_check.utils.streaming import ADD, DELETE
+from fbi_directory_check.utils.subtree import (DIR, FILE, SubtreeWalk,
+                                               subtree_diff)
+
+
+def make_spot(tmp_path):
+    spot = tmp_path / 'spot'
+    for name in ('a/b', 'tape', 'elsewhere'):
+        os.makedirs(spot / name)
+    for name in ('a/1.nc', 'a/b/2.nc', 'a/00README', 'tape/00FILES_ON_TAPE', 'elsewhere/3.nc'):
+        (spot / name).touch()
+    os.symlink(spot / 'elsewhere', spot / 'a' / 'link')
+    return str(spot)
+
+
+class TestSubtreeWalk:
+
+    def test_walk(self, tmp_path):
+        spot = make_spot(tmp_path)
+        walk = SubtreeWalk(spot)
+
+        assert sorted(os.path.relpath(path, spot) + kind for path, kind in walk) == [
+            '.d', 'a/00READMEf', 'a/1.ncf', 'a/b/2.ncf', 'a/bd', 'a/linkd', 'ad',
+            'elsewhere/3.ncf', 'elsewhered', 'tape/00FILES_ON_TAPEf', 'taped',
+        ]
+        assert walk.directories == 5
+        assert walk.readmes == [f'{spot}/a/00README']
+        assert walk.tape_dirs == {f'{spot}/tape'}
+        assert walk.skipped == {f'{spot}/a/link'}
+
+
+    def test_listing_error(self, tmp_path, monkeypatch):
+        spot = make_spot(tmp_path)
+        scandir = os.scandir
+
+        class FailingScandir:
+            """Lists the first entry of a/ then fails as a stale handle would"""
+
+            def __init__(self, path):
+                self.it = scandir(path)
+                self.failing = path == f'{spot}/a'
+                self.count = 0
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                self.it.close()
+
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                if self.failing and self.count:
+                    raise OSError(116, 'Stale file handle')
+                self.count += 1
+                return next(self.it)
+
+        monkeypatch.setattr(subtree.os, 'scandir', FailingScandir)
+        walk = SubtreeWalk(spot)
+        list(walk)
+
+        assert f'{spot}/a' in walk.skipped
+        # Entries in the part of a/ which was not listed are kept
+        assert not walk.covers(f'{spot}/a/1.nc', FILE)
+        assert not walk.covers(f'{spot}/a/b/2.nc', FILE)
+        assert walk.covers(f'{spot}/elsewhere/gone.nc', FILE)
+
+
+class TestSubtreeDiff:
+
+    def test_diff(self, tmp_path):
+        spot = make_spot(tmp_path)
+        indexed = [
+            (f'{spot}/a/1.nc', FILE),
+            (f'{spot}/a/gone.nc', FILE),
+            (f'{spot}/a/gone', DIR),
+            # Not checked: on tape, below a link
+            (f'{spot}/tape/archived.nc', FILE),
+            (f'{spot}/a/link/3.nc', FILE),
+            (f'{spot}', DIR),
+            (f'{spot}/a', DIR),
+        ]
+
+        changes = [(os.path.relpath(path, spot), kind, action)
+                   for path, kind, action in subtree_diff(SubtreeWalk(spot), indexed, chunk_size=2)]
+
+        assert sorted(changes) == [
+            ('a/00README', FILE, ADD),
+            ('a/b', DIR, ADD),
+            ('a/b/2.nc', FILE, ADD),
+            ('a/gone', DIR, DELETE),
+            ('a/gone.nc', FILE, DELETE),
+            ('a/link', DIR, ADD),
+            ('elsewhere', DIR, ADD),
+            ('elsewhere/3.nc', FILE, ADD),
+            ('tape', DIR, ADD),
+            ('tape/00FILES_ON_TAPE', FILE, ADD),
+        ]
+
+
+    def test_unlisted_root(self, tmp_path):
+        walk = SubtreeWalk(str(tmp_path / 'missing'))
+        changes = list(subtree_diff(walk, [(str(tmp_path / 'missing' / 'a.nc'), FILE)]))
+
+        assert changes == [(str(tmp_path / 'missing'), DIR, ADD)]
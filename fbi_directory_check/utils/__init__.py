@@ -8,5 +8,5 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
-from .utils import (check_timeout, get_line_in_file, set_verbose,
-                    walk_storage_links)
+from .utils import (STORAGE_PREFIX, check_timeout, get_line_in_file,
+                    set_verbose, walk_storage_links)
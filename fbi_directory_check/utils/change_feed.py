@@ -0,0 +1,270 @@
+# encoding: utf-8
+"""
+Follow deposit logs and turn the changes they record into directories to
+check. Lines use the deposit log format also produced by
+``ElasticsearchConsistencyChecker.create_message``::
+
+    date_time:path:action:size:message
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fbi_directory_check.utils.constants import (DEPOSIT, MKDIR, README,
+                                                 REMOVE, RMDIR, SYMLINK)
+
+ACTIONS = (DEPOSIT, REMOVE, MKDIR, RMDIR, SYMLINK, README)
+
+# The date_time field contains colons but the path always starts with /
+LINE_PATTERN = re.compile(
+    r'^(?P<date_time>[^/]*?):(?P<path>/.*?):(?P<action>{}):(?P<size>[^:]*):'.format(
+        '|'.join(re.escape(action) for action in ACTIONS)
+    )
+)
+
+
+def parse_line(line: str) -> Optional[Tuple[str, str]]:
+    """
+    :param line: Deposit log line
+    :return: (path, action) or None if the line is not a change
+    """
+    match = LINE_PATTERN.match(line.strip())
+    if not match:
+        return None
+    return match.group('path'), match.group('action')
+
+
+def changed_directory(path: str, action: str) -> str:
+    """
+    The directory whose listing changes when the action is applied to the
+    path. This is always the parent, including for MKDIR and RMDIR as the
+    directory appears or disappears from its parent's listing.
+
+    :param path: Path from the log
+    :param action: Action from the log
+    :return: Directory to check
+    """
+    return os.path.dirname(os.path.normpath(path))
+
+
+class LogFollower:
+    """
+    Read new lines from log files as they are written, like ``tail -F``.
+    Files which are rotated or truncated are reopened from the start.
+    Offsets can be saved to a state file so a restart carries on where the
+    last run stopped.
+
+    :param paths: Log files to follow
+    :param from_start: Read files from the start rather than the end when
+        there is no saved offset
+    :param state_file: Optional JSON file to keep offsets in
+    """
+
+    def __init__(self, paths: List[str], from_start: bool = False,
+                 state_file: Optional[str] = None) -> None:
+        self.paths = list(paths)
+        self.from_start = from_start
+        self.state_file = state_file
+
+        # Files are followed until the caller stops
+        self.closed = False
+
+        # path -> (inode, offset)
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+        self._partial: Dict[str, str] = {}
+
+        if state_file and os.path.exists(state_file):
+            with open(state_file) as f:
+                self.offsets = {path: tuple(value) for path, value in json.load(f).items()}
+
+    def _start_offset(self, path: str, st: os.stat_result) -> int:
+        saved = self.offsets.get(path)
+
+        if saved and saved[0] == st.st_ino and saved[1] <= st.st_size:
+            return saved[1]
+
+        if saved or self.from_start:
+            # Rotated, truncated or asked to read everything
+            return 0
+
+        return st.st_size
+
+    def read(self) -> Iterator[str]:
+        """
+        Read the lines added to each file since the last call. Incomplete
+        lines are held until the rest is written.
+
+        :return: Iterator of lines
+        """
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            saved = self.offsets.get(path)
+            offset = self._start_offset(path, st)
+            if not saved or offset != saved[1]:
+                self._partial.pop(path, None)
+
+            if offset == st.st_size:
+                self.offsets[path] = (st.st_ino, offset)
+                continue
+
+            with open(path, 'r', errors='surrogateescape') as f:
+                f.seek(offset)
+                data = self._partial.pop(path, '') + f.read()
+                offset = f.tell()
+
+            self.offsets[path] = (st.st_ino, offset)
+
+            lines = data.split('\n')
+            if lines[-1]:
+                self._partial[path] = lines[-1]
+
+            yield from (line for line in lines[:-1] if line)
+
+    def checkpoint(self) -> Dict[str, Tuple[int, int]]:
+        """
+        The offsets of every line read so far. Partial lines are read again
+        after a restart as the offset is before them.
+
+        :return: path -> (inode, offset)
+        """
+        return {
+            path: (inode, offset - len(self._partial.get(path, '').encode('utf-8', 'surrogateescape')))
+            for path, (inode, offset) in self.offsets.items()
+        }
+
+    def save(self, offsets: Optional[Dict[str, Tuple[int, int]]] = None) -> None:
+        """
+        Write offsets to the state file
+
+        :param offsets: Offsets from an earlier checkpoint. Defaults to the
+            current offsets
+        """
+        if not self.state_file:
+            return
+
+        if offsets is None:
+            offsets = self.checkpoint()
+
+        tmp = f'{self.state_file}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(offsets, f)
+        os.replace(tmp, self.state_file)
+
+
+class StreamFollower:
+    """
+    Read lines from a stream such as stdin without blocking the caller.
+    Lines are read on a background thread.
+
+    :param stream: Text stream to read
+    """
+
+    def __init__(self, stream) -> None:
+        self.closed = False
+        self._lines = queue.Queue()
+        self._thread = threading.Thread(target=self._read_stream, args=(stream,), daemon=True)
+        self._thread.start()
+
+    def _read_stream(self, stream) -> None:
+        for line in stream:
+            self._lines.put(line.rstrip('\n'))
+        self._lines.put(None)
+
+    def read(self) -> Iterator[str]:
+        """
+        :return: Iterator of the lines received since the last call
+        """
+        while True:
+            try:
+                line = self._lines.get_nowait()
+            except queue.Empty:
+                return
+
+            if line is None:
+                self.closed = True
+                return
+
+            if line:
+                yield line
+
+    def checkpoint(self) -> None:
+        return None
+
+    def save(self, offsets=None) -> None:
+        pass
+
+
+class Coalescer:
+    """
+    Collapse bursts of changes to the same directory into one check. A
+    directory is released once it has been quiet for ``settle`` seconds, or
+    ``max_delay`` seconds after its first change if it never goes quiet.
+
+    :param settle: Seconds without a change before a directory is released
+    :param max_delay: Longest time a directory is held
+    """
+
+    def __init__(self, settle: float = 5, max_delay: float = 60) -> None:
+        self.settle = settle
+        self.max_delay = max_delay
+
+        # directory -> (first change, last change, number of the first change)
+        self._pending: Dict[str, Tuple[float, float, int]] = {}
+        self.events = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, directory: str, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self.events += 1
+        first, _, event = self._pending.get(directory, (now, now, self.events))
+        self._pending[directory] = (first, now, event)
+
+    def oldest_event(self) -> Optional[int]:
+        """
+        :return: Number of the earliest change still held, counting from 1
+            as ``events`` does, or None if nothing is held
+        """
+        return min((event for _, _, event in self._pending.values()), default=None)
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """
+        Remove and return the directories ready to be checked
+
+        :param now: Current monotonic time
+        :return: Directories in the order they first changed
+        """
+        now = time.monotonic() if now is None else now
+
+        ready = [
+            directory for directory, (first, last, _) in self._pending.items()
+            if now - last >= self.settle or now - first >= self.max_delay
+        ]
+
+        for directory in ready:
+            del self._pending[directory]
+
+        return ready
+
+    def flush(self) -> List[str]:
+        """
+        Remove and return all pending directories
+        """
+        ready = list(self._pending)
+        self._pending.clear()
+        return ready
@@ -0,0 +1,145 @@
+# encoding: utf-8
+"""
+Directory listing digests used to skip directories which have not changed
+since they were last reconciled with the indices.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+import sqlite3
+import threading
+import time
+from hashlib import sha1
+from typing import Iterable, Optional
+
+
+def listing_digest(entries: Iterable[os.DirEntry]) -> str:
+    """
+    Build a digest from the sorted names and sizes in a directory listing.
+    Directories are marked rather than sized as their size says nothing
+    about their content.
+
+    :param entries: DirEntry objects from os.scandir
+    :return: hex digest
+    """
+    digest = sha1()
+
+    for entry in sorted(entries, key=lambda e: e.name):
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                size = 'd'
+            else:
+                size = str(entry.stat(follow_symlinks=False).st_size)
+        except OSError:
+            size = '?'
+
+        digest.update(f'{entry.name}\0{size}\n'.encode('utf-8', 'surrogateescape'))
+
+    return digest.hexdigest()
+
+
+class DigestStore:
+    """
+    SQLite store of the listing digest for each reconciled directory.
+    Keeps count of hits and misses so the saving can be reported.
+
+    :param path: Path to the SQLite database file
+    :param max_age: Seconds before a stored digest is ignored and the
+        directory is checked in full again. Changes made to the indices
+        alone are only found once the digest expires, so this must be
+        positive.
+    :raises ValueError: if max_age is not positive
+    """
+
+    def __init__(self, path: str, max_age: float = 86400) -> None:
+        if max_age <= 0:
+            raise ValueError(f'max_age must be positive, not {max_age}')
+
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS digests ('
+                'directory TEXT PRIMARY KEY, digest TEXT, updated REAL)'
+            )
+
+    def get(self, directory: str) -> Optional[str]:
+        """
+        :param directory: Directory path
+        :return: stored digest or None if missing or expired
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT digest, updated FROM digests WHERE directory = ?',
+                (directory,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        if time.time() - row[1] > self.max_age:
+            return None
+
+        return row[0]
+
+    def check(self, directory: str, digest: str) -> bool:
+        """
+        Compare the live digest against the stored digest and record
+        the outcome.
+
+        :param directory: Directory path
+        :param digest: Digest of the live listing
+        :return: True if the directory is unchanged
+        """
+        if self.get(directory) == digest:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def set(self, directory: str, digest: str) -> None:
+        """
+        Store the digest after a successful reconciliation.
+
+        :param directory: Directory path
+        :param digest: Digest of the reconciled listing
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO digests (directory, digest, updated) VALUES (?, ?, ?)',
+                (directory, digest, time.time())
+            )
+
+    def discard(self, directory: str) -> None:
+        """
+        Forget the digest for a directory so it is checked in full next time.
+
+        :param directory: Directory path
+        """
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM digests WHERE directory = ?', (directory,))
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self) -> None:
+        self._conn.close()
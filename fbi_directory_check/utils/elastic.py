@@ -0,0 +1,238 @@
+# encoding: utf-8
+"""
+Helpers for fetching and removing documents in the indices.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import logging
+import queue
+import threading
+import time
+from hashlib import sha1
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from elasticsearch.exceptions import ConnectionError as ESConnectionError
+from elasticsearch.helpers import scan, streaming_bulk
+
+from fbi_directory_check import logstream
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+# Marks the end of a slice on the results queue
+_DONE = object()
+
+
+def path_id(path: str) -> str:
+    """
+    Document id used for a path in ceda-fbi and ceda-dirs
+
+    :param path: File or directory path
+    :return: sha1 hex digest of the path
+    """
+    return sha1(path.encode('utf-8')).hexdigest()
+
+
+def project(query: dict, fields: List[str]) -> dict:
+    """
+    Limit the fields returned for each hit.
+
+    :param query: Query body
+    :param fields: Source fields to return
+    :return: New query body with _source filtering
+    """
+    body = dict(query)
+    body['_source'] = list(fields)
+    return body
+
+
+def sliced_scan(es, index: str, query: dict, slices: int = 1, size: int = 1000,
+                scroll: str = '1m', threshold: int = 0,
+                buffer: Optional[int] = None) -> Iterator[dict]:
+    """
+    Scroll through all hits for a query. When more than one slice is
+    requested and the number of matching documents reaches the threshold,
+    the scroll is split into slices which are read concurrently, one thread
+    per slice. Hits are yielded in no particular order.
+
+    :param es: Elasticsearch client
+    :param index: Index to search
+    :param query: Query body
+    :param slices: Number of slices for large result sets
+    :param size: Page size for each scroll request
+    :param scroll: Scroll context keep alive
+    :param threshold: Minimum number of hits before slicing is used
+    :param buffer: Maximum number of hits held between the slice threads
+        and the consumer. Defaults to one page per slice.
+    :return: Iterator of hits
+    """
+
+    if slices > 1 and threshold:
+        count = es.count(index=index, body={'query': query['query']})['count']
+        if count < threshold:
+            slices = 1
+
+    if slices <= 1:
+        yield from scan(es, query=query, index=index, scroll=scroll, size=size)
+        return
+
+    results = queue.Queue(maxsize=buffer or size * slices)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_slice(slice_id):
+        body = dict(query)
+        body['slice'] = {'id': slice_id, 'max': slices}
+        try:
+            for hit in scan(es, query=body, index=index, scroll=scroll, size=size):
+                if not _put(hit):
+                    return
+        except Exception as e:
+            _put(e)
+        finally:
+            _put(_DONE)
+
+    threads = [
+        threading.Thread(target=_read_slice, args=(i,), name=f'{index}-slice-{i}', daemon=True)
+        for i in range(slices)
+    ]
+    for thread in threads:
+        thread.start()
+
+    remaining = slices
+    try:
+        while remaining:
+            item = results.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+
+
+class BulkRemover:
+    """
+    Delete documents from an index in batches using the bulk API.
+    Documents which are already missing count as removed. Batches which
+    fail on a connection error are retried with exponential backoff and
+    throttled (429) items are retried by the bulk helper. Paths which
+    still cannot be removed are passed to on_failure.
+
+    :param es: Elasticsearch client
+    :param index: Index to delete from
+    :param batch_size: Number of deletions per bulk request
+    :param max_retries: Number of retries for a batch
+    :param on_failure: Called with each path which could not be removed
+    """
+
+    def __init__(self, es, index: str, batch_size: int = 500, max_retries: int = 3,
+                 on_failure: Optional[Callable[[str], None]] = None) -> None:
+        self.es = es
+        self.index = index
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.on_failure = on_failure
+
+        self.removed = 0
+        self.failed = 0
+        self._batch = []
+
+    def add(self, path: str) -> None:
+        """
+        Queue a path for removal, sending the batch once it is full.
+
+        :param path: Path of the document to remove
+        """
+        self._batch.append(path)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def extend(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            self.add(path)
+
+    def _send(self, paths: List[str]) -> List[str]:
+        """
+        Send one bulk request
+
+        :return: paths which failed
+        """
+        ids = {path_id(path): path for path in paths}
+        actions = (
+            {'_op_type': 'delete', '_index': self.index, '_id': _id}
+            for _id in ids
+        )
+
+        failed = []
+        results = streaming_bulk(
+            self.es, actions,
+            chunk_size=len(ids),
+            max_retries=self.max_retries,
+            raise_on_error=False
+        )
+
+        # Retried items are returned out of order so match on the id
+        for ok, result in results:
+            result = result.get('delete', {})
+            if not ok and result.get('status') != 404:
+                path = ids[result.get('_id')]
+                logger.error(f'Failed to remove {path} from {self.index}: {result}')
+                failed.append(path)
+
+        return failed
+
+    def flush(self) -> int:
+        """
+        Send any queued deletions
+
+        :return: Number of paths removed
+        """
+        if not self._batch:
+            return 0
+
+        paths, self._batch = self._batch, []
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                failed = self._send(paths)
+                break
+            except ESConnectionError as e:
+                if attempt == self.max_retries:
+                    logger.error(f'Bulk removal from {self.index} failed: {e}')
+                    failed = paths
+                    break
+                backoff = 2 ** attempt
+                logger.warning(f'Bulk removal from {self.index} failed, retrying in {backoff}s: {e}')
+                time.sleep(backoff)
+
+        removed = len(paths) - len(failed)
+        self.removed += removed
+        self.failed += len(failed)
+
+        if self.on_failure:
+            for path in failed:
+                self.on_failure(path)
+
+        return removed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
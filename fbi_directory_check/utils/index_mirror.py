@@ -0,0 +1,185 @@
+# encoding: utf-8
+"""
+Local SQLite mirror of the paths held in the ``ceda-fbi`` and ``ceda-dirs``
+indices, keyed by the directory they were fetched for.
+
+The consistency checker compares against this copy rather than querying
+the cluster for every directory. Entries are filled the first time a
+directory is checked, kept current from the documents which have changed
+since the last sync and expire after ``max_age`` seconds so that changes
+the incremental sync cannot see are eventually picked up.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Set
+
+from fbi_directory_check import logstream
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+
+class IndexMirror:
+    """
+    Per-directory copy of the index state.
+
+    :param path: Path to the SQLite database file
+    :param max_age: Seconds before a cached directory is fetched from the
+        cluster again. 0 disables expiry.
+    """
+
+    _SQL_CREATE = (
+        'CREATE TABLE IF NOT EXISTS directories ('
+        'idx TEXT, directory TEXT, fetched REAL, '
+        'PRIMARY KEY (idx, directory))',
+        'CREATE TABLE IF NOT EXISTS paths ('
+        'idx TEXT, directory TEXT, path TEXT, '
+        'PRIMARY KEY (idx, directory, path)) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS sync ('
+        'idx TEXT PRIMARY KEY, last_sync TEXT)',
+    )
+
+    def __init__(self, path: str, max_age: float = 86400) -> None:
+        self.path = path
+        self.max_age = max_age
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+
+        with self._conn:
+            for sql in self._SQL_CREATE:
+                self._conn.execute(sql)
+
+    def get(self, index: str, directory: str) -> Optional[Set[str]]:
+        """
+        Return the mirrored paths for the directory or None if the directory
+        is not held or has expired.
+
+        :param index: Index name
+        :param directory: Directory the paths were fetched for
+        :return: set of paths or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT fetched FROM directories WHERE idx = ? AND directory = ?',
+                (index, directory)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            if self.max_age and time.time() - row[0] > self.max_age:
+                logger.debug(f'Mirror entry expired: {index} {directory}')
+                return None
+
+            rows = self._conn.execute(
+                'SELECT path FROM paths WHERE idx = ? AND directory = ?',
+                (index, directory)
+            )
+            return {path for path, in rows}
+
+    def store(self, index: str, directory: str, paths: Iterable[str]) -> None:
+        """
+        Replace the mirrored paths for the directory with a fresh copy
+        from the cluster.
+
+        :param index: Index name
+        :param directory: Directory the paths were fetched for
+        :param paths: Paths returned by the index
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM paths WHERE idx = ? AND directory = ?',
+                (index, directory)
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO paths (idx, directory, path) VALUES (?, ?, ?)',
+                ((index, directory, path) for path in paths)
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO directories (idx, directory, fetched) VALUES (?, ?, ?)',
+                (index, directory, time.time())
+            )
+
+    def update(self, index: str, directory: str, added: Iterable[str] = (),
+               removed: Iterable[str] = ()) -> None:
+        """
+        Apply the changes published for a directory so that the mirror
+        reflects the expected state of the index once they are processed.
+
+        :param index: Index name
+        :param directory: Directory the paths were fetched for
+        :param added: Paths sent for indexing
+        :param removed: Paths sent for removal
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO paths (idx, directory, path) VALUES (?, ?, ?)',
+                ((index, directory, path) for path in added)
+            )
+            self._conn.executemany(
+                'DELETE FROM paths WHERE idx = ? AND directory = ? AND path = ?',
+                ((index, directory, path) for path in removed)
+            )
+
+    def refresh(self, index: str, changes: Iterable[tuple]) -> int:
+        """
+        Add changed documents to any mirrored directory they belong to.
+        Directories which are not mirrored are ignored and will be fetched
+        in full when they are next checked.
+
+        :param index: Index name
+        :param changes: Iterable of (directory, path) pairs
+        :return: Number of paths added to the mirror
+        """
+        count = 0
+        with self._lock, self._conn:
+            for directory, path in changes:
+                cur = self._conn.execute(
+                    'INSERT OR IGNORE INTO paths (idx, directory, path) '
+                    'SELECT idx, directory, ? FROM directories WHERE idx = ? AND directory = ?',
+                    (path, index, directory)
+                )
+                count += max(cur.rowcount, 0)
+        return count
+
+    def get_last_sync(self, index: str) -> Optional[str]:
+        """
+        :param index: Index name
+        :return: Changed field value to sync from or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT last_sync FROM sync WHERE idx = ?', (index,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_last_sync(self, index: str, timestamp: str) -> None:
+        """
+        :param index: Index name
+        :param timestamp: Largest changed field value seen, as an ISO timestamp
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sync (idx, last_sync) VALUES (?, ?)',
+                (index, timestamp)
+            )
+
+    def close(self) -> None:
+        self._conn.close()
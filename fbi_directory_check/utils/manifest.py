@@ -0,0 +1,63 @@
+# encoding: utf-8
+"""
+Read file manifests: one path per line, as written by ``fbi_rescan_dir
+--output`` or by filesystem tools such as ``lfs find <dir> -type f``.
+Manifests may be gzip compressed and are read as a stream.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import gzip
+import io
+import sys
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Read from stdin
+STDIN = '-'
+
+
+@contextmanager
+def open_manifest(source: str) -> Iterator[IO[str]]:
+    """
+    Open a manifest for reading. Gzip compression is detected from the
+    content rather than the name so compressed stdin works too.
+
+    :param source: Path to the manifest or - for stdin
+    :return: Text stream
+    """
+    stdin = source == STDIN
+    raw = sys.stdin.buffer if stdin else open(source, 'rb')
+
+    try:
+        stream = raw
+        if raw.peek(2)[:2] == GZIP_MAGIC:
+            stream = gzip.GzipFile(fileobj=raw)
+
+        # Paths are bytes on disk so undecodable names are kept as surrogates
+        text = io.TextIOWrapper(stream, encoding='utf-8', errors='surrogateescape')
+        try:
+            yield text
+        finally:
+            # Leave stdin open for the caller
+            text.detach()
+    finally:
+        if not stdin:
+            raw.close()
+
+
+def iter_manifest(source: str) -> Iterator[str]:
+    """
+    :param source: Path to the manifest or - for stdin
+    :return: Iterator of the paths in the manifest, skipping blank lines
+    """
+    with open_manifest(source) as f:
+        for line in f:
+            path = line.rstrip('\r\n')
+            if path:
+                yield path
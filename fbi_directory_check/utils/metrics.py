@@ -0,0 +1,278 @@
+# encoding: utf-8
+"""
+Lightweight counters, gauges and latency histograms exported in the
+Prometheus text format, either from a local HTTP endpoint or by writing
+a file periodically for the node exporter textfile collector.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, Optional, Tuple
+
+from fbi_directory_check import logstream
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+STAGE_SECONDS = 'fbi_stage_duration_seconds'
+
+
+class Metrics:
+    """
+    Registry of metrics. Metric types are fixed by the first call made
+    for a name.
+
+    :param buckets: Upper bounds of the histogram buckets in seconds
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._values: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+
+        # Told when each stage starts and ends while profiling
+        self.stage_listener = None
+
+    @staticmethod
+    def _labels(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def _register(self, name: str, mtype: str, help: str = '') -> None:
+        if name not in self._types:
+            self._types[name] = mtype
+            self._help[name] = help
+        elif self._types[name] != mtype:
+            raise ValueError(f'{name} is already registered as a {self._types[name]}')
+
+    def describe(self, name: str, mtype: str, help: str) -> None:
+        """
+        Set the type and help text of a metric before it is first used.
+
+        :param name: Metric name
+        :param mtype: One of counter, gauge or histogram
+        :param help: Help text
+        """
+        with self._lock:
+            self._register(name, mtype, help)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Increment a counter"""
+        key = self._labels(labels)
+        with self._lock:
+            self._register(name, 'counter')
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Set a gauge"""
+        key = self._labels(labels)
+        with self._lock:
+            self._register(name, 'gauge')
+            self._values.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Add an observation to a histogram"""
+        key = self._labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._register(name, 'histogram')
+            series = self._histograms.setdefault(name, {})
+            # Bucket counts followed by the sum of observations
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = [0] * (len(self.buckets) + 2)
+            hist[index] += 1
+            hist[-1] += value
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Time the enclosed block as a stage of processing.
+
+        :param stage: Name of the stage
+        """
+        listener = self.stage_listener
+        if listener:
+            listener.enter(stage)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+            if listener:
+                listener.exit(stage)
+
+    def timed(self, iterable: Iterable, stage: str) -> Iterator:
+        """
+        Time how long each item of an iterable takes to produce. Used to
+        time walks which yield as they go.
+
+        :param iterable: Iterable to wrap
+        :param stage: Name of the stage
+        """
+        iterator = iter(iterable)
+        while True:
+            listener = self.stage_listener
+            if listener:
+                listener.enter(stage)
+
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+                return
+            finally:
+                if listener:
+                    listener.exit(stage)
+            self.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+            yield item
+
+    def stage_totals(self) -> Dict[str, Tuple[int, float]]:
+        """
+        :return: (count, total seconds) observed for each stage
+        """
+        with self._lock:
+            series = dict(self._histograms.get(STAGE_SECONDS, {}))
+            return {
+                dict(key).get('stage'): (sum(hist[:-1]), hist[-1])
+                for key, hist in series.items()
+            }
+
+    def get(self, name: str, **labels) -> Optional[float]:
+        """
+        :return: Current value of a counter or gauge or the observation
+            count of a histogram
+        """
+        key = self._labels(labels)
+        with self._lock:
+            if name in self._histograms:
+                hist = self._histograms[name].get(key)
+                return sum(hist[:-1]) if hist else None
+            return self._values.get(name, {}).get(key)
+
+    @staticmethod
+    def _format_labels(labels: tuple) -> str:
+        if not labels:
+            return ''
+        content = ','.join(
+            '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for k, v in labels
+        )
+        return '{' + content + '}'
+
+    def render(self) -> str:
+        """
+        :return: All metrics in the Prometheus text exposition format
+        """
+        lines = []
+
+        with self._lock:
+            for name in sorted(self._types):
+                mtype = self._types[name]
+                if self._help[name]:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {mtype}')
+
+                if mtype != 'histogram':
+                    for labels, value in sorted(self._values.get(name, {}).items()):
+                        lines.append(f'{name}{self._format_labels(labels)} {value}')
+                    continue
+
+                for labels, hist in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ('+Inf',), hist[:-1]):
+                        cumulative += count
+                        bucket_labels = self._format_labels(labels + (('le', bound),))
+                        lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+                    lines.append(f'{name}_sum{self._format_labels(labels)} {hist[-1]}')
+                    lines.append(f'{name}_count{self._format_labels(labels)} {cumulative}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        """
+        Write the metrics to a file. The file is replaced atomically so that
+        collectors never read a partial file.
+
+        :param path: Output file path
+        """
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as writer:
+            writer.write(self.render())
+        os.replace(tmp, path)
+
+    def start_textfile_writer(self, path: str, interval: float = 15) -> threading.Thread:
+        """
+        Write the metrics file every interval seconds from a daemon thread.
+
+        :param path: Output file path
+        :param interval: Seconds between writes
+        """
+        def _write():
+            while True:
+                try:
+                    self.write_textfile(path)
+                except OSError as e:
+                    logger.error(f'Unable to write metrics file {path}: {e}')
+                time.sleep(interval)
+
+        thread = threading.Thread(target=_write, name='metrics-textfile', daemon=True)
+        thread.start()
+        return thread
+
+    def start_http_server(self, port: int, address: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+        """
+        Serve the metrics on /metrics from a daemon thread.
+
+        :param port: Port to listen on
+        :param address: Address to bind to
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        server = ThreadingHTTPServer((address, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+        thread.start()
+        logger.info(f'Serving metrics on http://{address}:{server.server_port}/metrics')
+        return server
+
+
+# Default registry shared by the scripts
+metrics = Metrics()
+metrics.describe(STAGE_SECONDS, 'histogram', 'Time spent in each stage of processing')
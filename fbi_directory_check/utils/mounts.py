@@ -0,0 +1,266 @@
+# encoding: utf-8
+"""
+Health of the mounts a scan depends on. A hung NFS or parallel filesystem
+mount blocks any process which touches it, so mounts are probed from a
+background thread with a timeout and the result is cached for a short time.
+The walkers consult the cache before descending so a scan skips mounts
+known to be hung rather than blocking on them.
+
+Each path is attributed to the longest matching mount point or configured
+sentinel prefix. Prefixes with a sentinel are probed by reading the
+sentinel and other mounts by listing the mount point.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import errno
+import logging
+import os
+import stat
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from fbi_directory_check import logstream
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+# Probed before scans of the ESACCI archive, as the deprecated check_timeout does
+ESACCI_SENTINEL = '/neodc/esacci/esacci_terms_and_conditions.txt'
+DEFAULT_SENTINELS = {'/neodc/esacci': ESACCI_SENTINEL}
+
+# Filesystem types with nothing to probe
+VIRTUAL_FILESYSTEMS = {
+    'proc', 'sysfs', 'devtmpfs', 'devpts', 'tmpfs', 'cgroup', 'cgroup2', 'mqueue', 'securityfs',
+    'debugfs', 'tracefs', 'pstore', 'bpf', 'autofs', 'configfs', 'fusectl', 'hugetlbfs', 'binfmt_misc',
+}
+
+# Errors from a walk which mean the mount has gone rather than one entry
+STALL_ERRORS = {errno.ESTALE, errno.EIO, errno.ETIMEDOUT, errno.EHOSTDOWN, errno.ENOTCONN}
+
+
+def read_mount_points(path: str = '/proc/self/mounts') -> List[str]:
+    """
+    :param path: Mount table in the /proc/mounts format
+    :return: Mount points of real filesystems, or an empty list where the
+        table is not available
+    """
+    mounts = []
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3 or fields[2] in VIRTUAL_FILESYSTEMS:
+                    continue
+                # Spaces and other characters are octal escaped
+                mounts.append(fields[1].encode('latin-1').decode('unicode_escape'))
+    except OSError:
+        pass
+    return mounts
+
+
+def probe_path(path: str) -> None:
+    """
+    Touch a path the way a scan would. Directories are read as well as
+    stat'd as the attributes may be answered from the client cache.
+
+    :param path: Sentinel file or mount point
+    :raises OSError: if the path cannot be read
+    """
+    st = os.stat(path)
+    if stat.S_ISDIR(st.st_mode):
+        with os.scandir(path) as it:
+            next(it, None)
+
+
+class MountHealth:
+    """
+    Cached health of the mounts under which paths are scanned
+
+    :param sentinels: Prefix to sentinel path. The prefix is healthy while
+        the sentinel can be read within the timeout.
+    :param timeout: Seconds allowed for a probe
+    :param ttl: Seconds a probe result is trusted
+    :param mounts: Mount points. Read from /proc/self/mounts if not given
+    """
+
+    def __init__(self, sentinels: Optional[Dict[str, str]] = None, timeout: float = 10,
+                 ttl: float = 60, mounts: Optional[Iterable[str]] = None) -> None:
+        self.sentinels = {os.path.normpath(prefix): path for prefix, path in (sentinels or {}).items()}
+        self.timeout = timeout
+        self.ttl = ttl
+
+        self.mount_points = {os.path.normpath(m) for m in (read_mount_points() if mounts is None else mounts)}
+
+        # Keys longest first so the first match is the innermost
+        self._keys = sorted(self.mount_points | set(self.sentinels), key=len, reverse=True)
+
+        self._lock = threading.Lock()
+        # key -> (healthy, expires)
+        self._status: Dict[str, tuple] = {}
+        # key -> probe thread still running
+        self._probes: Dict[str, threading.Thread] = {}
+
+    def mount_for(self, path: str) -> Optional[str]:
+        """
+        The innermost mount point or sentinel prefix containing the path.
+        Only the path string is used so this cannot block.
+
+        :param path: Path, relative paths are taken from the working directory
+        :return: Mount key or None if nothing matches
+        """
+        path = os.path.abspath(path)
+        for key in self._keys:
+            if path == key or path.startswith(key.rstrip('/') + '/'):
+                return key
+        return None
+
+    def is_boundary(self, path: str) -> bool:
+        """
+        :param path: Normalised directory path
+        :return: Whether the path is a mount point or sentinel prefix, where
+            a walk moves on to a different mount
+        """
+        return path in self.mount_points or path in self.sentinels
+
+    def _probe(self, key: str, result: dict) -> None:
+        try:
+            probe_path(self.sentinels.get(key, key))
+            result['healthy'] = True
+        except OSError as e:
+            result['error'] = e
+
+    def probe(self, key: str) -> bool:
+        """
+        Probe a mount now, waiting at most the timeout. A probe left hung by
+        an earlier call is not repeated and the mount stays unhealthy.
+
+        :param key: Mount key from mount_for
+        :return: Whether the mount is healthy
+        """
+        with self._lock:
+            thread = self._probes.get(key)
+            if thread is not None and thread.is_alive():
+                result = None
+            else:
+                result = {'healthy': False}
+                thread = threading.Thread(target=self._probe, args=(key, result), name=f'probe {key}',
+                                          daemon=True)
+                self._probes[key] = thread
+                thread.start()
+
+        if result is None:
+            healthy, reason = False, 'earlier probe still hung'
+        else:
+            thread.join(self.timeout)
+            if thread.is_alive():
+                healthy, reason = False, f'no response in {self.timeout}s'
+            else:
+                healthy, reason = result['healthy'], result.get('error')
+
+        if healthy:
+            self._set(key, True)
+        else:
+            self.mark_unhealthy(key, reason)
+
+        return healthy
+
+    def _set(self, key: str, healthy: bool) -> None:
+        with self._lock:
+            self._status[key] = (healthy, time.monotonic() + self.ttl)
+
+    def mark_unhealthy(self, key: str, reason=None) -> None:
+        """
+        Record a mount as unhealthy until the TTL runs out
+
+        :param key: Mount key from mount_for
+        :param reason: Error or description logged with the change
+        """
+        with self._lock:
+            was_healthy = self._status.get(key, (True, 0))[0]
+            self._status[key] = (False, time.monotonic() + self.ttl)
+
+        if was_healthy:
+            logger.error(f'Mount {key} is unhealthy: {reason}')
+
+    def healthy(self, key: Optional[str]) -> bool:
+        """
+        :param key: Mount key from mount_for. None is always healthy.
+        :return: Cached health of the mount, probing if it has expired
+        """
+        if key is None:
+            return True
+
+        status = self._status.get(key)
+        if status is not None and time.monotonic() < status[1]:
+            return status[0]
+
+        return self.probe(key)
+
+    def check(self, path: str) -> bool:
+        """
+        :param path: Path to be scanned
+        :return: Whether the mount holding the path is healthy
+        """
+        return self.healthy(self.mount_for(path))
+
+    def report_error(self, key: Optional[str], error: OSError) -> None:
+        """
+        Mark the mount unhealthy if a walk error means the mount has gone
+
+        :param key: Mount key of the path which failed
+        :param error: Error raised by the walk
+        """
+        if key is not None and error.errno in STALL_ERRORS:
+            self.mark_unhealthy(key, error)
+
+    def unhealthy(self) -> List[str]:
+        """
+        :return: Mounts currently recorded as unhealthy
+        """
+        now = time.monotonic()
+        with self._lock:
+            return sorted(key for key, (healthy, expires) in self._status.items()
+                          if not healthy and now < expires)
+
+
+def add_mount_health_arguments(parser) -> None:
+    """
+    Add the mount health options to an argument parser
+
+    :param parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--mount-sentinel', dest='mount_sentinels', action='append', metavar='PREFIX=PATH',
+                        help='Probe PATH to check the health of paths under PREFIX. Can be given more than once. '
+                             f'Defaults to {ESACCI_SENTINEL} for /neodc/esacci')
+    parser.add_argument('--mount-timeout', dest='mount_timeout', type=float, default=10,
+                        help='Seconds allowed for a mount to respond to a probe')
+    parser.add_argument('--mount-ttl', dest='mount_ttl', type=float, default=60,
+                        help='Seconds a mount probe result is trusted')
+    parser.add_argument('--no-mount-check', dest='mount_check', action='store_false',
+                        help='Do not probe mounts before and during the scan')
+
+
+def mount_health_from_args(args) -> Optional[MountHealth]:
+    """
+    :param args: Arguments parsed with add_mount_health_arguments
+    :return: MountHealth or None if disabled
+    """
+    if not args.mount_check:
+        return None
+
+    sentinels = DEFAULT_SENTINELS
+    if args.mount_sentinels:
+        sentinels = {}
+        for value in args.mount_sentinels:
+            prefix, sep, path = value.partition('=')
+            if not sep or not prefix or not path:
+                raise ValueError(f'--mount-sentinel must be PREFIX=PATH, not {value}')
+            sentinels[prefix] = path
+
+    return MountHealth(sentinels, timeout=args.mount_timeout, ttl=args.mount_ttl)
@@ -0,0 +1,263 @@
+# encoding: utf-8
+"""
+Opt-in profiling for the command line utilities. A run with ``--profile``
+collects a cProfile dump alongside a summary of the wall-clock time and
+filesystem calls spent in each stage of processing.
+
+Stage times come from the ``metrics`` stage timers. Stages which are too
+fine grained to time on every run, such as filtering and encoding each
+file, use ``stage`` which does nothing unless a profiler is running.
+Filesystem calls are counted by wrapping the ``os`` functions in FS_CALLS
+and are put against the innermost stage running on the calling thread.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import io
+import logging
+import os
+import signal
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator, Optional
+
+from fbi_directory_check import logstream
+from fbi_directory_check.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+# os functions wrapped to count filesystem calls
+FS_CALLS = ('scandir', 'listdir', 'stat', 'lstat', 'readlink')
+
+_NULL = nullcontext()
+
+# Profiler for the current run, if any
+_profiler = None
+
+
+@contextmanager
+def count_fs_calls(key: Optional[Callable[[str], object]] = None) -> Iterator[Counter]:
+    """
+    Count calls to the os functions in FS_CALLS while in the context
+
+    :param key: Function mapping the os function name to the counter key.
+        Defaults to the name.
+    :return: Counter of calls
+    """
+    counts = Counter()
+    originals = {name: getattr(os, name) for name in FS_CALLS}
+
+    def wrap(name, func):
+        def wrapper(*args, **kwargs):
+            counts[key(name) if key else name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    for name, func in originals.items():
+        setattr(os, name, wrap(name, func))
+
+    try:
+        yield counts
+    finally:
+        for name, func in originals.items():
+            setattr(os, name, func)
+
+
+def stage(name: str):
+    """
+    Time a fine grained stage, only while profiling.
+
+    :param name: Name of the stage
+    :return: context manager
+    """
+    if _profiler is None:
+        return _NULL
+    return metrics.timer(name)
+
+
+def process_syscalls() -> dict:
+    """
+    :return: Read and write syscall counts for the process from
+        /proc/self/io, or an empty dict where it is not available
+    """
+    try:
+        with open('/proc/self/io') as f:
+            values = dict(line.split(': ') for line in f.read().splitlines())
+        return {'read': int(values['syscr']), 'write': int(values['syscw'])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+class Profiler:
+    """
+    Collects a cProfile profile of the thread which starts it and counts
+    filesystem calls by stage on every thread.
+
+    :param path: Path for the pstats dump. The summary is written to the
+        same path with .txt added.
+    """
+
+    def __init__(self, path: str) -> None:
+        import cProfile
+
+        self.path = path
+        self._profile = cProfile.Profile()
+        self._stages = threading.local()
+        self._fs_context = None
+        self._fs_calls = Counter()
+        self._syscalls_start = {}
+        self.running = False
+
+    def _current(self, name: str) -> tuple:
+        stack = getattr(self._stages, 'stack', None)
+        return (stack[-1] if stack else None), name
+
+    def enter(self, name: str) -> None:
+        """Called by the metrics stage timers as a stage starts"""
+        stack = getattr(self._stages, 'stack', None)
+        if stack is None:
+            stack = self._stages.stack = []
+        stack.append(name)
+
+    def exit(self, name: str) -> None:
+        """Called by the metrics stage timers as a stage ends"""
+        stack = getattr(self._stages, 'stack', None)
+        if stack:
+            stack.pop()
+
+    def start(self) -> None:
+        global _profiler
+
+        self._syscalls_start = process_syscalls()
+        self._fs_context = count_fs_calls(key=self._current)
+        self._fs_calls = self._fs_context.__enter__()
+
+        metrics.stage_listener = self
+        _profiler = self
+
+        self._profile.enable()
+        self.running = True
+
+    def stop(self) -> None:
+        global _profiler
+
+        if not self.running:
+            return
+
+        self._profile.disable()
+        self.running = False
+
+        metrics.stage_listener = None
+        _profiler = None
+
+        self._fs_context.__exit__(None, None, None)
+
+    def summary(self, top: int = 25) -> str:
+        """
+        :param top: Number of functions to list by cumulative time
+        :return: Text summary of the stages and the hottest functions
+        """
+        import pstats
+
+        stage_calls = Counter()
+        fs_by_function = Counter()
+        for (stage_name, function), count in list(self._fs_calls.items()):
+            stage_calls[stage_name] += count
+            fs_by_function[function] += count
+
+        totals = metrics.stage_totals()
+
+        lines = [
+            'Stages may nest, e.g. filtering happens during the walk, so times do not add up',
+            f'{"stage":<16} {"count":>10} {"seconds":>12} {"fs calls":>10}',
+        ]
+
+        for name in sorted(set(totals) | {s for s in stage_calls if s}):
+            count, seconds = totals.get(name, (0, 0.0))
+            lines.append(f'{name:<16} {count:>10} {seconds:>12.3f} {stage_calls.get(name, 0):>10}')
+
+        lines.append(f'{"(no stage)":<16} {"":>10} {"":>12} {stage_calls.get(None, 0):>10}')
+        lines.append('')
+        lines.append('fs calls by function: ' + ', '.join(
+            f'{function}={count}' for function, count in sorted(fs_by_function.items())
+        ))
+
+        syscalls = process_syscalls()
+        if syscalls and self._syscalls_start:
+            lines.append('process syscalls: ' + ', '.join(
+                f'{kind}={syscalls[kind] - self._syscalls_start.get(kind, 0)}' for kind in syscalls
+            ))
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(top)
+
+        lines.append('')
+        lines.append(stream.getvalue())
+
+        return '\n'.join(lines)
+
+    def dump(self) -> None:
+        """
+        Write the pstats dump and the summary. Profiling carries on
+        afterwards if it is running.
+        """
+        running = self.running
+        if running:
+            self._profile.disable()
+
+        try:
+            self._profile.dump_stats(self.path)
+            with open(f'{self.path}.txt', 'w') as f:
+                f.write(self.summary())
+            logger.warning(f'Profile written to {self.path} and {self.path}.txt')
+        finally:
+            if running:
+                self._profile.enable()
+
+
+def add_profile_argument(parser) -> None:
+    """
+    Add the --profile option to an argument parser
+
+    :param parser: argparse.ArgumentParser
+    """
+    prog = os.path.basename(sys.argv[0]) or 'fbi'
+    parser.add_argument('--profile', nargs='?', const=f'{prog}.{os.getpid()}.prof', default=None,
+                        metavar='PATH',
+                        help='Write a cProfile dump to PATH and a summary of time and filesystem calls '
+                             'by stage to PATH.txt when the run ends')
+
+
+@contextmanager
+def profiling(path: Optional[str], dump_on_signal: bool = False) -> Iterator[Optional[Profiler]]:
+    """
+    Profile the enclosed block if a path is given
+
+    :param path: Path for the pstats dump, or None to do nothing
+    :param dump_on_signal: Also write the profile on SIGUSR1, for long
+        running processes
+    :return: Profiler or None
+    """
+    if not path:
+        yield None
+        return
+
+    profiler = Profiler(path)
+
+    if dump_on_signal and hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.dump())
+
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.dump()
@@ -0,0 +1,130 @@
+# encoding: utf-8
+"""
+Rate limited progress summaries, logged in place of a message for every
+item processed. Given the number of items expected, e.g. from the
+statistics of earlier scans, the summaries include the percentage done
+and an estimate of the time left.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import logging
+import time
+from datetime import timedelta
+from typing import Optional, Tuple
+
+
+class ProgressLog:
+    """
+    Count items and log a summary every ``every`` items or ``interval``
+    seconds, whichever comes first.
+
+    :param logger: Logger to write the summaries to
+    :param label: Description of the items counted, e.g. 'files submitted'
+    :param every: Items between summaries (0 to only report on time)
+    :param interval: Seconds between summaries (0 to only report on count)
+    :param level: Level the summaries are logged at
+    :param expected: Number of items expected, if known
+    """
+
+    def __init__(self, logger: logging.Logger, label: str = 'items', every: int = 100000,
+                 interval: float = 10, level: int = logging.INFO, expected: Optional[int] = None) -> None:
+        self.logger = logger
+        self.label = label
+        self.every = every
+        self.interval = interval
+        self.level = level
+        self.expected = expected
+
+        self.count = 0
+        self.directories = 0
+        self.start = time.monotonic()
+
+        self._next_count = every or None
+        self._next_time = self.start + interval if interval else None
+
+    def update(self, n: int = 1) -> None:
+        """
+        :param n: Number of items processed since the last call
+        """
+        self.count += n
+
+        if self._next_count is not None and self.count >= self._next_count:
+            self.report()
+        elif self._next_time is not None and time.monotonic() >= self._next_time:
+            self.report()
+
+    def directory(self, n: int = 1) -> None:
+        """
+        :param n: Number of directories listed since the last call
+        """
+        self.directories += n
+
+    def expect(self, expected: Optional[int]) -> None:
+        """
+        :param expected: Number of items expected, if known
+        """
+        self.expected = expected
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        return (time.monotonic() if now is None else now) - self.start
+
+    def estimate(self, now: Optional[float] = None) -> Optional[Tuple[float, Optional[float]]]:
+        """
+        :return: Fraction of the expected items done and the seconds left at
+            the current rate, or None if nothing is expected. The seconds
+            left are None until the rate is known or once more items than
+            expected have been seen.
+        """
+        if not self.expected:
+            return None
+
+        fraction = self.count / self.expected
+        elapsed = self.elapsed(now)
+        if not self.count or elapsed <= 0 or fraction >= 1:
+            return fraction, None
+
+        return fraction, (self.expected - self.count) / (self.count / elapsed)
+
+    def summary(self, now: Optional[float] = None, estimate: bool = True) -> str:
+        now = time.monotonic() if now is None else now
+        elapsed = self.elapsed(now)
+        rate = self.count / elapsed if elapsed > 0 else 0
+
+        summary = f'{self.count} {self.label}'
+        if self.directories:
+            summary += f' from {self.directories} directories'
+        summary += f' in {elapsed:.1f}s ({rate:.0f}/s)'
+
+        progress = self.estimate(now) if estimate else None
+        if progress is not None:
+            fraction, left = progress
+            if left is None and fraction >= 1:
+                summary += f', more than the {self.expected} expected'
+            else:
+                summary += f', {fraction:.0%} of {self.expected} expected'
+                if left is not None:
+                    summary += f', ETA {timedelta(seconds=round(left))}'
+
+        return summary
+
+    def report(self) -> None:
+        """
+        Log a summary now and restart the count and time limits
+        """
+        now = time.monotonic()
+        self.logger.log(self.level, self.summary(now))
+
+        if self.every:
+            self._next_count = self.count + self.every
+        if self.interval:
+            self._next_time = now + self.interval
+
+    def done(self) -> None:
+        """
+        Log the final summary
+        """
+        self.logger.log(self.level, f'Finished: {self.summary(estimate=False)}')
@@ -0,0 +1,182 @@
+# encoding: utf-8
+"""
+Directory pruning rules for walks. Directories matching a rule are not
+listed or descended into, so trees which are never ingested, such as
+filer snapshots, caches or quicklooks, cost nothing to walk.
+
+Rules are shell patterns. A pattern without a / matches the name of a
+directory anywhere below the scan, and a pattern with a / matches the
+whole path. Rules come from the command line and the ``[prune]`` section
+of the configuration file, and from ``.fbiignore`` files found while
+walking. Patterns in an ignore file apply below its directory and those
+with a / are relative to it.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import logging
+import os
+import re
+from fnmatch import translate
+from typing import Iterable, List, Optional
+
+from six.moves.configparser import RawConfigParser
+
+from fbi_directory_check import TRACE, logstream
+from fbi_directory_check.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+IGNORE_FILE = '.fbiignore'
+
+# Filer snapshots repeat the whole tree under every directory
+DEFAULT_PATTERNS = ('.snapshot',)
+
+
+def read_patterns(path: str) -> List[str]:
+    """
+    :param path: Ignore file with one pattern per line. Blank lines and
+        lines starting with # are skipped.
+    :return: Patterns in the file
+    """
+    patterns = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                patterns.append(line)
+    return patterns
+
+
+class PruneRules:
+    """
+    Patterns for the directories a walk does not descend into
+
+    :param patterns: Shell patterns for directory names, or for whole
+        paths if they contain a /
+    :param ignore_file: Name of the files read for more patterns while
+        walking. None to not read them.
+    :param base: Directory relative patterns are anchored to
+    """
+
+    def __init__(self, patterns: Iterable[str] = DEFAULT_PATTERNS, ignore_file: Optional[str] = IGNORE_FILE,
+                 base: str = '/') -> None:
+        self.patterns = []
+        self.ignore_file = ignore_file
+
+        names, paths = [], []
+        for pattern in patterns:
+            pattern = pattern.rstrip('/')
+            if not pattern:
+                continue
+            self.patterns.append(pattern)
+            if '/' in pattern:
+                paths.append(translate(os.path.join(base, pattern.lstrip('/'))))
+            else:
+                names.append(translate(pattern))
+
+        self._names = re.compile('|'.join(names)) if names else None
+        self._paths = re.compile('|'.join(paths)) if paths else None
+
+    def pruned(self, path: str) -> bool:
+        """
+        :param path: Directory path
+        :return: Whether the directory should not be walked
+        """
+        if self._names is not None and self._names.match(os.path.basename(path)):
+            return True
+        return self._paths is not None and self._paths.match(path) is not None
+
+    def for_directory(self, directory: str, files: Iterable[str]) -> 'PruneRules':
+        """
+        :param directory: Directory being walked
+        :param files: Names of the files in it
+        :return: Rules for the directories below, including any from an
+            ignore file in the directory
+        """
+        if self.ignore_file is None or self.ignore_file not in files:
+            return self
+
+        path = os.path.join(directory, self.ignore_file)
+        try:
+            patterns = read_patterns(path)
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f'Could not read {path}: {e}')
+            return self
+
+        return _Combined(self, PruneRules(patterns, self.ignore_file, base=directory))
+
+    def filter(self, directory: str, dirs: List[str]) -> List[str]:
+        """
+        :param directory: Directory being walked
+        :param dirs: Names of its sub-directories
+        :return: The names of the sub-directories which are not pruned
+        """
+        kept = []
+        for name in dirs:
+            path = os.path.join(directory, name)
+            if self.pruned(path):
+                logger.log(TRACE, 'Pruned %s', path, extra={'path': path})
+                metrics.inc('fbi_directories_pruned_total')
+            else:
+                kept.append(name)
+        return kept
+
+
+class _Combined(PruneRules):
+    """
+    Rules from a parent directory together with those from an ignore file
+    """
+
+    def __init__(self, parent: PruneRules, local: PruneRules) -> None:
+        self.parent = parent
+        self.local = local
+        self.ignore_file = parent.ignore_file
+        self.patterns = parent.patterns + local.patterns
+
+    def pruned(self, path: str) -> bool:
+        return self.local.pruned(path) or self.parent.pruned(path)
+
+
+def add_prune_arguments(parser) -> None:
+    """
+    Add the pruning options to an argument parser
+
+    :param parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--prune', dest='prune', action='append', metavar='PATTERN', default=[],
+                        help='Do not walk directories matching this shell pattern. Matched against the '
+                             'directory name, or the whole path if it has a /. Can be given more than once')
+    parser.add_argument('--prune-file', dest='prune_file', default=None,
+                        help='File of patterns to prune, one per line')
+    parser.add_argument('--no-ignore-files', dest='ignore_files', action='store_false',
+                        help=f'Do not read {IGNORE_FILE} files found while walking')
+
+
+def prune_rules_from_args(args, conf: Optional[str] = None) -> PruneRules:
+    """
+    :param args: Arguments parsed with add_prune_arguments
+    :param conf: Configuration file which may have a [prune] section with
+        patterns, one per line, and ignore-file options
+    :return: Rules from the configuration and command line
+    """
+    patterns = list(DEFAULT_PATTERNS)
+    ignore_file = IGNORE_FILE
+
+    if conf:
+        config = RawConfigParser()
+        config.read(conf)
+        if config.has_section('prune'):
+            patterns += [line.strip() for line in config.get('prune', 'patterns', fallback='').splitlines()]
+            ignore_file = config.get('prune', 'ignore-file', fallback=IGNORE_FILE) or None
+
+    if args.prune_file:
+        patterns += read_patterns(args.prune_file)
+    patterns += args.prune
+
+    return PruneRules(patterns, ignore_file if args.ignore_files else None)
@@ -0,0 +1,440 @@
+# encoding: utf-8
+"""
+Priority aware access to the work queues and helpers for working with the
+underlying SQLite databases of the local queues.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+# Queue attribute names on the checker and their directories under queue-location
+QUEUE_DIRS = {
+    'manual_queue': 'priority',
+    'bot_queue': 'bot',
+}
+
+# Table used by persistqueue.SQLiteAckQueue with the default name
+ACK_TABLE = 'ack_queue_default'
+
+
+class AckStatus:
+    """
+    Row status values used by persistqueue.SQLiteAckQueue. Kept here so the
+    monitor and maintenance utilities can read the databases without
+    importing persistqueue.
+    """
+    inited = 0
+    ready = 1
+    unack = 2
+    acked = 5
+    ack_failed = 9
+
+
+# Pragmas applied to the checker's queue connections. WAL lets readers such
+# as q_monitor run alongside the checker and NORMAL sync is safe in WAL mode
+# while avoiding an fsync on every commit.
+QUEUE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+)
+
+
+# Seconds the checker's queue connections wait for a lock, such as the one
+# held while fbi_q_maintain vacuums a database
+QUEUE_BUSY_TIMEOUT = 300
+
+
+def queue_db_path(db_location: str, queue: str) -> str:
+    """
+    :param db_location: queue-location from the configuration
+    :param queue: manual_queue or bot_queue
+    :return: Path to the SQLite database for the queue
+    """
+    return os.path.join(db_location, QUEUE_DIRS[queue], 'data.db')
+
+
+def connect_readonly(path: str, timeout: float = 10) -> sqlite3.Connection:
+    """
+    Open a queue database without taking write locks
+
+    :param path: Path to the queue database
+    :param timeout: Seconds to wait for a lock
+    :return: sqlite3 connection
+    """
+    return sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=timeout)
+
+
+def queue_counts(conn: sqlite3.Connection) -> dict:
+    """
+    Count the items in a queue database by status
+
+    :param conn: Connection to the queue database
+    :return: dict with ready, unack, acked and failed counts
+    """
+    rows = conn.execute(f'SELECT status, COUNT(*) FROM {ACK_TABLE} GROUP BY status').fetchall()
+    counts = {int(status): count for status, count in rows}
+
+    return {
+        'ready': counts.get(int(AckStatus.inited), 0) + counts.get(int(AckStatus.ready), 0),
+        'unack': counts.get(int(AckStatus.unack), 0),
+        'acked': counts.get(int(AckStatus.acked), 0),
+        'failed': counts.get(int(AckStatus.ack_failed), 0),
+    }
+
+
+def is_busy_error(error: Exception) -> bool:
+    """
+    :param error: Exception raised by sqlite3
+    :return: Whether another connection held the lock past the busy timeout
+    """
+    return isinstance(error, sqlite3.OperationalError) and (
+        'locked' in str(error) or 'busy' in str(error))
+
+
+def tune_queue(q) -> None:
+    """
+    Apply QUEUE_PRAGMAS to a SQLiteAckQueue. ``journal_mode`` is kept in
+    the database file so is set over a connection of our own. ``synchronous``
+    only applies to the connection it is set on, and persistqueue has no
+    public way to reach its connections, so ``_getter`` and ``_putter`` are
+    used and checked for first.
+
+    :param q: SQLiteAckQueue
+    """
+    conn = sqlite3.connect(os.path.join(q.path, q.db_file_name), timeout=QUEUE_BUSY_TIMEOUT)
+    try:
+        for pragma, value in QUEUE_PRAGMAS:
+            if pragma == 'journal_mode':
+                conn.execute(f'PRAGMA {pragma}={value}')
+    finally:
+        conn.close()
+
+    connections = [getattr(q, name, None) for name in ('_getter', '_putter')]
+    if not all(isinstance(c, sqlite3.Connection) for c in connections):
+        raise RuntimeError('This version of persistqueue does not expose its connections')
+
+    for conn in {id(c): c for c in connections}.values():
+        for pragma, value in QUEUE_PRAGMAS:
+            if pragma != 'journal_mode':
+                conn.execute(f'PRAGMA {pragma}={value}')
+
+
+def put_many(q, items: Iterable[Any]) -> int:
+    """
+    Add items to a SQLiteAckQueue in a single transaction rather than
+    committing each one as ``put`` does.
+
+    :param q: SQLiteAckQueue
+    :param items: Items to add
+    :return: Number of items added
+    """
+    now = time.time()
+    rows = [(q._serializer.dumps(item), now, int(AckStatus.inited)) for item in items]
+
+    with q.tran_lock:
+        with q._putter as conn:
+            conn.executemany(
+                f'INSERT INTO {q._table_name} (data, timestamp, status) VALUES (?, ?, ?)', rows
+            )
+
+    q.total += len(rows)
+    q.put_event.set()
+    return len(rows)
+
+
+def pending_items(q) -> Iterator[Any]:
+    """
+    :param q: SQLiteAckQueue
+    :return: Iterator of the items waiting or in flight in the queue
+    """
+    cursor = q._getter.execute(
+        f'SELECT data FROM {q._table_name} WHERE status < ?', (int(AckStatus.acked),)
+    )
+    for (data,) in cursor:
+        yield q._serializer.loads(data)
+
+
+class WorkQueue(ABC):
+    """
+    Interface to the checker's work queues. Items are taken from the named
+    queues in priority order and must be acknowledged once processed.
+
+    ``get`` blocks until an item is available or the timeout expires.
+    Items put through this object wake a waiting ``get`` straight away.
+    Items put by other processes, such as ``fbi_directory_check``, are
+    noticed by watching the size and modification time of the database
+    files, which costs a stat rather than a query. The interval between
+    checks backs off to ``max_wait`` while the queues stay empty.
+
+    Subclasses implement ``_pop``, ``_files``, ``_put``, ``_put_many``,
+    ``pending``, ``ack``, ``_resume_unacked`` and ``qsize``.
+
+    :param names: Queue names, highest priority first
+    :param max_wait: Longest time in seconds between checks while idle
+    """
+
+    def __init__(self, names: List[str], max_wait: float = 5.0) -> None:
+        self.names = list(names)
+        self.max_wait = max_wait
+        self._condition = threading.Condition()
+        self._signature = None
+
+    @abstractmethod
+    def _files(self) -> List[str]:
+        """
+        :return: Files which change when an item is added
+        """
+
+    @abstractmethod
+    def _pop(self, names: List[str]) -> Optional[Tuple[str, Any]]:
+        """
+        Take the first available item without waiting
+
+        :param names: Queue names to try in order
+        :return: (queue name, item) or None
+        """
+
+    @abstractmethod
+    def _put(self, name: str, item: Any) -> None:
+        pass
+
+    @abstractmethod
+    def _put_many(self, name: str, items: Iterable[Any]) -> int:
+        pass
+
+    def _changed(self) -> bool:
+        """
+        Check whether any of the queue databases has been written to
+        since the last check.
+        """
+        signature = []
+        for path in self._files():
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+
+        changed = signature != self._signature
+        self._signature = signature
+        return changed
+
+    def put(self, name: str, item: Any) -> None:
+        """
+        Add an item to a queue and wake any waiting get.
+
+        :param name: Queue name
+        :param item: Item to add
+        """
+        self._put(name, item)
+        with self._condition:
+            self._condition.notify_all()
+
+    def put_many(self, name: str, items: Iterable[Any]) -> int:
+        """
+        Add items to a queue in a single transaction and wake any waiting get.
+
+        :param name: Queue name
+        :param items: Items to add
+        :return: Number of items added
+        """
+        count = self._put_many(name, items)
+        with self._condition:
+            self._condition.notify_all()
+        return count
+
+    @abstractmethod
+    def pending(self, name: str) -> Iterator[Any]:
+        """
+        :param name: Queue name
+        :return: Iterator of the items waiting or in flight in the queue,
+            read without holding them all in memory
+        """
+
+    def claim(self, key: str, ttl: float) -> bool:
+        """
+        Claim a piece of work, such as a spot, so that other workers
+        draining the same queues leave it alone. Only one host drains the
+        local queues so every claim succeeds.
+
+        :param key: Name of the work
+        :param ttl: Seconds the claim is held
+        :return: Whether this worker holds the claim
+        """
+        return True
+
+    def get(self, timeout: Optional[float] = None, queues: Optional[List[str]] = None) -> Tuple[str, Any]:
+        """
+        Get the next item by priority.
+
+        :param timeout: Seconds to wait for an item. 0 returns immediately,
+            None waits forever.
+        :param queues: Only take items from these queues
+        :return: (queue name, item)
+        :raises persistqueue.Empty: if no item arrived before the timeout
+        """
+        import persistqueue
+
+        names = [name for name in self.names if queues is None or name in queues]
+
+        result = self._pop(names)
+        if result:
+            return result
+
+        endtime = None if timeout is None else time.monotonic() + timeout
+        wait = 0.05
+        self._changed()
+
+        while True:
+            remaining = None if endtime is None else endtime - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise persistqueue.Empty
+
+            with self._condition:
+                notified = self._condition.wait(
+                    wait if remaining is None else min(wait, remaining)
+                )
+
+            if notified or self._changed():
+                result = self._pop(names)
+                if result:
+                    return result
+                wait = 0.05
+            else:
+                wait = min(wait * 2, self.max_wait)
+
+    @abstractmethod
+    def ack(self, name: str, item: Any) -> None:
+        """
+        Acknowledge an item taken from a queue.
+
+        :param name: Queue name
+        :param item: Item returned by get
+        """
+
+    @abstractmethod
+    def _resume_unacked(self) -> None:
+        pass
+
+    def resume_unacked(self) -> None:
+        """
+        Return every item this worker has taken but not acknowledged to its
+        queue, such as those in flight when processing was interrupted, and
+        wake any waiting get.
+        """
+        self._resume_unacked()
+        with self._condition:
+            self._condition.notify_all()
+
+    @abstractmethod
+    def qsize(self, name: str) -> int:
+        """
+        :param name: Queue name
+        :return: Number of items ready in the queue
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class PriorityWorkQueue(WorkQueue):
+    """
+    Work queue backed by one local SQLiteAckQueue per queue name. Items in
+    the first queue always come before items in the next. Only one host can
+    drain these queues.
+
+    :param queues: (name, SQLiteAckQueue) pairs, highest priority first
+    :param max_wait: Longest time in seconds between checks while idle
+    """
+
+    def __init__(self, queues: List[Tuple[str, Any]], max_wait: float = 5.0) -> None:
+        super().__init__([name for name, _ in queues], max_wait=max_wait)
+        self.queues = list(queues)
+
+    def __getitem__(self, name: str):
+        return dict(self.queues)[name]
+
+    def _files(self) -> List[str]:
+        files = []
+        for _, q in self.queues:
+            db = os.path.join(q.path, q.db_file_name)
+            files += [db, f'{db}-wal']
+        return files
+
+    def _pop(self, names: List[str]) -> Optional[Tuple[str, Any]]:
+        import persistqueue
+
+        for name in names:
+            try:
+                return name, self[name].get(block=False)
+            except persistqueue.Empty:
+                continue
+        return None
+
+    def _put(self, name: str, item: Any) -> None:
+        self[name].put(item)
+
+    def _put_many(self, name: str, items: Iterable[Any]) -> int:
+        return put_many(self[name], items)
+
+    def pending(self, name: str) -> Iterator[Any]:
+        return pending_items(self[name])
+
+    def ack(self, name: str, item: Any) -> None:
+        self[name].ack(item)
+
+    def _resume_unacked(self) -> None:
+        # Only this host drains the queues so every unacked item is ours
+        for _, q in self.queues:
+            q.resume_unack_tasks()
+
+    def qsize(self, name: str) -> int:
+        return self[name]._count()
+
+
+def open_work_queue(conf) -> WorkQueue:
+    """
+    Open the work queues for the backend set in the local-queue section
+    of the configuration.
+
+    :param conf: ConfigParser
+    :return: WorkQueue with the queues in QUEUE_DIRS, manual first
+    """
+    backend = conf.get('local-queue', 'backend', fallback='sqlite')
+    max_wait = conf.getfloat('local-queue', 'max-idle-wait', fallback=5)
+
+    if backend == 'shared':
+        from fbi_directory_check.utils.shared_queue import SharedWorkQueue
+
+        return SharedWorkQueue(
+            conf.get('local-queue', 'shared-location'),
+            list(QUEUE_DIRS),
+            lease_time=conf.getfloat('local-queue', 'lease-time', fallback=600),
+            max_attempts=conf.getint('local-queue', 'max-attempts', fallback=5),
+            max_wait=max_wait
+        )
+
+    if backend != 'sqlite':
+        raise ValueError(f'Unknown queue backend: {backend}')
+
+    import persistqueue
+
+    db_location = conf.get('local-queue', 'queue-location')
+    queues = []
+
+    for name, dirname in QUEUE_DIRS.items():
+        q = persistqueue.SQLiteAckQueue(os.path.join(db_location, dirname), multithreading=True,
+                                        timeout=QUEUE_BUSY_TIMEOUT)
+        tune_queue(q)
+        queues.append((name, q))
+
+    return PriorityWorkQueue(queues, max_wait=max_wait)
@@ -0,0 +1,177 @@
+# encoding: utf-8
+"""
+Statistics of finished scans: the files and directories found under each
+tree and how long the scan took. Used to estimate the progress of a scan
+from earlier scans of the same tree and to show which trees are getting
+slower to walk.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from typing import List, Optional
+
+# Database used when --stats-db is not given
+STATS_DB_ENV = 'FBI_SCAN_STATS'
+
+
+class ScanStats:
+    """
+    SQLite store of one row per finished scan
+
+    :param path: Path to the SQLite database file
+    :param runs: Number of recent scans an estimate is taken from
+    """
+
+    def __init__(self, path: str, runs: int = 5) -> None:
+        self.path = path
+        self.runs = runs
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS scans ('
+                'tree TEXT, kind TEXT, finished REAL, seconds REAL, files INTEGER, directories INTEGER)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS scans_tree ON scans (tree, kind, finished)')
+
+    def record(self, tree: str, kind: str, seconds: float, files: int, directories: int = 0) -> None:
+        """
+        Store the statistics of a finished scan
+
+        :param tree: Directory scanned
+        :param kind: Type of scan, e.g. level and recursion, as the counts
+            are only comparable between scans of the same kind
+        :param seconds: Duration of the scan
+        :param files: Number of files found
+        :param directories: Number of directories listed
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO scans (tree, kind, finished, seconds, files, directories) VALUES (?, ?, ?, ?, ?, ?)',
+                (tree, kind, time.time(), seconds, files, directories)
+            )
+
+    def history(self, tree: str, kind: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        """
+        :param tree: Directory scanned
+        :param kind: Only scans of this kind
+        :param limit: Number of scans to return
+        :return: Scans of the tree, newest first
+        """
+        query = 'SELECT tree, kind, finished, seconds, files, directories FROM scans WHERE tree = ?'
+        params = [tree]
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        query += ' ORDER BY finished DESC'
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return [_row(row) for row in rows]
+
+    def expected(self, tree: str, kind: str) -> Optional[dict]:
+        """
+        :param tree: Directory to be scanned
+        :param kind: Type of scan
+        :return: Median files, directories and seconds of the recent scans
+            of the tree, or None if it has not been scanned before
+        """
+        scans = self.history(tree, kind, limit=self.runs)
+        if not scans:
+            return None
+
+        return {
+            'files': round(statistics.median(scan['files'] for scan in scans)),
+            'directories': round(statistics.median(scan['directories'] for scan in scans)),
+            'seconds': statistics.median(scan['seconds'] for scan in scans),
+        }
+
+    def trends(self, runs: int = 10) -> List[dict]:
+        """
+        Compare the rate of the older and newer halves of the recent scans
+        of each tree
+
+        :param runs: Number of recent scans of each tree compared
+        :return: Trees scanned at least twice, slowing down the most first.
+            change is the fractional change in files per second.
+        """
+        with self._lock:
+            keys = self._conn.execute('SELECT DISTINCT tree, kind FROM scans').fetchall()
+
+        trends = []
+        for tree, kind in keys:
+            scans = self.history(tree, kind, limit=runs)
+            if len(scans) < 2:
+                continue
+
+            half = len(scans) // 2
+            newer = statistics.mean(scan['rate'] for scan in scans[:half])
+            older = statistics.mean(scan['rate'] for scan in scans[-half:])
+
+            trends.append({
+                'tree': tree,
+                'kind': kind,
+                'runs': len(scans),
+                'files': scans[0]['files'],
+                'seconds': scans[0]['seconds'],
+                'older_rate': older,
+                'newer_rate': newer,
+                'change': newer / older - 1 if older else 0.0,
+            })
+
+        return sorted(trends, key=lambda t: t['change'])
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _row(row: tuple) -> dict:
+    tree, kind, finished, seconds, files, directories = row
+    return {
+        'tree': tree,
+        'kind': kind,
+        'finished': finished,
+        'seconds': seconds,
+        'files': files,
+        'directories': directories,
+        'rate': files / seconds if seconds > 0 else 0.0,
+    }
+
+
+def add_stats_argument(parser) -> None:
+    """
+    Add the --stats-db option to an argument parser
+
+    :param parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--stats-db', dest='stats_db', default=os.environ.get(STATS_DB_ENV),
+                        help='SQLite file of the statistics of earlier scans, used to estimate progress. '
+                             f'Finished scans are added to it (default: ${STATS_DB_ENV})')
+
+
+def scan_stats_from_args(args) -> Optional[ScanStats]:
+    """
+    :param args: Arguments parsed with add_stats_argument
+    :return: ScanStats or None if not configured
+    """
+    return ScanStats(args.stats_db) if args.stats_db else None
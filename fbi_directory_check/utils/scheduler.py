@@ -0,0 +1,160 @@
+# encoding: utf-8
+"""
+Change-likelihood scheduling of spots for the consistency checker crawler.
+
+Each spot is scored on the time since it was last checked, scaled up by the
+drift the checker has recently found in it and by how recently files in it
+have been modified. The crawler takes the highest scoring spot rather than
+the next line in the spot file. As the time since the last check keeps
+growing for every spot, quiet spots are still visited eventually.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+
+DAY = 86400
+
+
+class SpotScheduler:
+    """
+    SQLite backed store of spot statistics used to pick the next spot.
+
+    :param path: Path to the SQLite database file
+    :param drift_weight: Weight given to drift found in previous checks
+    :param mtime_weight: Weight given to recent modifications
+    :param drift_decay: Fraction of the previous drift kept each time a
+        spot is checked again
+    """
+
+    def __init__(self, path: str, drift_weight: float = 1.0,
+                 mtime_weight: float = 1.0, drift_decay: float = 0.5) -> None:
+        self.path = path
+        self.drift_weight = drift_weight
+        self.mtime_weight = mtime_weight
+        self.drift_decay = drift_decay
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS spots ('
+                'path TEXT PRIMARY KEY, spot TEXT, last_checked REAL DEFAULT 0, '
+                'drift REAL DEFAULT 0, last_mtime REAL DEFAULT 0)'
+            )
+
+    def load_spots(self, spots: Iterable[Tuple[str, str]]) -> None:
+        """
+        Synchronise the spots with the spot file. Statistics are kept for
+        spots which are still present.
+
+        :param spots: Iterable of (spot name, path) pairs
+        """
+        spots = list(spots)
+
+        with self._lock, self._conn:
+            self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS current (path TEXT PRIMARY KEY)')
+            self._conn.execute('DELETE FROM current')
+            self._conn.executemany('INSERT OR IGNORE INTO current (path) VALUES (?)',
+                                   ((path,) for _, path in spots))
+            self._conn.execute('DELETE FROM spots WHERE path NOT IN (SELECT path FROM current)')
+            self._conn.executemany('INSERT OR IGNORE INTO spots (path, spot) VALUES (?, ?)',
+                                   ((path, spot) for spot, path in spots))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM spots').fetchone()[0]
+
+    def score(self, last_checked: float, drift: float, last_mtime: float,
+              now: Optional[float] = None) -> float:
+        """
+        Score a spot. Higher scores are checked first.
+
+        :param last_checked: Time of the last check
+        :param drift: Decayed count of inconsistencies found
+        :param last_mtime: Most recent modification time seen in the spot
+        :param now: Time to score against
+        :return: score
+        """
+        now = now or time.time()
+
+        staleness = max(now - last_checked, 0) / DAY
+        recency = 1 / (1 + max(now - last_mtime, 0) / DAY)
+
+        return staleness * (
+            1 + self.drift_weight * math.log1p(drift) + self.mtime_weight * recency
+        )
+
+    def next_spot(self) -> Optional[str]:
+        """
+        :return: The path of the highest scoring spot or None if there are no spots
+        """
+        now = time.time()
+
+        with self._lock:
+            rows = self._conn.execute('SELECT path, last_checked, drift, last_mtime FROM spots')
+            best = max(
+                rows,
+                key=lambda row: self.score(row[1], row[2], row[3], now=now),
+                default=None
+            )
+
+        return best[0] if best else None
+
+    def record_check(self, path: str, last_mtime: float = 0) -> None:
+        """
+        Record that a spot has been queued for checking. Previous drift is
+        decayed so that old inconsistencies count for less.
+
+        :param path: Spot path
+        :param last_mtime: Most recent modification time seen while walking it
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE spots SET last_checked = ?, drift = drift * ?, '
+                'last_mtime = MAX(last_mtime, ?) WHERE path = ?',
+                (time.time(), self.drift_decay, last_mtime, path)
+            )
+
+    def record_drift(self, directory: str, count: int) -> None:
+        """
+        Add inconsistencies found in a directory to the spot it belongs to.
+
+        :param directory: Directory which was checked
+        :param count: Number of additions and removals found
+        """
+        if not count:
+            return
+
+        ancestors = []
+        path = directory
+        while path and path not in ancestors:
+            ancestors.append(path)
+            path = os.path.dirname(path)
+
+        placeholders = ','.join('?' * len(ancestors))
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                f'UPDATE spots SET drift = drift + ? WHERE path = ('
+                f'SELECT path FROM spots WHERE path IN ({placeholders}) '
+                f'ORDER BY LENGTH(path) DESC LIMIT 1)',
+                (count, *ancestors)
+            )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,296 @@
+# encoding: utf-8
+"""
+Work queue shared by several consistency checkers through a single SQLite
+database, for example on a shared filesystem with working POSIX locks.
+
+Items are leased rather than removed when taken. A lease is renewed in the
+background while the worker holds the item and the item is deleted when it
+is acknowledged. If a worker dies its leases run out and the items are
+handed to the next worker which asks. Items whose lease has run out
+``max_attempts`` times are marked as failed so that a directory which kills
+the checker cannot take down every node in turn.
+
+Spots are claimed in the same database before they are crawled, so the
+nodes share out the spots rather than each queueing every one.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from fbi_directory_check import logstream
+from fbi_directory_check.utils.queues import WorkQueue
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+
+class SharedWorkQueue(WorkQueue):
+    """
+    Leased work queue in a SQLite database shared between hosts. The
+    rollback journal is used as WAL needs shared memory on a single host.
+
+    :param path: Path to the shared SQLite database file
+    :param names: Queue names, highest priority first
+    :param lease_time: Seconds an item stays with a worker without renewal
+    :param max_attempts: Number of leases an item gets before it is failed
+    :param max_wait: Longest time in seconds between checks while idle
+    :param worker: Name recorded against leased items. Defaults to host:pid
+    :param busy_timeout: Seconds to wait for another node's lock
+    """
+
+    def __init__(self, path: str, names: List[str], lease_time: float = 600,
+                 max_attempts: int = 5, max_wait: float = 5.0,
+                 worker: Optional[str] = None, busy_timeout: float = 60) -> None:
+        super().__init__(names, max_wait=max_wait)
+
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=DELETE')
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS work_items ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, item TEXT NOT NULL, '
+                'enqueued REAL NOT NULL, lease_expires REAL NOT NULL DEFAULT 0, worker TEXT, '
+                'attempts INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS work_items_queue ON work_items (queue, failed, id)'
+            )
+            # Work claimed by a node, such as the spot it is crawling
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, worker TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            self._conn.execute('COMMIT')
+
+        # Lease ids held by this worker for each (queue, item)
+        self._leases = {}
+
+        # When the first lease held elsewhere runs out
+        self._next_expiry = None
+
+        self._stop = threading.Event()
+        self._renewer = threading.Thread(target=self._renew_leases, name='lease-renewer', daemon=True)
+        self._renewer.start()
+
+    def _files(self) -> List[str]:
+        return [self.path]
+
+    def _changed(self) -> bool:
+        # Leases running out do not touch the file
+        expired = self._next_expiry is not None and time.time() >= self._next_expiry
+        return super()._changed() or expired
+
+    def _pop(self, names: List[str]) -> Optional[Tuple[str, Any]]:
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for name in names:
+                    while True:
+                        row = self._conn.execute(
+                            'SELECT id, item, attempts, worker FROM work_items '
+                            'WHERE queue = ? AND failed = 0 AND lease_expires < ? ORDER BY id LIMIT 1',
+                            (name, now)
+                        ).fetchone()
+
+                        if row is None:
+                            break
+
+                        _id, item, attempts, worker = row
+
+                        if attempts >= self.max_attempts:
+                            logger.error(f'{item} was not acknowledged after {attempts} attempts, '
+                                         f'last by {worker}. Marking as failed')
+                            self._conn.execute('UPDATE work_items SET failed = 1 WHERE id = ?', (_id,))
+                            continue
+
+                        if attempts:
+                            logger.warning(f'Lease on {item} held by {worker} expired, taking over')
+
+                        self._conn.execute(
+                            'UPDATE work_items SET lease_expires = ?, worker = ?, attempts = attempts + 1 '
+                            'WHERE id = ?',
+                            (now + self.lease_time, self.worker, _id)
+                        )
+                        self._conn.execute('COMMIT')
+
+                        self._leases.setdefault((name, item), []).append(_id)
+                        return name, item
+
+                placeholders = ','.join('?' * len(names))
+                self._next_expiry = self._conn.execute(
+                    f'SELECT MIN(lease_expires) FROM work_items '
+                    f'WHERE queue IN ({placeholders}) AND failed = 0 AND lease_expires >= ?',
+                    (*names, now)
+                ).fetchone()[0]
+
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        return None
+
+    def _put(self, name: str, item: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO work_items (queue, item, enqueued) VALUES (?, ?, ?)',
+                (name, item, time.time())
+            )
+
+    def _put_many(self, name: str, items: Iterable[Any]) -> int:
+        now = time.time()
+        rows = [(name, item, now) for item in items]
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.executemany('INSERT INTO work_items (queue, item, enqueued) VALUES (?, ?, ?)', rows)
+            self._conn.execute('COMMIT')
+
+        return len(rows)
+
+    def pending(self, name: str, page_size: int = 10000) -> Iterator[Any]:
+        """
+        :param name: Queue name
+        :param page_size: Number of items read at a time
+        :return: Iterator of the items waiting or leased in the queue
+        """
+        last = 0
+        while True:
+            # Paged by id so the lock is not held between pages
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT id, item FROM work_items WHERE queue = ? AND failed = 0 AND id > ? '
+                    'ORDER BY id LIMIT ?', (name, last, page_size)
+                ).fetchall()
+
+            if not rows:
+                return
+
+            for _, item in rows:
+                yield item
+            last = rows[-1][0]
+
+    def claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT worker, expires FROM claims WHERE key = ?', (key,)
+                ).fetchone()
+
+                if row is not None and row[0] != self.worker and row[1] > now:
+                    self._conn.execute('COMMIT')
+                    return False
+
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO claims (key, worker, expires) VALUES (?, ?, ?)',
+                    (key, self.worker, now + ttl)
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        return True
+
+    def ack(self, name: str, item: Any) -> None:
+        with self._lock:
+            ids = self._leases.get((name, item))
+            if not ids:
+                logger.warning(f'No lease held on {item} in {name}')
+                return
+
+            _id = ids.pop(0)
+            if not ids:
+                del self._leases[(name, item)]
+
+            # Only delete if the lease was not taken over by another worker
+            cur = self._conn.execute(
+                'DELETE FROM work_items WHERE id = ? AND worker = ?', (_id, self.worker)
+            )
+
+        if not cur.rowcount:
+            logger.warning(f'Lease on {item} was lost before it was acknowledged')
+
+    def _resume_unacked(self) -> None:
+        # The attempts used by the leases given up are not counted
+        with self._lock:
+            ids = [_id for ids in self._leases.values() for _id in ids]
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'UPDATE work_items SET lease_expires = 0, worker = NULL, attempts = attempts - 1 '
+                    'WHERE id = ? AND worker = ?',
+                    [(_id, self.worker) for _id in ids]
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._leases.clear()
+
+    def qsize(self, name: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM work_items WHERE queue = ? AND failed = 0 AND lease_expires < ?',
+                (name, time.time())
+            ).fetchone()[0]
+
+    def _renew_leases(self) -> None:
+        """
+        Extend the leases on the items held by this worker until closed
+        """
+        while not self._stop.wait(max(self.lease_time / 3, 1)):
+            with self._lock:
+                ids = [_id for ids in self._leases.values() for _id in ids]
+                if not ids:
+                    continue
+
+                expires = time.time() + self.lease_time
+                try:
+                    self._conn.execute('BEGIN IMMEDIATE')
+                    self._conn.executemany(
+                        'UPDATE work_items SET lease_expires = ? WHERE id = ? AND worker = ?',
+                        [(expires, _id, self.worker) for _id in ids]
+                    )
+                    self._conn.execute('COMMIT')
+                except sqlite3.OperationalError as e:
+                    if self._conn.in_transaction:
+                        self._conn.execute('ROLLBACK')
+                    logger.warning(f'Failed to renew leases: {e}')
+
+    def close(self) -> None:
+        """
+        Stop renewing leases. Items still held are returned to the queue
+        once their leases run out.
+        """
+        self._stop.set()
+        self._renewer.join()
+        self._conn.close()
@@ -0,0 +1,210 @@
+# encoding: utf-8
+"""
+Scan snapshots: a gzipped manifest of the path, size and mtime of every
+file found by a scan, sorted by path. A scan compared against the
+snapshot left by the previous scan only needs to publish the files which
+are new or changed and REMOVE the files which have gone.
+
+The first line records the scope of the scan so a snapshot is not
+compared with a scan of something else, which would remove everything
+outside the new scope.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+from fbi_directory_check import logstream
+from fbi_directory_check.utils.constants import DEPOSIT, REMOVE
+from fbi_directory_check.utils.manifest import open_manifest
+from fbi_directory_check.utils.streaming import external_sort
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+HEADER = '#fbi_snapshot\t'
+
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+REMOVED = 'removed'
+
+# (path, size, mtime_ns)
+Entry = Tuple[str, int, int]
+
+
+def stat_entry(path: str) -> Entry:
+    """
+    :param path: Path found by a scan. Links are followed so a changed
+        target is seen, falling back to the link itself if broken.
+    :return: Snapshot entry for the path
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = os.lstat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+
+def read_snapshot(path: str) -> Tuple[Optional[dict], Iterator[Entry]]:
+    """
+    :param path: Snapshot file
+    :return: Scope recorded with the snapshot and an iterator of its
+        entries. (None, empty iterator) if there is no snapshot yet.
+    """
+    if not os.path.exists(path):
+        return None, iter(())
+
+    with open_manifest(path) as f:
+        first = f.readline()
+
+    if not first.startswith(HEADER):
+        raise ValueError(f'{path} is not a scan snapshot')
+
+    return json.loads(first[len(HEADER):]), _read_entries(path)
+
+
+def _read_entries(path: str) -> Iterator[Entry]:
+    with open_manifest(path) as f:
+        next(f)
+        for line in f:
+            # Split from the right so tabs in names survive
+            name, size, mtime = line.rstrip('\r\n').rsplit('\t', 2)
+            yield name, int(size), int(mtime)
+
+
+class SnapshotDelta:
+    """
+    Compare the files found by a scan with the previous snapshot and write
+    the new one alongside. The new snapshot only replaces the old one when
+    commit is called, so a scan which fails part way through is repeated
+    in full next time.
+
+    :param path: Snapshot file
+    :param scope: Settings which decide what the scan finds
+    :param mount_health: MountHealth. Files under mounts which are unhealthy
+        at the end of the walk are carried forward rather than removed.
+    :param skipped: Paths the scan could not see, filled in as it goes, e.g.
+        directories which could not be listed and files which could not be
+        stat'ed. Entries at or below them are carried forward.
+    :param chunk_size: Number of entries sorted in memory at once
+    """
+
+    def __init__(self, path: str, scope: dict, mount_health=None, skipped: Optional[Set[str]] = None,
+                 chunk_size: int = 100000) -> None:
+        self.path = path
+        self.scope = scope
+        self.mount_health = mount_health
+        self.skipped = skipped if skipped is not None else set()
+        self.chunk_size = chunk_size
+
+        self.counts = dict.fromkeys((NEW, CHANGED, UNCHANGED, REMOVED), 0)
+        self._tmp = None
+
+    def _kept(self, path: str, unhealthy: set, skipped: set) -> bool:
+        if self.mount_health is not None and self.mount_health.mount_for(path) in unhealthy:
+            return True
+
+        # Look for the path or a directory above it the scan did not see
+        path = os.path.normpath(path)
+        while path not in skipped:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+        return True
+
+    @staticmethod
+    def _skip(entries: Iterator[Entry], entry: Entry, sentinel) -> Entry:
+        # Move past duplicates of a path, e.g. from overlapping datasets
+        path = entry[0]
+        while entry is not sentinel and entry[0] == path:
+            entry = next(entries, sentinel)
+        return entry
+
+    def changes(self, entries: Iterable[Entry]) -> Iterator[Tuple[str, str]]:
+        """
+        :param entries: Entries found by the scan, in any order
+        :return: Iterator of (path, DEPOSIT) for new or changed files and
+            (path, REMOVE) for files in the previous snapshot not found
+        :raises ValueError: if the previous snapshot has a different scope
+        """
+        scope, previous = read_snapshot(self.path)
+        if scope is not None and scope != self.scope:
+            raise ValueError(f'Snapshot {self.path} was taken of {scope}, not {self.scope}')
+
+        current = external_sort(entries, chunk_size=self.chunk_size)
+
+        fd, self._tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+
+            def write(entry):
+                gz.write(f'{entry[0]}\t{entry[1]}\t{entry[2]}\n'.encode('utf-8', 'surrogateescape'))
+
+            gz.write(f'{HEADER}{json.dumps(self.scope, sort_keys=True)}\n'.encode('utf-8'))
+
+            # Read once the walk has finished, as the sort consumes it first
+            unhealthy = skipped = None
+
+            sentinel = ('',)
+            new = next(current, sentinel)
+            old = next(previous, sentinel)
+
+            while new is not sentinel or old is not sentinel:
+                if old is sentinel or (new is not sentinel and new[0] < old[0]):
+                    write(new)
+                    self.counts[NEW] += 1
+                    yield new[0], DEPOSIT
+                    new = self._skip(current, new, sentinel)
+
+                elif new is sentinel or old[0] < new[0]:
+                    if unhealthy is None:
+                        unhealthy = set(self.mount_health.unhealthy()) if self.mount_health else set()
+                        skipped = {os.path.normpath(path) for path in self.skipped}
+
+                    if self._kept(old[0], unhealthy, skipped):
+                        write(old)
+                    else:
+                        self.counts[REMOVED] += 1
+                        yield old[0], REMOVE
+                    old = next(previous, sentinel)
+
+                else:
+                    write(new)
+                    if new == old:
+                        self.counts[UNCHANGED] += 1
+                    else:
+                        self.counts[CHANGED] += 1
+                        yield new[0], DEPOSIT
+
+                    new = self._skip(current, new, sentinel)
+                    old = next(previous, sentinel)
+
+    def commit(self) -> None:
+        """
+        Replace the previous snapshot with the one written by changes
+        """
+        os.replace(self._tmp, self.path)
+        self._tmp = None
+        logger.info('Snapshot {path}: {new} new, {changed} changed, {unchanged} unchanged, '
+                    '{removed} removed'.format(path=self.path, **self.counts))
+
+    def discard(self) -> None:
+        """
+        Remove the new snapshot, keeping the previous one
+        """
+        if self._tmp is not None:
+            try:
+                os.remove(self._tmp)
+            except OSError:
+                pass
+            self._tmp = None
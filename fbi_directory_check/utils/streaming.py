@@ -0,0 +1,97 @@
+# encoding: utf-8
+"""
+Helpers for reconciling sorted streams without holding them in memory.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import heapq
+import pickle
+import tempfile
+from typing import Any, Iterable, Iterator, Tuple
+
+ADD = 'add'
+DELETE = 'delete'
+
+
+def _read_chunk(chunk) -> Iterator:
+    chunk.seek(0)
+    with chunk:
+        while True:
+            try:
+                yield pickle.load(chunk)
+            except EOFError:
+                return
+
+
+def external_sort(iterable: Iterable, chunk_size: int = 100000) -> Iterator:
+    """
+    Sort an iterable holding at most chunk_size items in memory. Larger
+    inputs are written to temporary files in sorted chunks which are then
+    merged.
+
+    :param iterable: Items to sort
+    :param chunk_size: Number of items to sort in memory at once
+    :return: Iterator of sorted items
+    """
+    chunks = []
+    buffer = []
+
+    for item in iterable:
+        buffer.append(item)
+        if len(buffer) >= chunk_size:
+            buffer.sort()
+            chunk = tempfile.TemporaryFile()
+            for value in buffer:
+                pickle.dump(value, chunk, protocol=pickle.HIGHEST_PROTOCOL)
+            chunks.append(chunk)
+            buffer = []
+
+    buffer.sort()
+
+    if not chunks:
+        yield from buffer
+        return
+
+    yield from heapq.merge(buffer, *(_read_chunk(chunk) for chunk in chunks))
+
+
+def merge_diff(live: Iterable, indexed: Iterable) -> Iterator[Tuple[Any, str]]:
+    """
+    Merge-join two sorted streams and yield the items found in only one.
+    Duplicates within either stream are ignored.
+
+    :param live: Sorted items found on the filesystem
+    :param indexed: Sorted items found in the index
+    :return: Iterator of (item, ADD) for items only in live and
+        (item, DELETE) for items only in indexed
+    """
+    sentinel = object()
+    live = iter(live)
+    indexed = iter(indexed)
+
+    left = next(live, sentinel)
+    right = next(indexed, sentinel)
+
+    while left is not sentinel or right is not sentinel:
+        if right is sentinel or (left is not sentinel and left < right):
+            yield left, ADD
+            current = left
+            while left is not sentinel and left == current:
+                left = next(live, sentinel)
+
+        elif left is sentinel or right < left:
+            yield right, DELETE
+            current = right
+            while right is not sentinel and right == current:
+                right = next(indexed, sentinel)
+
+        else:
+            current = left
+            while left is not sentinel and left == current:
+                left = next(live, sentinel)
+            while right is not sentinel and right == current:
+                right = next(indexed, sentinel)
@@ -0,0 +1,163 @@
+# encoding: utf-8
+"""
+Reconcile a whole spot with the indices in one sweep. The tree is walked
+once and every file and directory under it is merge-joined with the
+ceda-fbi and ceda-dirs entries fetched in one pass each, rather than
+queueing every directory to be listed and queried on its own.
+
+The walk sees the tree as the per-directory checks would: links to
+directories are recorded but not descended into, and the entries under
+them, or under a directory which cannot be listed, are left alone.
+Removals are also skipped for directories with a 00FILES_ON_TAPE file.
+"""
+__author__ = 'Daniel Westwood'
+__date__ = '19 Oct 2026'
+__copyright__ = 'Copyright 2026 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'daniel.westwood@stfc.ac.uk'
+
+import logging
+import os
+from typing import Iterable, Iterator, List, Set, Tuple
+
+from fbi_directory_check import logstream
+from fbi_directory_check.utils.constants import README
+from fbi_directory_check.utils.metrics import metrics
+from fbi_directory_check.utils.streaming import (DELETE, external_sort,
+                                                 merge_diff)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logstream)
+logger.propagate = False
+
+# Kinds of entry, sorted with the path
+FILE = 'f'
+DIR = 'd'
+
+FILES_ON_TAPE = '00FILES_ON_TAPE'
+
+
+class SubtreeWalk:
+    """
+    Walk a tree once, yielding (path, kind) for the root and every file
+    and directory below it. What the index entries can be compared with
+    is recorded as the walk goes.
+
+    :param root: Directory to walk
+    :param mtimes: Record the latest modification time of the directories
+    """
+
+    def __init__(self, root: str, mtimes: bool = False) -> None:
+        self.root = os.path.normpath(root)
+        self.mtimes = mtimes
+
+        self.directories = 0
+        self.last_mtime = 0
+        self.readmes: List[str] = []
+        # Directories whose files are not removed
+        self.tape_dirs: Set[str] = set()
+        # Directories whose contents were not seen
+        self.skipped: Set[str] = set()
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        yield self.root, DIR
+
+        stack = [self.root]
+        while stack:
+            top = stack.pop()
+            try:
+                it = os.scandir(top)
+            except OSError as e:
+                logger.warning(f'Could not list {top}: {e}')
+                self.skipped.add(top)
+                continue
+
+            self.directories += 1
+            if self.mtimes:
+                try:
+                    self.last_mtime = max(self.last_mtime, os.stat(top).st_mtime)
+                except OSError:
+                    pass
+
+            with it:
+                while True:
+                    try:
+                        entry = next(it)
+                    except StopIteration:
+                        break
+                    except OSError as e:
+                        # Stale handles and I/O errors part way through a listing
+                        logger.warning(f'Could not list {top}: {e}')
+                        self.skipped.add(top)
+                        break
+
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+
+                    if is_dir:
+                        yield entry.path, DIR
+                        # Links are recorded but not followed, as with os.walk
+                        if entry.is_symlink():
+                            self.skipped.add(entry.path)
+                        else:
+                            stack.append(entry.path)
+                        continue
+
+                    try:
+                        is_file = entry.is_file()
+                    except OSError:
+                        is_file = False
+
+                    if entry.name == README:
+                        self.readmes.append(entry.path)
+
+                    if is_file:
+                        yield entry.path, FILE
+                        if entry.name == FILES_ON_TAPE:
+                            self.tape_dirs.add(top)
+
+    def covers(self, path: str, kind: str) -> bool:
+        """
+        Only valid once the walk has finished.
+
+        :param path: Path of an index entry not found by the walk
+        :param kind: FILE or DIR
+        :return: Whether the entry can be removed
+        """
+        parent = os.path.dirname(path)
+        if kind == FILE and parent in self.tape_dirs:
+            return False
+
+        # Look for a skipped directory between the entry and the root
+        while True:
+            if parent in self.skipped:
+                return False
+            if len(parent) <= len(self.root):
+                return True
+            parent = os.path.dirname(parent)
+
+
+def subtree_diff(walk: SubtreeWalk, indexed: Iterable[Tuple[str, str]],
+                 chunk_size: int = 100000) -> Iterator[Tuple[str, str, str]]:
+    """
+    Merge the sorted walk with the sorted index entries. Both sides are
+    sorted in chunks spilled to disk so memory does not grow with the size
+    of the tree.
+
+    :param walk: SubtreeWalk of the spot
+    :param indexed: (path, kind) of every ceda-fbi and ceda-dirs entry under
+        the spot, in any order
+    :param chunk_size: Number of entries sorted in memory at once
+    :return: Iterator of (path, kind, ADD or DELETE)
+    """
+    live = external_sort(metrics.timed(walk, 'walk'), chunk_size=chunk_size)
+    index = external_sort(indexed, chunk_size=chunk_size)
+
+    # The live side is sorted, so walked in full, before anything is
+    # yielded and the walk can say which deletions it covers
+    for (path, kind), action in merge_diff(live, index):
+        if action == DELETE and not walk.covers(path, kind):
+            continue
+        yield path, kind, action
@@ -8,30 +8,39 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
-import asyncio
 import logging
 import os
+import warnings
 
-from fbi_directory_check import logstream
+from fbi_directory_check import TRACE, logstream
+from fbi_directory_check.utils.mounts import ESACCI_SENTINEL, MountHealth
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logstream)
 logger.propagate = False
 
+# Links to storage are followed by walk_storage_links when they point here
+STORAGE_PREFIX = '/datacentre'
+
 def set_verbose(level: int):
     """
-    Reset the logger basic config.
+    Reset the logger basic config. The highest level, TRACE, logs every
+    file processed.
     """
 
     levels = [
         logging.WARN,
         logging.INFO,
         logging.DEBUG,
+        TRACE,
     ]
 
     if level >= len(levels):
         level = len(levels) - 1
 
+    # Loggers created later inherit the level from the root
+    logging.root.setLevel(levels[level])
+
     for name in logging.root.manager.loggerDict:
         lg = logging.getLogger(name)
         lg.setLevel(levels[level])
@@ -58,19 +67,38 @@ def environ_or_required(key):
         else {'required': True}
     )
 
-def walk_storage_links(path: str, depth: int = 0, max_depth: int = None):
+def walk_storage_links(path: str, depth: int = 0, max_depth: int = None,
+                       storage_prefix: str = STORAGE_PREFIX, mount_health=None, mount: str = None,
+                       prune=None, skipped: set = None):
     """
     Used within the archive to follow links to storage pots but ignore links which are
     back within the archive and could be circular.
     :param path:
     :param depth:
     :param max_depth:
+    :param storage_prefix: Links are only followed when they point under this path
+    :param mount_health: Optional MountHealth consulted before each directory is
+        listed. Directories on mounts known to be hung are skipped.
+    :param mount: Mount key of path, found from the path if not given
+    :param prune: Optional PruneRules. Matching sub-directories are left out
+        of the listing and not walked.
+    :param skipped: Optional set the directories which could not be listed,
+        were on an unhealthy mount or were pruned are added to
     :return:
     """
     top = os.fspath(path)
     dirs = []
     nondirs = []
 
+    if mount_health is not None:
+        if mount is None:
+            mount = mount_health.mount_for(top)
+        if not mount_health.healthy(mount):
+            logger.debug(f'Skipping {top}: mount {mount} is unhealthy')
+            if skipped is not None:
+                skipped.add(top)
+            return
+
     # We may not have read permission for top, in which case we can't
     # get a list of the files the directory contains.  os.walk
     # always suppressed the exception then, rather than blow up for a
@@ -78,7 +106,11 @@ def walk_storage_links(path: str, depth: int = 0, max_depth: int = None):
     # left to visit.  That logic is copied here.
     try:
         scandir_it = os.scandir(top)
-    except OSError:
+    except OSError as error:
+        if mount_health is not None:
+            mount_health.report_error(mount, error)
+        if skipped is not None:
+            skipped.add(top)
         return
 
     if max_depth:
@@ -94,6 +126,10 @@ def walk_storage_links(path: str, depth: int = 0, max_depth: int = None):
                     break
             except OSError as error:
                 logger.error(error)
+                if mount_health is not None:
+                    mount_health.report_error(mount, error)
+                if skipped is not None:
+                    skipped.add(top)
                 return
 
             try:
@@ -108,6 +144,14 @@ def walk_storage_links(path: str, depth: int = 0, max_depth: int = None):
             else:
                 nondirs.append(entry.name)
 
+    if prune is not None:
+        prune = prune.for_directory(top, nondirs)
+        kept = prune.filter(top, dirs)
+        if skipped is not None and len(kept) < len(dirs):
+            walked = set(kept)
+            skipped.update(os.path.join(top, name) for name in dirs if name not in walked)
+        dirs = kept
+
     # Yield before recursion when going top down
     yield top, dirs, nondirs
 
@@ -118,42 +162,32 @@ def walk_storage_links(path: str, depth: int = 0, max_depth: int = None):
         new_path = join(top, dirname)
         if islink(new_path):
             # Only follow links to storage locations
-            if os.readlink(new_path).startswith('/datacentre'):
-                yield from walk_storage_links(new_path, depth, max_depth)
+            target = os.readlink(new_path)
+            if target.startswith(storage_prefix):
+                # The contents are on the mount holding the target
+                new_mount = mount_health.mount_for(target) if mount_health is not None else None
+                yield from walk_storage_links(new_path, depth, max_depth, storage_prefix,
+                                              mount_health, new_mount, prune, skipped)
         else:
             # If the path is not a link, recurse
-            yield from walk_storage_links(new_path, depth, max_depth)
-
-def check_timeout():
-
-    from pathlib import Path
-    from pathlib import _ignore_error as pathlib_ignore_error
-
-    import aiofiles.os as aos
-
-    async def path_exists(path) -> bool:
-        try:
-            await aos.stat(str(path))
-        except OSError as e:
-            if not pathlib_ignore_error(e):
-                raise
-            return ''
-        except ValueError:
-            # Non-encodable path
-            return ''
-        return True
-
-    async def listfile():
-        async with asyncio.timeout(10):
-            await path_exists('/neodc/esacci/esacci_terms_and_conditions.txt')
-    try:
-        status = asyncio.run(listfile())
-    except TimeoutError:
-        logger.error('TIMEOUT: ESACCI Directories inaccessible')
-        return True
-
-    # If we didn't get a timeout error, can now perform a standard check.
-    if not os.path.isfile('/neodc/esacci/esacci_terms_and_conditions.txt'):
-        logger.error('INACCESSIBLE: ESACCI Directories inaccessible')
-        return True
-    return False
\ No newline at end of file
+            new_mount = mount
+            if mount_health is not None and mount_health.is_boundary(new_path):
+                new_mount = new_path
+            yield from walk_storage_links(new_path, depth, max_depth, storage_prefix,
+                                          mount_health, new_mount, prune, skipped)
+
+def check_timeout(sentinel: str = ESACCI_SENTINEL, timeout: float = 10) -> bool:
+    """
+    Check a single sentinel file can be read.
+
+    .. deprecated::
+        Nothing in the package calls this any more. Use MountHealth to
+        check only the mounts a scan depends on.
+
+    :param sentinel: File to read
+    :param timeout: Seconds allowed
+    :return: True if the sentinel could not be read within the timeout
+    """
+    warnings.warn('check_timeout is deprecated, use MountHealth.check', DeprecationWarning, stacklevel=2)
+    health = MountHealth({sentinel: sentinel}, timeout=timeout, ttl=0, mounts=[])
+    return not health.check(sentinel)